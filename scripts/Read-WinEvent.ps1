@@ -1,39 +1,75 @@
-filter Read-WinEvent {
+function Read-WinEvent {
   <#
       .EXAMPLE
       Get-WinEvent -FilterHashTable @{LogName="Security";Id=4625} | Read-WinEvent | Select-Object -Property TimeCreated,Hostname,TargetUserName,LogonType | Format-Table -AutoSize
       TimeCreated          TargetUserName LogonType
       -----------          -------------- ---------
-      9/12/2021 8:23:27 AM Victor         2        
-      9/12/2021 8:23:27 AM Victor         2        
-      9/12/2021 7:49:37 AM Victor         2        
+      9/12/2021 8:23:27 AM Victor         2
+      9/12/2021 8:23:27 AM Victor         2
       9/12/2021 7:49:37 AM Victor         2
+      9/12/2021 7:49:37 AM Victor         2
+      .EXAMPLE
+      Get-WinEvent -FilterHashTable @{LogName="Security";Id=4625} | Read-WinEvent -Field TargetUserName,LogonType
+      Only reads the given EventData fields and the System fields, without parsing the XML of the events.
   #>
-  $WinEvent = [ordered]@{} 
-  $XmlData = [xml]$_.ToXml()
-  $SystemData = $XmlData.Event.System
-  $SystemData | 
-  Get-Member -MemberType Properties | 
-  Select-Object -ExpandProperty Name |
-  ForEach-Object {
-      $Field = $_
-      if ($Field -eq 'TimeCreated') {
-          $WinEvent.$Field = Get-Date -Format 'yyyy-MM-dd HH:mm:ss K' $SystemData[$Field].SystemTime
-      } elseif ($SystemData[$Field].'#text') {
-          $WinEvent.$Field = $SystemData[$Field].'#text'
-      } else {
-          $SystemData[$Field]  | 
-          Get-Member -MemberType Properties | 
-          Select-Object -ExpandProperty Name |
-          ForEach-Object { 
-              $WinEvent.$Field = @{}
-              $WinEvent.$Field.$_ = $SystemData[$Field].$_
-          }
-      }
+  param(
+    [string[]]$Field
+  )
+  begin {
+    if ($PSBoundParameters.ContainsKey('Field')) {
+      $Selector = [System.Diagnostics.Eventing.Reader.EventLogPropertySelector]::new(
+        [string[]]@($Field | ForEach-Object { "Event/EventData/Data[@Name='$_']" })
+      )
+    }
   }
-  $XmlData.Event.EventData.Data |
-  ForEach-Object { 
-      $WinEvent.$($_.Name) = $_.'#text'
+  process {
+    if ($Selector) {
+      $WinEvent = [ordered]@{
+        EventID = [string]$_.Id
+        Version = [string]$_.Version
+        Level = [string]$_.Level
+        Task = [string]$_.Task
+        Opcode = [string]$_.Opcode
+        Keywords = '0x{0:x}' -f $_.Keywords
+        TimeCreated = Get-Date -Format 'yyyy-MM-dd HH:mm:ss K' $_.TimeCreated
+        EventRecordID = [string]$_.RecordId
+        Channel = $_.LogName
+        Computer = $_.MachineName
+      }
+      $Values = $_.GetPropertyValues($Selector)
+      for ($Index = 0; $Index -lt $Field.Count; $Index++) {
+        if ($null -ne $Values[$Index]) {
+          $WinEvent[$Field[$Index]] = [string]$Values[$Index]
+        }
+      }
+      return [PSCustomObject]$WinEvent
+    }
+    $WinEvent = [ordered]@{}
+    $XmlData = [xml]$_.ToXml()
+    $SystemData = $XmlData.Event.System
+    $SystemData |
+    Get-Member -MemberType Properties |
+    Select-Object -ExpandProperty Name |
+    ForEach-Object {
+        $Name = $_
+        if ($Name -eq 'TimeCreated') {
+            $WinEvent.$Name = Get-Date -Format 'yyyy-MM-dd HH:mm:ss K' $SystemData[$Name].SystemTime
+        } elseif ($SystemData[$Name].'#text') {
+            $WinEvent.$Name = $SystemData[$Name].'#text'
+        } else {
+            $SystemData[$Name]  |
+            Get-Member -MemberType Properties |
+            Select-Object -ExpandProperty Name |
+            ForEach-Object {
+                $WinEvent.$Name = @{}
+                $WinEvent.$Name.$_ = $SystemData[$Name].$_
+            }
+        }
+    }
+    $XmlData.Event.EventData.Data |
+    ForEach-Object {
+        $WinEvent.$($_.Name) = $_.'#text'
+    }
+    return New-Object -TypeName PSObject -Property $WinEvent
   }
-  return New-Object -TypeName PSObject -Property $WinEvent
 }
@@ -0,0 +1,274 @@
+"""Benchmarks the conversion stages of the PowerShell backend."""
+
+from argparse import ArgumentParser
+from contextlib import contextmanager
+from importlib.metadata import PackageNotFoundError, version
+from json import dump
+from pathlib import Path
+from platform import python_version
+from random import Random
+from sigma.collection import SigmaCollection
+from sigma.pipelines.powershell import powershell_pipeline
+from sigma.backends.powershell import PowerShellBackend
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Dict, Iterator, List
+import sys
+
+EXIT_SUCCESS = 0
+
+# Log sources and fields used to generate synthetic rules
+LOGSOURCES = [
+    (
+        "category: process_creation",
+        ["Image", "CommandLine", "ParentImage", "User", "IntegrityLevel"],
+    ),
+    (
+        "category: network_connection",
+        ["Image", "DestinationIp", "DestinationPort", "Initiated"],
+    ),
+    ("category: registry_set", ["Image", "TargetObject", "Details"]),
+    (
+        "service: security",
+        ["TargetUserName", "LogonType", "IpAddress", "SubjectUserSid"],
+    ),
+    ("service: system", ["ServiceName", "ImagePath", "ServiceType"]),
+]
+MODIFIERS = ["", "|contains", "|startswith", "|endswith", "|re"]
+CONDITIONS = ["sel", "sel and not filter", "1 of sel*"]
+
+
+def synthetic_rule(index: int, random: Random) -> str:
+    """Generates a Sigma rule with a random log source, detection items and condition."""
+    logsource, fields = random.choice(LOGSOURCES)
+    condition = random.choice(CONDITIONS)
+
+    def detection() -> str:
+        items = list()
+        for field in random.sample(fields, random.randint(1, len(fields) - 1)):
+            modifier = random.choice(MODIFIERS)
+            values = [
+                (
+                    f"'value{random.randrange(1000)}.*'"
+                    if modifier == "|re"
+                    else f"'value{random.randrange(1000)}'"
+                )
+                for _ in range(random.choice([1, 1, 2, 5, 20]))
+            ]
+            items.append(
+                f"        {field}{modifier}:\n"
+                + "".join(f"            - {value}\n" for value in values)
+            )
+        return "".join(items)
+
+    detections = f"    sel:\n{detection()}"
+    if condition == "sel and not filter":
+        detections += f"    filter:\n{detection()}"
+    elif condition == "1 of sel*":
+        detections += f"    sel2:\n{detection()}"
+    return f"""title: Synthetic rule {index}
+id: 00000000-0000-0000-0000-{index:012}
+status: test
+logsource:
+    product: windows
+    {logsource}
+detection:
+{detections}    condition: {condition}
+"""
+
+
+def write_synthetic_ruleset(path: Path, size: int, seed: int) -> None:
+    random = Random(seed)
+    for index in range(size):
+        (path / f"rule_{index}.yml").write_text(synthetic_rule(index, random))
+
+
+class StageTimer:
+    """Accumulates the time spent in methods of the backend and the processing pipeline."""
+
+    def __init__(self):
+        self.times: Dict[str, float] = dict()
+
+    @contextmanager
+    def measure(self, stage: str) -> Iterator[None]:
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.times[stage] = self.times.get(stage, 0.0) + perf_counter() - start
+
+    @contextmanager
+    def wrap(self, obj: object, method: str, stage: str) -> Iterator[None]:
+        """Measures calls of obj.method. Recursive calls are only measured once."""
+        original = getattr(obj, method)
+        depth = 0
+
+        def timed(*args, **kwargs):
+            nonlocal depth
+            if depth:
+                return original(*args, **kwargs)
+            depth += 1
+            try:
+                with self.measure(stage):
+                    return original(*args, **kwargs)
+            finally:
+                depth -= 1
+
+        setattr(obj, method, timed)
+        try:
+            yield
+        finally:
+            delattr(obj, method)
+
+
+def benchmark(name: str, inputs: List[Path], output: str) -> dict:
+    """Converts a ruleset and returns the time spent in each conversion stage."""
+    timer = StageTimer()
+    with timer.measure("load"):
+        rule_collection = SigmaCollection.load_ruleset(inputs=inputs)
+
+    backend = PowerShellBackend(
+        processing_pipeline=powershell_pipeline(), collect_errors=True
+    )
+    pipeline = (
+        backend.backend_processing_pipeline
+        + backend.processing_pipeline
+        + backend.output_format_processing_pipeline[output]
+    )
+    items = {
+        f"{index}:{item.identifier or type(item.transformation).__name__}": item
+        for index, item in enumerate(pipeline.items)
+    }
+    postprocessing_items = {
+        f"{index}:{item.identifier or type(item.transformation).__name__}": item
+        for index, item in enumerate(pipeline.postprocessing_items)
+    }
+    # finalize_query dispatches to the format specific method, which not every output format
+    # (e.g. evtx) defines.
+    with timer.wrap(backend, "convert_condition", "conversion"), timer.wrap(
+        backend, "finalize_query", "finalization"
+    ), timer.wrap(backend, "finalize", "output"):
+        wrappers = [
+            timer.wrap(item, "apply", "pipeline/" + name)
+            for name, item in items.items()
+        ] + [
+            timer.wrap(item, "apply", "postprocessing/" + name)
+            for name, item in postprocessing_items.items()
+        ]
+        for wrapper in wrappers:
+            wrapper.__enter__()
+        try:
+            with timer.measure("total"):
+                backend.convert(rule_collection, output_format=output)
+        finally:
+            for wrapper in wrappers:
+                wrapper.__exit__(None, None, None)
+
+    times = timer.times
+    return {
+        "ruleset": name,
+        "rules": len(rule_collection.rules),
+        "errors": len(backend.errors),
+        "stages": {
+            "load": times.get("load", 0.0),
+            "pipeline": sum(times.get("pipeline/" + name, 0.0) for name in items),
+            "conversion": times.get("conversion", 0.0),
+            "finalization": times.get("finalization", 0.0),
+            "postprocessing": sum(
+                times.get("postprocessing/" + name, 0.0)
+                for name in postprocessing_items
+            ),
+            "output": times.get("output", 0.0),
+            "total": times.get("load", 0.0) + times.get("total", 0.0),
+        },
+        "pipeline_items": {name: times.get("pipeline/" + name, 0.0) for name in items},
+        "postprocessing_items": {
+            name: times.get("postprocessing/" + name, 0.0)
+            for name in postprocessing_items
+        },
+    }
+
+
+def print_result(result: dict) -> None:
+    print(f"{result['ruleset']} ({result['rules']} rules, {result['errors']} errors)")
+    for stage, seconds in result["stages"].items():
+        print(f"  {stage:<16}{seconds:10.3f} s")
+    for name, seconds in result["pipeline_items"].items():
+        print(f"    {name:<44}{seconds:10.3f} s")
+
+
+def main() -> int:
+    """Benchmarks the conversion stages of the PowerShell backend."""
+    parser = ArgumentParser()
+    parser.add_argument(
+        "-r",
+        "--rules",
+        type=str,
+        action="append",
+        default=[],
+        help="path to Sigma rule(s), e.g. rules/ or the rules fetched by get_sigma_rules.py",
+        metavar="<PATH_TO_RULESET>",
+    )
+    parser.add_argument(
+        "-s",
+        "--synthetic",
+        type=int,
+        action="append",
+        default=[],
+        help="number of rules of a generated ruleset, e.g. 1000, 10000 or 50000",
+        metavar="<N>",
+    )
+    parser.add_argument(
+        "--seed", type=int, default=0, help="seed of the generated rulesets"
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        default="default",
+        type=str,
+        choices=list(PowerShellBackend.formats),
+        help="output format",
+    )
+    parser.add_argument(
+        "-j",
+        "--json",
+        type=str,
+        help="write results to a JSON file",
+        metavar="<PATH_TO_RESULTS>",
+    )
+    args = parser.parse_args()
+
+    results = list()
+    for rules in args.rules:
+        results.append(benchmark(rules, [Path(rules)], args.output))
+        print_result(results[-1])
+    for size in args.synthetic:
+        with TemporaryDirectory() as directory:
+            write_synthetic_ruleset(Path(directory), size, args.seed)
+            results.append(
+                benchmark(f"synthetic-{size}", [Path(directory)], args.output)
+            )
+        print_result(results[-1])
+
+    if args.json is not None:
+        try:
+            backend_version = version("pySigma-backend-powershell")
+        except PackageNotFoundError:
+            backend_version = None
+        with open(args.json, "w") as results_file:
+            dump(
+                {
+                    "python": python_version(),
+                    "pysigma": version("pysigma"),
+                    "backend": backend_version,
+                    "output": args.output,
+                    "results": results,
+                },
+                results_file,
+                indent=2,
+            )
+    return EXIT_SUCCESS
+
+
+if __name__ == "__main__":
+    sys.exit(main())
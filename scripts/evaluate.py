@@ -0,0 +1,94 @@
+"""Evaluates Sigma rules against events exported from EVTX files."""
+
+from argparse import ArgumentParser
+from json import dump
+from sigma.collection import SigmaCollection
+from sigma.pipelines.powershell import powershell_pipeline
+from sigma.backends.powershell import EventTable, PowerShellBackend, RuleEvaluator
+import sys
+
+EXIT_SUCCESS = 0
+
+
+def main() -> int:
+    """Evaluates Sigma rules against events exported from EVTX files."""
+    parser = ArgumentParser()
+    parser.add_argument(
+        "-r",
+        "--rules",
+        type=str,
+        required=True,
+        help="path to Sigma rule(s)",
+        metavar="<PATH_TO_RULESET>",
+    )
+    parser.add_argument(
+        "-d",
+        "--events",
+        type=str,
+        action="append",
+        required=True,
+        help="path to events exported from EVTX files to JSON, JSON lines or XML, e.g. the dataset fetched by get_dataset.py after exporting it",
+        metavar="<PATH_TO_EVENTS>",
+    )
+    parser.add_argument(
+        "-j",
+        "--json",
+        type=str,
+        help="write match counts and predicate selectivities to a JSON file",
+        metavar="<PATH_TO_RESULTS>",
+    )
+    args = parser.parse_args()
+
+    events = EventTable.from_paths(args.events)
+    backend = PowerShellBackend(
+        processing_pipeline=powershell_pipeline(), collect_errors=True
+    )
+    evaluator = RuleEvaluator(backend, events)
+    evaluations = evaluator.evaluate(SigmaCollection.load_ruleset(inputs=[args.rules]))
+    for evaluation in sorted(evaluations, key=lambda evaluation: -evaluation.matches):
+        print(
+            f"{evaluation.matches:>8} / {evaluation.events:<8} {evaluation.rule.title}"
+        )
+    for rule, error in evaluator.errors:
+        print(f"error: {rule.title}: {error}")
+
+    if args.json is not None:
+        with open(args.json, "w") as results_file:
+            dump(
+                {
+                    "events": events.size,
+                    "rules": [
+                        {
+                            "id": (
+                                str(evaluation.rule.id)
+                                if evaluation.rule.id is not None
+                                else None
+                            ),
+                            "title": evaluation.rule.title,
+                            "channel": evaluation.channel,
+                            "events": evaluation.events,
+                            "matches": evaluation.matches,
+                            "predicates": [
+                                {
+                                    "predicate": predicate.predicate,
+                                    "matches": predicate.matches,
+                                    "selectivity": predicate.selectivity,
+                                }
+                                for predicate in evaluation.predicates
+                            ],
+                        }
+                        for evaluation in evaluations
+                    ],
+                    "errors": [
+                        {"title": rule.title, "error": str(error)}
+                        for rule, error in evaluator.errors
+                    ],
+                },
+                results_file,
+                indent=2,
+            )
+    return EXIT_SUCCESS
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,55 @@
+"""Builds the manifest of EVTX files scanned in parallel by the evtx output format."""
+
+from argparse import ArgumentParser
+from os import cpu_count
+from sigma.backends.powershell.manifest import (
+    build_manifest,
+    worker_loads,
+    write_manifest,
+)
+import sys
+
+EXIT_SUCCESS = 0
+
+
+def main() -> int:
+    """Builds the manifest of EVTX files scanned in parallel by the evtx output format."""
+    parser = ArgumentParser()
+    parser.add_argument(
+        "-d",
+        "--evtx",
+        type=str,
+        action="append",
+        required=True,
+        help="path to EVTX file(s) or directories containing them",
+        metavar="<PATH_TO_EVTX>",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=cpu_count(),
+        help="number of files scanned in parallel (-ThrottleLimit of the script)",
+        metavar="<N>",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        default="manifest.csv",
+        help="manifest file passed to the script with -Manifest",
+        metavar="<PATH_TO_MANIFEST>",
+    )
+    args = parser.parse_args()
+
+    tasks = build_manifest(args.evtx, args.workers)
+    write_manifest(tasks, args.output)
+    loads = worker_loads(tasks, args.workers)
+    print(
+        f"{len(tasks)} tasks, largest worker load {loads[0] / 2**20:.1f} MiB, smallest {loads[-1] / 2**20:.1f} MiB"
+    )
+    return EXIT_SUCCESS
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,25 +1,310 @@
 from argparse import ArgumentParser
+from contextlib import nullcontext
+from json import dump, dumps
+from pathlib import Path
 from sigma.collection import SigmaCollection
+from sigma.correlations import SigmaCorrelationRule
 from sigma.pipelines.powershell import powershell_pipeline
 from sigma.backends.powershell import PowerShellBackend
+from sigma.backends.powershell.references import group_content, rule_file_groups
+import sys
+from typing import List, Optional, Tuple
 
+# Modules that are only needed by some options (e.g., multiprocessing for --jobs, sqlite3 for
+# --cache) are imported when the option is used, so that converting a single rule starts fast.
 
-def Sigma2PowerShell(path: str, output: str, show_errors: bool):
-    rule_collection = SigmaCollection.load_ruleset(inputs=[path])
+# Backend of a worker process, built once by init_worker and reused for all rule files of the worker.
+worker_backend = None
+
+
+def init_worker(show_errors: bool, backend_options: dict):
+    global worker_backend
+    worker_backend = PowerShellBackend(
+        processing_pipeline=powershell_pipeline(),
+        collect_errors=show_errors,
+        **backend_options,
+    )
+
+
+def convert_rule_group(paths: List[Path], output: str):
+    """Converts the rules of a group of rule files in a worker process."""
+    worker_backend.errors.clear()
+    return worker_backend.convert_rule_files(paths, output)
+
+
+def convert_rule_files(
+    backend: PowerShellBackend,
+    groups: List[List[Path]],
+    output: str,
+    show_errors: bool,
+    jobs: int,
+):
+    """Yields the queries and errors of each rule file in the order of the groups of rule files
+    that reference each other (see rule_file_groups). The queries aren't finalized into the
+    output format, as formats like script combine the queries of all rules.
+    """
+    if jobs <= 1:
+        for group in groups:
+            yield from backend.convert_rule_files(group, output)
+        return
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(
+        max_workers=jobs,
+        initializer=init_worker,
+        initargs=(show_errors, dict(backend.backend_options)),
+    ) as executor:
+        # map() returns the results in the order of the rule files, regardless of the order in
+        # which the workers finish them.
+        for results in executor.map(
+            convert_rule_group,
+            groups,
+            [output] * len(groups),
+            chunksize=max(1, len(groups) // (jobs * 4)),
+        ):
+            yield from results
+
+
+def Sigma2PowerShell(
+    path: Optional[str],
+    output: str,
+    show_errors: bool,
+    jobs: int = 1,
+    cache: Optional[str] = None,
+    backend_options: Optional[dict] = None,
+    snapshot: Optional[str] = None,
+    write_snapshot: Optional[str] = None,
+):
+    backend, queries = convert_queries(
+        path,
+        output,
+        show_errors,
+        jobs,
+        cache,
+        backend_options,
+        snapshot,
+        write_snapshot,
+    )
+    return backend.finalize_converted(queries, output)
+
+
+def convert_queries(
+    path: Optional[str],
+    output: str,
+    show_errors: bool,
+    jobs: int = 1,
+    cache: Optional[str] = None,
+    backend_options: Optional[dict] = None,
+    snapshot: Optional[str] = None,
+    write_snapshot: Optional[str] = None,
+) -> Tuple[PowerShellBackend, list]:
+    """Converts the rules below path or of a snapshot and returns the backend and the queries,
+    which aren't finalized into the output format yet. With write_snapshot, the rules are
+    converted from the snapshot written to this file."""
     pipeline = powershell_pipeline()
     backend = PowerShellBackend(
-        processing_pipeline=pipeline, collect_errors=show_errors
+        processing_pipeline=pipeline,
+        collect_errors=show_errors,
+        **(backend_options or {}),
+    )
+    if snapshot is not None or write_snapshot is not None:
+        from sigma.backends.powershell import RuleSnapshot
+
+        if snapshot is not None:
+            rule_snapshot = RuleSnapshot.load(snapshot, backend)
+        else:
+            rule_snapshot = RuleSnapshot.from_ruleset(backend, [path])
+            rule_snapshot.save(write_snapshot)
+        return backend, backend.convert_snapshot_queries(rule_snapshot, output)
+    if jobs <= 1 and cache is None:
+        rule_collection = SigmaCollection.load_ruleset(inputs=[path])
+        return backend, backend.convert_collection(rule_collection, output)
+
+    # Correlation rules can reference rules of other files, so these files are converted and
+    # cached together.
+    paths = list(SigmaCollection.resolve_paths([path]))
+    contents = {path: path.read_bytes() for path in paths}
+    groups = rule_file_groups(paths, list(contents.values()))
+    results = {path: None for path in paths}
+    if cache is not None:
+        from sigma.backends.powershell import ConversionCache
+
+        conversion_cache = ConversionCache(cache, backend, output)
+        keys = {
+            path: group_content(path, group, contents)
+            for group in groups
+            for path in group
+        }
+        results = {path: conversion_cache.get(keys[path]) for path in paths}
+    misses = [group for group in groups if any(results[path] is None for path in group)]
+    for path, result in zip(
+        (path for group in misses for path in group),
+        convert_rule_files(backend, misses, output, show_errors, jobs),
+    ):
+        results[path] = result
+        if cache is not None:
+            conversion_cache.put(keys[path], *result)
+    if cache is not None:
+        conversion_cache.close()
+
+    backend.errors = [
+        error for _, file_errors in results.values() for error in file_errors
+    ]
+    return backend, [
+        query for file_queries, _ in results.values() for query in file_queries
+    ]
+
+
+def Sigma2PowerShellStream(
+    path: str,
+    output: str,
+    show_errors: bool,
+    backend_options: Optional[dict] = None,
+):
+    """Yields a record for each query as soon as its rule is converted. Rule files are loaded one
+    at a time, so memory usage doesn't grow with the size of the ruleset."""
+    pipeline = powershell_pipeline()
+    backend = PowerShellBackend(
+        processing_pipeline=pipeline,
+        collect_errors=show_errors,
+        **(backend_options or {}),
+    )
+    # Files with correlation rules are loaded together with the files of the rules they reference
+    for group in rule_file_groups(list(SigmaCollection.resolve_paths([path]))):
+        rule_collection = SigmaCollection.load_ruleset(inputs=group)
+        backend.resolve_rule_references(rule_collection)
+        for rule in rule_collection.rules:
+            correlation = isinstance(rule, SigmaCorrelationRule)
+            queries = (
+                backend.convert_correlation_rule(rule, output)
+                if correlation
+                else backend.convert_rule(rule, output)
+            )
+            record = {
+                "id": str(rule.id) if rule.id is not None else None,
+                "title": rule.title,
+                "logname": None if correlation else rule.logsource.service,
+            }
+            for index, query in enumerate(queries):
+                yield {
+                    **record,
+                    "eventids": (
+                        None if correlation else backend.rule_eventids(rule, index)
+                    ),
+                    "query": query,
+                    "error": None,
+                }
+            for _, error in backend.errors:
+                yield {**record, "eventids": None, "query": None, "error": str(error)}
+            backend.errors.clear()
+
+
+def Sigma2PowerShellShards(
+    path: Optional[str],
+    show_errors: bool,
+    shards: int,
+    directory: str,
+    channel_weights: Optional[str] = None,
+    jobs: int = 1,
+    cache: Optional[str] = None,
+    backend_options: Optional[dict] = None,
+    snapshot: Optional[str] = None,
+    write_snapshot: Optional[str] = None,
+):
+    """Writes the script output split into shards with similar estimated cost per event."""
+    from sigma.backends.powershell.sharding import (
+        build_shards,
+        read_channel_weights,
+        write_shards,
+    )
+
+    backend, queries = convert_queries(
+        path,
+        "script",
+        show_errors,
+        jobs,
+        cache,
+        backend_options,
+        snapshot,
+        write_snapshot,
+    )
+    weights = read_channel_weights(channel_weights) if channel_weights else {}
+    result = build_shards(queries, shards, weights)
+    for shard, script in zip(result, write_shards(backend, result, directory, weights)):
+        print(
+            f"{script}: {len(shard.queries)} rules, {len(shard.channels)} channels, cost {shard.cost:.1f}"
+        )
+
+
+def serve(argv: List[str]):
+    """Runs a conversion server with warm backends until it is interrupted."""
+    parser = ArgumentParser(prog="sigma2powershell serve")
+    parser.add_argument(
+        "--host", default="127.0.0.1", type=str, help="address to listen on"
+    )
+    parser.add_argument("--port", default=8080, type=int, help="port to listen on")
+    parser.add_argument(
+        "--socket",
+        type=str,
+        help="listen on a Unix socket instead of a TCP port",
+        metavar="<PATH_TO_SOCKET>",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=4,
+        help="number of backends converting requests concurrently",
+        metavar="<N>",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        default="default",
+        type=str,
+        choices=list(PowerShellBackend.formats),
+        help="default output format",
     )
-    return backend.convert(rule_collection)
+    parser.add_argument(
+        "-r",
+        "--rules",
+        type=str,
+        help="rules directory that is converted at startup and reconverted when files change",
+        metavar="<PATH_TO_RULESET>",
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=2.0,
+        help="seconds between checks of the rules directory for changes",
+    )
+    args = parser.parse_args(argv)
+    from sigma.backends.powershell import ConversionServer
+
+    with ConversionServer(
+        host=args.host,
+        port=args.port,
+        socket=args.socket,
+        workers=args.workers,
+        output_format=args.output,
+        rules=args.rules,
+        interval=args.interval,
+    ) as server:
+        print(f"listening on {server.address}", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
 
 
 def main():
+    if sys.argv[1:2] == ["serve"]:
+        return serve(sys.argv[2:])
     parser = ArgumentParser()
     parser.add_argument(
         "-r",
         "--rules",
         type=str,
-        required=True,
         help="path to Sigma rule(s)",
         metavar="<PATH_TO_RULESET>",
     )
@@ -28,7 +313,7 @@ def main():
         "--output",
         default="default",
         type=str,
-        choices=["default", "script"],
+        choices=list(PowerShellBackend.formats),
         help="output format",
     )
     parser.add_argument(
@@ -38,5 +323,149 @@ def main():
         default=True,
         help="show rule errors",
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of worker processes converting rule files in parallel",
+        metavar="<N>",
+    )
+    parser.add_argument(
+        "-c",
+        "--cache",
+        type=str,
+        help="cache file that stores converted rule files, so that only changed files are converted again",
+        metavar="<PATH_TO_CACHE>",
+    )
+    parser.add_argument(
+        "-s",
+        "--snapshot",
+        type=str,
+        help="convert the rules of a snapshot written with --write-snapshot instead of --rules, without parsing and processing them again",
+        metavar="<PATH_TO_SNAPSHOT>",
+    )
+    parser.add_argument(
+        "--write-snapshot",
+        type=str,
+        help="write the rules processed by the pipeline to a snapshot file, which later runs convert with --snapshot",
+        metavar="<PATH_TO_SNAPSHOT>",
+    )
+    parser.add_argument(
+        "--jsonl",
+        action="store_true",
+        help="write one JSON object per query as soon as its rule is converted",
+    )
+    parser.add_argument(
+        "--time-window",
+        type=int,
+        help="only read events written in the last N seconds",
+        metavar="<N>",
+    )
+    parser.add_argument(
+        "--bookmarks",
+        type=str,
+        help="directory where the script output stores the last EventRecordID read from each channel, so that each run only reads new events",
+        metavar="<PATH_TO_BOOKMARKS>",
+    )
+    parser.add_argument(
+        "--shards",
+        type=int,
+        help="split the script output into N scripts with similar estimated cost per event, written with their manifests to --shard-directory",
+        metavar="<N>",
+    )
+    parser.add_argument(
+        "--shard-directory",
+        type=str,
+        default="shards",
+        help="directory of the scripts and manifests written by --shards",
+        metavar="<PATH_TO_SHARDS>",
+    )
+    parser.add_argument(
+        "--channel-weights",
+        type=str,
+        help="JSON file mapping channels to their relative event volume, used by --shards",
+        metavar="<PATH_TO_WEIGHTS>",
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="-",
+        type=str,
+        help="print the time spent in each processing item, backend method and the slowest rules to stderr, or write it to a JSON file",
+        metavar="<PATH_TO_PROFILE>",
+    )
     args = parser.parse_args()
-    print(Sigma2PowerShell(args.rules, args.output, args.show_rule_errors))
+    if (args.rules is None) == (args.snapshot is None):
+        parser.error("either --rules or --snapshot is required")
+    if args.write_snapshot is not None and args.rules is None:
+        parser.error("--write-snapshot requires --rules")
+    if (args.snapshot is not None or args.write_snapshot is not None) and (
+        args.jsonl or args.jobs > 1 or args.cache is not None
+    ):
+        parser.error(
+            "--snapshot and --write-snapshot can't be combined with --jsonl, --jobs or --cache"
+        )
+    if args.jsonl and (
+        args.output in ("script", "evtx") or args.jobs > 1 or args.cache is not None
+    ):
+        parser.error(
+            "--jsonl can't be combined with script or evtx output, --jobs or --cache"
+        )
+    if args.profile is not None and args.jobs > 1:
+        parser.error("--profile can't be combined with --jobs")
+    if args.bookmarks is not None and args.output != "script":
+        parser.error("--bookmarks requires script output")
+    if args.shards is not None and (args.output != "script" or args.shards < 1):
+        parser.error("--shards requires script output and at least one shard")
+    backend_options = {
+        name: value
+        for name, value in (
+            ("time_window", args.time_window),
+            ("bookmarks", args.bookmarks),
+        )
+        if value is not None
+    }
+
+    profiler = None
+    if args.profile is not None:
+        from sigma.backends.powershell import ConversionProfiler
+
+        profiler = ConversionProfiler()
+    with profiler or nullcontext():
+        if args.jsonl:
+            for record in Sigma2PowerShellStream(
+                args.rules, args.output, args.show_rule_errors, backend_options
+            ):
+                print(dumps(record), flush=True)
+        elif args.shards is not None:
+            Sigma2PowerShellShards(
+                args.rules,
+                args.show_rule_errors,
+                args.shards,
+                args.shard_directory,
+                args.channel_weights,
+                args.jobs,
+                args.cache,
+                backend_options,
+                args.snapshot,
+                args.write_snapshot,
+            )
+        else:
+            print(
+                Sigma2PowerShell(
+                    args.rules,
+                    args.output,
+                    args.show_rule_errors,
+                    args.jobs,
+                    args.cache,
+                    backend_options,
+                    args.snapshot,
+                    args.write_snapshot,
+                )
+            )
+    if args.profile == "-":
+        print(profiler.table(), file=sys.stderr)
+    elif args.profile is not None:
+        with open(args.profile, "w") as profile_file:
+            dump(profiler.to_dict(), profile_file, indent=2)
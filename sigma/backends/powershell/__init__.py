@@ -1,4 +1,24 @@
+from importlib import import_module
 from .powershell import PowerShellBackend
+from .correlation import CorrelationWindow
+
+# Classes of modules that aren't needed for conversions are imported on first access, so that
+# importing the backend stays fast.
+lazy_imports = {
+    "ConversionCache": ".cache",
+    "EventTable": ".evaluation",
+    "RuleEvaluator": ".evaluation",
+    "ConversionProfiler": ".profiling",
+    "ConversionServer": ".server",
+    "RuleSnapshot": ".snapshot",
+}
+
+
+def __getattr__(name: str):
+    if name in lazy_imports:
+        return getattr(import_module(lazy_imports[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 # TODO: add all backend classes that should be exposed to the user of your backend in the import statement above.
 
@@ -0,0 +1,141 @@
+from hashlib import sha256
+from inspect import getsource
+from pathlib import Path
+from sigma.collection import SigmaCollection
+from sigma.exceptions import SigmaError
+from sigma.rule import SigmaRule
+from sys import modules
+from time import time_ns
+from typing import Any, Iterable, List, Optional, Pattern, Tuple, Union
+from .powershell import PowerShellBackend
+from .references import group_content, rule_file_groups
+import pickle
+import sqlite3
+
+
+class ConversionCache:
+    """
+    Persistent cache of converted rule files. Entries are keyed by the content of a rule file, of
+    the files it is converted together with (see references.rule_file_groups) and a fingerprint
+    of the backend configuration, which covers the processing pipeline items, the class-level
+    tokens and options of the backend, the output format and the source of the modules
+    implementing them. Changing any of these invalidates all entries. If the cache grows
+    beyond max_entries, the least recently used entries are evicted.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        backend: PowerShellBackend,
+        output_format: str = "default",
+        max_entries: int = 10000,
+    ):
+        self.backend = backend
+        self.output_format = output_format
+        self.max_entries = max_entries
+        self.fingerprint = self.backend_fingerprint(backend, output_format)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, result BLOB, last_used INTEGER)"
+        )
+
+    def __enter__(self) -> "ConversionCache":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.evict()
+        self.connection.commit()
+        self.connection.close()
+
+    @staticmethod
+    def backend_fingerprint(backend: PowerShellBackend, output_format: str) -> str:
+        """Hash everything besides the rule itself that has an effect on the conversion result."""
+        fingerprint = sha256()
+        from importlib.metadata import version  # slow to import and only needed here
+
+        fingerprint.update(version("pysigma").encode())
+        fingerprint.update(output_format.encode())
+        fingerprint.update(repr(sorted(backend.backend_options.items())).encode())
+        pipeline = (
+            backend.backend_processing_pipeline
+            + backend.processing_pipeline
+            + backend.output_format_processing_pipeline[output_format]
+        )
+        fingerprint.update(repr(pipeline.items).encode())
+        fingerprint.update(repr(pipeline.postprocessing_items).encode())
+        fingerprint.update(repr(pipeline.finalizers).encode())
+        for cls in type(backend).__mro__:
+            for name, value in sorted(vars(cls).items()):
+                if isinstance(value, (str, bool, int, tuple, dict, Pattern)):
+                    fingerprint.update(f"{name}={value!r}".encode())
+        module_names = {type(backend).__module__} | {
+            type(item.transformation).__module__ for item in pipeline.items
+        }
+        for module_name in sorted(module_names):
+            fingerprint.update(getsource(modules[module_name]).encode())
+        return fingerprint.hexdigest()
+
+    def key(self, content: bytes) -> str:
+        return sha256(self.fingerprint.encode() + content).hexdigest()
+
+    def get(
+        self, content: bytes
+    ) -> Optional[Tuple[List[Any], List[Tuple[SigmaRule, SigmaError]]]]:
+        """Return the queries and errors of a rule file or None if it isn't cached."""
+        key = self.key(content)
+        row = self.connection.execute(
+            "SELECT result FROM entries WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        self.connection.execute(
+            "UPDATE entries SET last_used = ? WHERE key = ?", (time_ns(), key)
+        )
+        return pickle.loads(row[0])
+
+    def put(
+        self,
+        content: bytes,
+        queries: List[Any],
+        errors: List[Tuple[SigmaRule, SigmaError]],
+    ) -> None:
+        """Store the queries and errors of a rule file."""
+        self.connection.execute(
+            "INSERT OR REPLACE INTO entries VALUES (?, ?, ?)",
+            (self.key(content), pickle.dumps((queries, errors)), time_ns()),
+        )
+
+    def evict(self) -> None:
+        """Delete the least recently used entries exceeding the size limit of the cache."""
+        self.connection.execute(
+            "DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def convert(self, inputs: Iterable[Union[str, Path]]) -> Any:
+        """Convert rule files and directories like PowerShellBackend.convert, but serve unchanged
+        rule files from the cache. Files with correlation rules are converted together with the
+        files of the rules they reference, and their entries are keyed by the content of all of
+        them, so that they're converted again if a referenced rule changes."""
+        paths = list(SigmaCollection.resolve_paths(list(inputs)))
+        contents = {path: path.read_bytes() for path in paths}
+        queries = list()
+        for group in rule_file_groups(paths, list(contents.values())):
+            keys = [group_content(path, group, contents) for path in group]
+            results = [self.get(key) for key in keys]
+            if any(result is None for result in results):
+                results = self.backend.convert_rule_files(group, self.output_format)
+                for key, result in zip(keys, results):
+                    self.put(key, *result)
+            else:
+                for _, file_errors in results:
+                    self.backend.errors.extend(file_errors)
+            queries.extend(
+                query for file_queries, _ in results for query in file_queries
+            )
+        self.evict()
+        self.connection.commit()
+        return self.backend.finalize_converted(queries, self.output_format)
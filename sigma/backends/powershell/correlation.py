@@ -0,0 +1,110 @@
+from collections import deque
+from dataclasses import dataclass, field
+from sigma.correlations import SigmaCorrelationRule, SigmaCorrelationType
+from typing import Deque, Dict, Iterable, Iterator, Optional, Tuple
+import operator
+
+# Comparison of the count of a group with the threshold, by the name of the condition operator
+correlation_operators = {
+    "gt": operator.gt,
+    "gte": operator.ge,
+    "lt": operator.lt,
+    "lte": operator.le,
+    "eq": operator.eq,
+}
+
+
+@dataclass
+class CorrelationGroup:
+    """Events of one group-by key within the timespan of a CorrelationWindow."""
+
+    events: int = 0
+    counts: Dict[str, int] = field(default_factory=dict)
+    alerted: bool = False
+
+
+class CorrelationWindow:
+    """
+    Reference implementation of the sliding window that the PowerShell backend emits for
+    correlation rules (see PowerShellBackend.correlation_helper_definition). Events have to be
+    added in chronological order. The window keeps the events of the last timespan seconds in one
+    queue and a counter per group-by key and value, so memory is proportional to the events and
+    keys within the timespan rather than to all events. Keys and values are compared
+    case-insensitively like the keys of PowerShell hashtables.
+
+    After an event was added, the count of its group (the number of events, or the number of
+    distinct values if distinct is set) is compared with the threshold. add() returns the count
+    when the comparison becomes true for the group, so that each crossing is alerted once, as soon
+    as it happens.
+    """
+
+    def __init__(
+        self,
+        timespan: int,
+        operator: str,
+        threshold: int,
+        distinct: bool = False,
+    ):
+        self.timespan = timespan
+        self.operator = operator
+        self.threshold = threshold
+        self.distinct = distinct
+        self.compare = correlation_operators[operator]
+        self.queue: Deque[Tuple[int, str, str]] = deque()
+        self.groups: Dict[str, CorrelationGroup] = dict()
+
+    @classmethod
+    def from_correlation_rule(cls, rule: SigmaCorrelationRule) -> "CorrelationWindow":
+        """Window of an event_count, value_count or temporal correlation rule. Temporal rules
+        count the distinct referenced rules matched within the timespan, by default all of
+        them have to match."""
+        condition = rule.condition
+        if condition is None:  # Temporal rules without condition
+            return cls(rule.timespan.seconds, "gte", len(rule.rules), True)
+        return cls(
+            rule.timespan.seconds,
+            condition.op.name.lower(),
+            condition.count,
+            rule.type != SigmaCorrelationType.EVENT_COUNT,
+        )
+
+    def add(self, time: int, key: str = "", value: str = "") -> Optional[int]:
+        """Add an event of a group at time (in seconds) and return the count of the group if the
+        condition became true, otherwise None."""
+        while self.queue and self.queue[0][0] < time - self.timespan:
+            _, old_key, old_value = self.queue.popleft()
+            group = self.groups[old_key]
+            group.events -= 1
+            group.counts[old_value] -= 1
+            if group.counts[old_value] == 0:
+                del group.counts[old_value]
+            if group.events == 0:
+                del self.groups[old_key]
+
+        key = key.lower()
+        value = value.lower()
+        group = self.groups.setdefault(key, CorrelationGroup())
+        self.queue.append((time, key, value))
+        group.events += 1
+        group.counts[value] = group.counts.get(value, 0) + 1
+
+        count = len(group.counts) if self.distinct else group.events
+        if not self.compare(count, self.threshold):
+            group.alerted = False
+        elif not group.alerted:
+            group.alerted = True
+            return count
+        return None
+
+    def alerts(
+        self, events: Iterable[Tuple[int, str, str]]
+    ) -> Iterator[Tuple[int, str, int]]:
+        """Add (time, key, value) events and yield the time, key and count of each alert."""
+        for time, key, value in events:
+            count = self.add(time, key, value)
+            if count is not None:
+                yield time, key, count
+
+    def __len__(self) -> int:
+        """Number of events within the timespan."""
+        return len(self.queue)
@@ -0,0 +1,412 @@
+from collections import defaultdict
+from dataclasses import dataclass, field
+from ipaddress import ip_address
+from itertools import chain
+from pathlib import Path
+from sigma.collection import SigmaCollection
+from sigma.conditions import (
+    ConditionAND,
+    ConditionFieldEqualsValueExpression,
+    ConditionItem,
+    ConditionNOT,
+    ConditionOR,
+    ConditionValueExpression,
+)
+from sigma.conversion.state import ConversionState
+from sigma.exceptions import SigmaError, SigmaValueError
+from sigma.rule import SigmaRule
+from sigma.types import (
+    SigmaBool,
+    SigmaCIDRExpression,
+    SigmaCompareExpression,
+    SigmaExists,
+    SigmaExpansion,
+    SigmaNull,
+    SigmaNumber,
+    SigmaRegularExpression,
+    SigmaString,
+    SigmaType,
+)
+from json import loads
+from xml.etree.ElementTree import Element, XMLPullParser
+import operator
+import re
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from .powershell import PowerShellBackend
+
+Event = Dict[str, Optional[str]]
+
+
+def flatten_event(record: dict) -> Event:
+    """Flattens an event exported from EVTX to JSON (e.g., by evtx_dump) into the fields that
+    Read-WinEvent extracts: the System fields and the named EventData fields. Records that are
+    already flat (e.g., exported with Read-WinEvent | ConvertTo-Json) are returned unchanged.
+    """
+    if "Event" not in record:
+        return {
+            name: None if value is None else str(value)
+            for name, value in record.items()
+        }
+    event = dict()
+    for name, value in record["Event"].get("System", {}).items():
+        if isinstance(value, dict):
+            if "#text" in value:
+                value = value["#text"]
+            elif len(value.get("#attributes", {})) == 1:
+                (value,) = value["#attributes"].values()
+            else:
+                continue
+        event[name] = None if value is None else str(value)
+    event_data = record["Event"].get("EventData") or {}
+    if isinstance(event_data, dict):
+        for name, value in event_data.items():
+            if name == "#attributes" or isinstance(value, (dict, list)):
+                continue
+            event[name] = None if value is None else str(value)
+    return event
+
+
+def flatten_event_xml(element: Element) -> Event:
+    """Flattens an event exported from EVTX to XML (e.g., by wevtutil qe /f:xml) like
+    flatten_event."""
+    event = dict()
+    for child in element:
+        name = child.tag.rpartition("}")[2]
+        if name == "System":
+            for system_field in child:
+                system_name = system_field.tag.rpartition("}")[2]
+                if system_field.text is not None and system_field.text.strip():
+                    event[system_name] = system_field.text
+                elif len(system_field.attrib) == 1:
+                    (event[system_name],) = system_field.attrib.values()
+        elif name == "EventData":
+            for data in child:
+                if "Name" in data.attrib:
+                    event[data.attrib["Name"]] = data.text
+    return event
+
+
+def read_events(path: Union[str, Path]) -> Iterator[Event]:
+    """Yields the flattened events of a JSON, JSON lines or XML export of an EVTX file."""
+    path = Path(path)
+    if path.suffix.lower() == ".xml":
+        yield from read_events_xml(path)
+        return
+    with open(path, encoding="utf-8-sig") as events_file:
+        start = events_file.read(1)
+        events_file.seek(0)
+        if start == "[":
+            records = loads(events_file.read())
+        else:
+            records = (loads(line) for line in events_file if line.strip())
+        for record in records:
+            yield flatten_event(record)
+
+
+def read_events_xml(path: Path) -> Iterator[Event]:
+    # Exports contain either an <Events> root or a sequence of <Event> elements without a root, so
+    # the content is wrapped in a root element of its own.
+    parser = XMLPullParser(events=("end",))
+    parser.feed("<Root>")
+    with open(path, encoding="utf-8-sig") as events_file:
+        content = events_file.read(1 << 16)
+        if content.startswith("<?xml"):
+            content = content[content.index("?>") + 2 :]
+        while content:
+            parser.feed(content)
+            yield from events_xml(parser)
+            content = events_file.read(1 << 16)
+    parser.feed("</Root>")
+    yield from events_xml(parser)
+
+
+def events_xml(parser: XMLPullParser) -> Iterator[Event]:
+    for _, element in parser.read_events():
+        if element.tag.rpartition("}")[2] == "Event":
+            yield flatten_event_xml(element)
+            element.clear()
+
+
+def bitmask(rows: Iterable[int], size: int) -> int:
+    """Returns an integer with the bits of the given rows set."""
+    bits = bytearray((size + 7) // 8)
+    for row in rows:
+        bits[row >> 3] |= 1 << (row & 7)
+    return int.from_bytes(bits, "little")
+
+
+class EventTable:
+    """Events stored by column. Each column maps the distinct values of a field (lowercased, as
+    the converted queries compare case-insensitively) to the rows that contain them, so that a
+    predicate is only evaluated once per distinct value. Sets of rows are represented as integer
+    bitmasks and combined with bitwise operators."""
+
+    def __init__(self, events: Iterable[Event] = ()):
+        self.size = 0
+        self.columns: Dict[str, Dict[str, List[int]]] = defaultdict(
+            lambda: defaultdict(list)
+        )
+        self.masks: Dict[Tuple[str, str], int] = dict()
+        self.extend(events)
+
+    @classmethod
+    def from_paths(cls, paths: Iterable[Union[str, Path]]) -> "EventTable":
+        """Loads the events of all JSON, JSON lines and XML files of the given files and
+        directories."""
+        table = cls()
+        for path in paths:
+            path = Path(path)
+            files = (
+                sorted(
+                    file
+                    for file in path.rglob("*")
+                    if file.suffix.lower() in (".json", ".jsonl", ".xml")
+                )
+                if path.is_dir()
+                else [path]
+            )
+            for file in files:
+                table.extend(read_events(file))
+        return table
+
+    def extend(self, events: Iterable[Event]) -> None:
+        for event in events:
+            for name, value in event.items():
+                if value is not None and value != "":
+                    self.columns[name][value.lower()].append(self.size)
+            self.size += 1
+        self.masks.clear()
+
+    @property
+    def all(self) -> int:
+        return (1 << self.size) - 1
+
+    def mask(self, name: str, value: str) -> int:
+        """Returns the rows of a value. The rows of frequent values (e.g., channels and EventIDs)
+        are kept as bitmasks, as combining bitmasks is much cheaper than setting their bits again.
+        """
+        rows = self.columns.get(name, {}).get(value, ())
+        if len(rows) < max(512, self.size >> 8):
+            return bitmask(rows, self.size)
+        if (name, value) not in self.masks:
+            self.masks[(name, value)] = bitmask(rows, self.size)
+        return self.masks[(name, value)]
+
+    def select(self, name: str, test: Callable[[str], bool]) -> int:
+        """Returns the rows in which the value of the field satisfies the test."""
+        frequent = max(512, self.size >> 8)
+        mask = 0
+        rare = list()
+        for value, rows in self.columns.get(name, {}).items():
+            if test(value):
+                if len(rows) < frequent:
+                    rare.append(rows)
+                else:
+                    mask |= self.mask(name, value)
+        return mask | bitmask(chain.from_iterable(rare), self.size)
+
+    def equals(self, name: str, value: str) -> int:
+        return self.mask(name, value.lower())
+
+    def exists(self, name: str) -> int:
+        return self.select(name, lambda value: True)
+
+
+@dataclass
+class PredicateSelectivity:
+    """Number of events of the channel of a rule that match one of its predicates."""
+
+    predicate: str
+    matches: int
+    events: int
+
+    @property
+    def selectivity(self) -> float:
+        return self.matches / self.events if self.events else 0.0
+
+
+@dataclass
+class RuleEvaluation:
+    """Number of events of the channel of a rule that match the rule and each of its predicates."""
+
+    rule: SigmaRule
+    channel: Optional[str]
+    events: int
+    matches: int
+    predicates: List[PredicateSelectivity] = field(default_factory=list)
+
+
+class RuleEvaluator:
+    """Evaluates Sigma rules against an EventTable after applying the processing pipelines of the
+    backend, so the condition trees are the ones PowerShellBackend converts. Predicates are
+    evaluated once for all events, and their results are shared by all rules."""
+
+    def __init__(self, backend: PowerShellBackend, events: EventTable):
+        self.backend = backend
+        self.events = events
+        self.pipeline = (
+            backend.backend_processing_pipeline + backend.processing_pipeline
+        )
+        self.errors: List[Tuple[SigmaRule, SigmaError]] = list()
+        self.predicates: Dict[Tuple[str, ...], int] = dict()
+
+    def evaluate(
+        self, rules: Union[SigmaCollection, Iterable[SigmaRule]]
+    ) -> List[RuleEvaluation]:
+        if isinstance(rules, SigmaCollection):
+            rules.resolve_rule_references()
+            rules = rules.rules
+        evaluations = list()
+        for rule in rules:
+            try:
+                evaluations.append(self.evaluate_rule(rule))
+            except SigmaError as error:
+                if not self.backend.collect_errors:
+                    raise
+                self.errors.append((rule, error))
+        return evaluations
+
+    def evaluate_rule(self, rule: SigmaRule) -> RuleEvaluation:
+        self.pipeline.apply(rule)
+        channel = rule.logsource.service
+        channel_rows = (
+            self.events.equals("Channel", channel)
+            if channel is not None
+            else self.events.all
+        )
+        evaluation = RuleEvaluation(rule, channel, channel_rows.bit_count(), 0, list())
+        state = ConversionState(processing_state=dict(self.pipeline.state))
+        rows = 0
+        for condition in rule.detection.parsed_condition:
+            rows |= self.evaluate_condition(
+                condition.parsed, channel_rows, evaluation, state
+            )
+        evaluation.matches = (rows & channel_rows).bit_count()
+        return evaluation
+
+    def evaluate_condition(
+        self,
+        cond: Union[
+            ConditionItem,
+            ConditionFieldEqualsValueExpression,
+            ConditionValueExpression,
+        ],
+        channel_rows: int,
+        evaluation: RuleEvaluation,
+        state: ConversionState,
+    ) -> int:
+        if isinstance(cond, ConditionAND):
+            rows = self.events.all
+            for arg in cond.args:
+                rows &= self.evaluate_condition(arg, channel_rows, evaluation, state)
+            return rows
+        if isinstance(cond, ConditionOR):
+            rows = 0
+            for arg in cond.args:
+                rows |= self.evaluate_condition(arg, channel_rows, evaluation, state)
+            return rows
+        if isinstance(cond, ConditionNOT):
+            return self.events.all ^ self.evaluate_condition(
+                cond.args[0], channel_rows, evaluation, state
+            )
+        rows = self.evaluate_predicate(cond)
+        try:
+            predicate = self.backend.convert_condition(cond, state)
+        except SigmaError:
+            predicate = str(cond)
+        evaluation.predicates.append(
+            PredicateSelectivity(
+                predicate, (rows & channel_rows).bit_count(), evaluation.events
+            )
+        )
+        return rows
+
+    def evaluate_predicate(
+        self, cond: Union[ConditionFieldEqualsValueExpression, ConditionValueExpression]
+    ) -> int:
+        if isinstance(cond, ConditionFieldEqualsValueExpression):
+            # The pipeline prefixes field names with the PowerShell pipeline variable.
+            name = cond.field.removeprefix(self.backend.xpath_field_prefix)
+        else:
+            name = None
+        key = (name, repr(cond.value))
+        if key not in self.predicates:
+            self.predicates[key] = self.evaluate_value(name, cond.value)
+        return self.predicates[key]
+
+    def evaluate_value(self, name: Optional[str], value: SigmaType) -> int:
+        if isinstance(value, SigmaExpansion):
+            rows = 0
+            for expanded_value in value.values:
+                rows |= self.evaluate_value(name, expanded_value)
+            return rows
+        if isinstance(value, SigmaNull):
+            return self.events.all ^ self.events.exists(name)
+        if isinstance(value, SigmaExists):
+            rows = self.events.exists(name)
+            return rows if value else self.events.all ^ rows
+        if isinstance(value, (SigmaNumber, SigmaBool)):
+            return self.equals(name, str(value))
+        if isinstance(value, SigmaString) and not value.contains_special():
+            return self.equals(name, value.to_plain())
+        if isinstance(value, SigmaString):
+            pattern = self.pattern(value.to_regex().regexp)
+            # Keywords match if they are contained in any field.
+            return self.select(name, pattern.fullmatch if name else pattern.search)
+        if isinstance(value, SigmaRegularExpression):
+            return self.select(name, self.pattern(value.regexp).search)
+        if isinstance(value, SigmaCompareExpression):
+            return self.select(name, self.compare(value))
+        if isinstance(value, SigmaCIDRExpression):
+            return self.select(name, self.cidr(value))
+        raise SigmaValueError(
+            f"Values of type {type(value).__name__} can't be evaluated"
+        )
+
+    def select(self, name: Optional[str], test: Callable[[str], bool]) -> int:
+        """Selects the rows in which the field or, for keywords, any field satisfies the test."""
+        if name is not None:
+            return self.events.select(name, test)
+        rows = 0
+        for column in self.events.columns:
+            rows |= self.events.select(column, test)
+        return rows
+
+    def equals(self, name: Optional[str], value: str) -> int:
+        if name is not None:
+            return self.events.equals(name, value)
+        value = value.lower()
+        return self.select(None, lambda field_value: value in field_value)
+
+    @staticmethod
+    def pattern(regexp: str) -> re.Pattern:
+        # Regular expressions are matched with -match, which ignores the case.
+        return re.compile(regexp, re.IGNORECASE | re.DOTALL)
+
+    @staticmethod
+    def compare(value: SigmaCompareExpression) -> Callable[[str], bool]:
+        compare_operator = {
+            SigmaCompareExpression.CompareOperators.LT: operator.lt,
+            SigmaCompareExpression.CompareOperators.LTE: operator.le,
+            SigmaCompareExpression.CompareOperators.GT: operator.gt,
+            SigmaCompareExpression.CompareOperators.GTE: operator.ge,
+        }[value.op]
+
+        def test(field_value: str) -> bool:
+            try:
+                return compare_operator(float(field_value), value.number.number)
+            except ValueError:
+                return False
+
+        return test
+
+    @staticmethod
+    def cidr(value: SigmaCIDRExpression) -> Callable[[str], bool]:
+        def test(field_value: str) -> bool:
+            try:
+                return ip_address(field_value) in value.network
+            except ValueError:
+                return False
+
+        return test
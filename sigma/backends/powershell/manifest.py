@@ -0,0 +1,116 @@
+from csv import DictWriter
+from dataclasses import dataclass
+from heapq import heapify, heapreplace
+from math import ceil
+from pathlib import Path
+from struct import unpack_from
+from typing import Iterable, List, Optional, Tuple, Union
+
+# Layout of EVTX files: a file header block followed by chunks of event records. Each chunk
+# header contains the range of EventRecordIDs of the records in the chunk.
+EVTX_FILE_SIGNATURE = b"ElfFile\x00"
+EVTX_CHUNK_SIGNATURE = b"ElfChnk\x00"
+EVTX_HEADER_SIZE = 4096
+EVTX_CHUNK_SIZE = 65536
+
+
+@dataclass
+class ManifestTask:
+    """A file, or a range of EventRecordIDs of a file, scanned by one worker of the evtx format."""
+
+    path: Path
+    size: int
+    first_record_id: Optional[int] = None
+    last_record_id: Optional[int] = None
+
+
+def evtx_chunks(path: Path) -> List[Tuple[int, int]]:
+    """Return the first and last EventRecordID of each chunk of an EVTX file, ordered by
+    EventRecordID. Returns an empty list if the file isn't an EVTX file."""
+    chunks = list()
+    with open(path, "rb") as evtx_file:
+        if evtx_file.read(len(EVTX_FILE_SIGNATURE)) != EVTX_FILE_SIGNATURE:
+            return chunks
+        offset = EVTX_HEADER_SIZE
+        while True:
+            evtx_file.seek(offset)
+            header = evtx_file.read(40)
+            if len(header) < 40:
+                break
+            if header.startswith(EVTX_CHUNK_SIGNATURE):
+                first_record_id, last_record_id = unpack_from("<QQ", header, 24)
+                if first_record_id <= last_record_id:
+                    chunks.append((first_record_id, last_record_id))
+            offset += EVTX_CHUNK_SIZE
+    return sorted(chunks)
+
+
+def build_manifest(
+    paths: Iterable[Union[str, Path]],
+    workers: int,
+    tasks_per_worker: int = 4,
+    min_task_size: int = 16 * EVTX_CHUNK_SIZE,
+) -> List[ManifestTask]:
+    """
+    Build the tasks scanning the EVTX files below paths with the given number of workers. Files
+    larger than an even share of tasks_per_worker tasks per worker are split into ranges of
+    EventRecordIDs along chunk boundaries, so that a single large file doesn't keep one worker
+    busy after the others finished. The tasks are ordered by size, largest first, so that the
+    workers pulling them end up with similar loads.
+    """
+    files = list()
+    for path in map(Path, paths):
+        if path.is_dir():
+            files.extend(sorted(path.rglob("*.evtx")))
+        else:
+            files.append(path)
+    sizes = {path: path.stat().st_size for path in files}
+    task_size = max(
+        ceil(sum(sizes.values()) / max(workers * tasks_per_worker, 1)), min_task_size
+    )
+
+    tasks = list()
+    for path, size in sizes.items():
+        chunks = evtx_chunks(path) if size > task_size else []
+        if not chunks:
+            tasks.append(ManifestTask(path, size))
+            continue
+        chunks_per_task = max(task_size // EVTX_CHUNK_SIZE, 1)
+        for start in range(0, len(chunks), chunks_per_task):
+            task_chunks = chunks[start : start + chunks_per_task]
+            tasks.append(
+                ManifestTask(
+                    path,
+                    len(task_chunks) * EVTX_CHUNK_SIZE,
+                    task_chunks[0][0],
+                    task_chunks[-1][1],
+                )
+            )
+    return sorted(tasks, key=lambda task: -task.size)
+
+
+def worker_loads(tasks: List[ManifestTask], workers: int) -> List[int]:
+    """Return the bytes scanned by each worker if each task is pulled by the least loaded one."""
+    loads = [0] * max(workers, 1)
+    heapify(loads)
+    for task in tasks:
+        heapreplace(loads, loads[0] + task.size)
+    return sorted(loads, reverse=True)
+
+
+def write_manifest(tasks: List[ManifestTask], path: Union[str, Path]) -> None:
+    """Write the tasks as CSV that is read by the evtx format with -Manifest."""
+    with open(path, "w", newline="") as manifest_file:
+        writer = DictWriter(
+            manifest_file, ["Path", "Size", "FirstRecordId", "LastRecordId"]
+        )
+        writer.writeheader()
+        for task in tasks:
+            writer.writerow(
+                {
+                    "Path": str(task.path.resolve()),
+                    "Size": task.size,
+                    "FirstRecordId": task.first_record_id or "",
+                    "LastRecordId": task.last_record_id or "",
+                }
+            )
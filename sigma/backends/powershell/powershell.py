@@ -1,209 +1,2054 @@
-from sigma.conversion.base import TextQueryBackend
-from sigma.conversion.state import ConversionState
-from sigma.conditions import ConditionItem, ConditionAND, ConditionOR, ConditionNOT
-from sigma.rule import SigmaRule
-from sigma.types import SigmaCompareExpression, SigmaRegularExpressionFlag
-import re
-from typing import ClassVar, Dict, Tuple, Pattern, Any, Optional
-
-
-class PowerShellBackend(TextQueryBackend):
-    """PowerShell backend."""
-
-    name: ClassVar[str] = "PowerShell backend"
-    formats: Dict[str, str] = {
-        "default": "PowerShell queries",
-    }
-    requires_pipeline: bool = True
-
-    precedence: ClassVar[Tuple[ConditionItem, ConditionItem, ConditionItem]] = (
-        ConditionAND,
-        ConditionNOT,
-        ConditionOR,
-    )
-    group_expression: ClassVar[str] = (
-        "({expr})"  # Expression for precedence override grouping as format string with {expr} placeholder
-    )
-
-    # Generated query tokens
-    token_separator: str = ""  # separator inserted between all boolean operators
-    or_token: ClassVar[str] = " -or "
-    and_token: ClassVar[str] = " -and "
-    not_token: ClassVar[str] = "-not "
-    eq_token: ClassVar[str] = (
-        " -eq "  # Token inserted between field and value (without separator)
-    )
-
-    # String output
-    ## Fields
-    ### Quoting
-    field_quote: ClassVar[str] = (
-        "'"  # Character used to quote field characters if field_quote_pattern matches (or not, depending on field_quote_pattern_negation). No field name quoting is done if not set.
-    )
-    field_quote_pattern: ClassVar[Pattern] = re.compile(
-        "^\\w+$"
-    )  # Quote field names if this pattern (doesn't) matches, depending on field_quote_pattern_negation. Field name is always quoted if pattern is not set.
-    field_quote_pattern_negation: ClassVar[bool] = (
-        False  # Negate field_quote_pattern result. Field name is quoted if pattern doesn't matches if set to True (default).
-    )
-
-    ### Escaping
-    field_escape: ClassVar[str] = (
-        ""  # Character to escape particular parts defined in field_escape_pattern.
-    )
-    field_escape_quote: ClassVar[bool] = (
-        False  # Escape quote string defined in field_quote
-    )
-    field_escape_pattern: ClassVar[Pattern] = re.compile(
-        ""
-    )  # All matches of this pattern are prepended with the string contained in field_escape.
-
-    ## Values
-    str_quote: ClassVar[str] = (
-        '"'  # string quoting character (added as escaping character)
-    )
-    escape_char: ClassVar[str] = (
-        ""  # Escaping character for special characters inside string
-    )
-    wildcard_multi: ClassVar[str] = "*"  # Character used as multi-character wildcard
-    wildcard_single: ClassVar[str] = "*"  # Character used as single-character wildcard
-    add_escaped: ClassVar[str] = (
-        ""  # Characters quoted in addition to wildcards and string quote
-    )
-    filter_chars: ClassVar[str] = "\\"  # Characters filtered
-    bool_values: ClassVar[Dict[bool, str]] = (
-        {  # Values to which boolean values are mapped.
-            True: "$true",
-            False: "$false",
-        }
-    )
-
-    # String matching operators. if none is appropriate eq_token is used.
-    startswith_expression: ClassVar[str] = "{field}.StartsWith({value})"
-    endswith_expression: ClassVar[str] = "{field}.EndsWith({value})"
-    contains_expression: ClassVar[str] = "{field}.Contains({value})"
-    wildcard_match_expression: ClassVar[str] = (
-        "{field} -like {value}"  # Special expression if wildcards can't be matched with the eq_token operator
-    )
-
-    # Regular expressions
-    # Regular expression query as format string with placeholders {field}, {regex}, {flag_x} where x
-    # is one of the flags shortcuts supported by Sigma (currently i, m and s) and refers to the
-    # token stored in the class variable re_flags.
-    re_expression: ClassVar[str] = '{field} -match "{regex}"'
-    re_escape_char: ClassVar[str] = (
-        ""  # Character used for escaping in regular expressions
-    )
-    re_escape: ClassVar[Tuple[str]] = ()  # List of strings that are escaped
-    re_escape_escape_char: bool = True  # If True, the escape character is also escaped
-    re_flag_prefix: bool = (
-        True  # If True, the flags are prepended as (?x) group at the beginning of the regular expression, e.g. (?i). If this is not supported by the target, it should be set to False.
-    )
-    # Mapping from SigmaRegularExpressionFlag values to static string templates that are used in
-    # flag_x placeholders in re_expression template.
-    # By default, i, m and s are defined. If a flag is not supported by the target query language,
-    # remove it from re_flags or don't define it to ensure proper error handling in case of appearance.
-    re_flags: Dict[SigmaRegularExpressionFlag, str] = {
-        SigmaRegularExpressionFlag.IGNORECASE: "i",
-        SigmaRegularExpressionFlag.MULTILINE: "m",
-        SigmaRegularExpressionFlag.DOTALL: "s",
-    }
-
-    # Case sensitive string matching expression. String is quoted/escaped like a normal string.
-    # Placeholders {field} and {value} are replaced with field name and quoted/escaped string.
-    case_sensitive_match_expression: ClassVar[str] = "{field} casematch {value}"
-    # Case sensitive string matching operators similar to standard string matching. If not provided,
-    # case_sensitive_match_expression is used.
-    case_sensitive_startswith_expression: ClassVar[str] = (
-        "{field} casematch_startswith {value}"
-    )
-    case_sensitive_endswith_expression: ClassVar[str] = (
-        "{field} casematch_endswith {value}"
-    )
-    case_sensitive_contains_expression: ClassVar[str] = (
-        "{field} casematch_contains {value}"
-    )
-
-    # CIDR expressions: define CIDR matching if backend has native support. Else pySigma expands
-    # CIDR values into string wildcard matches.
-    cidr_expression: ClassVar[Optional[str]] = (
-        None  # CIDR expression query as format string with placeholders {field}, {value} (the whole CIDR value), {network} (network part only), {prefixlen} (length of network mask prefix) and {netmask} (CIDR network mask only).
-    )
-
-    # Numeric comparison operators
-    compare_op_expression: ClassVar[str] = (
-        "{field} {operator} {value}"  # Compare operation query as format string with placeholders {field}, {operator} and {value}
-    )
-    # Mapping between CompareOperators elements and strings used as replacement for {operator} in compare_op_expression
-    compare_operators: ClassVar[Dict[SigmaCompareExpression.CompareOperators, str]] = {
-        SigmaCompareExpression.CompareOperators.LT: "-lt",
-        SigmaCompareExpression.CompareOperators.LTE: "-le",
-        SigmaCompareExpression.CompareOperators.GT: "-gt",
-        SigmaCompareExpression.CompareOperators.GTE: "-ge",
-    }
-
-    # Expression for comparing two event fields
-    field_equals_field_expression: ClassVar[Optional[str]] = (
-        None  # Field comparison expression with the placeholders {field1} and {field2} corresponding to left field and right value side of Sigma detection item
-    )
-    field_equals_field_escaping_quoting: Tuple[bool, bool] = (
-        True,
-        True,
-    )  # If regular field-escaping/quoting is applied to field1 and field2. A custom escaping/quoting can be implemented in the convert_condition_field_eq_field_escape_and_quote method.
-
-    # Null/None expressions
-    field_null_expression: ClassVar[str] = (
-        "{field} -is null"  # Expression for field has null value as format string with {field} placeholder for field name
-    )
-
-    # Field existence condition expressions.
-    field_exists_expression: ClassVar[str] = (
-        "exists({field})"  # Expression for field existence as format string with {field} placeholder for field name
-    )
-    field_not_exists_expression: ClassVar[str] = (
-        "notexists({field})"  # Expression for field non-existence as format string with {field} placeholder for field name. If not set, field_exists_expression is negated with boolean NOT.
-    )
-
-    # Field value in list, e.g. "field in (value list)" or "field containsall (value list)"
-    convert_or_as_in: ClassVar[bool] = True  # Convert OR as in-expression
-    convert_and_as_in: ClassVar[bool] = True  # Convert AND as in-expression
-    in_expressions_allow_wildcards: ClassVar[bool] = (
-        True  # Values in list can contain wildcards. If set to False (default) only plain values are converted into in-expressions.
-    )
-    field_in_list_expression: ClassVar[str] = (
-        "{field} {op} ({list})"  # Expression for field in list of values as format string with placeholders {field}, {op} and {list}
-    )
-    or_in_operator: ClassVar[str] = (
-        " -in "  # Operator used to convert OR into in-expressions. Must be set if convert_or_as_in is set
-    )
-    and_in_operator: ClassVar[str] = (
-        "contains-all"  # Operator used to convert AND into in-expressions. Must be set if convert_and_as_in is set
-    )
-    list_separator: ClassVar[str] = ", "  # List element separator
-
-    # Value not bound to a field
-    unbound_value_str_expression: ClassVar[str] = (
-        '"{value}"'  # Expression for string value not bound to a field as format string with placeholder {value}
-    )
-    unbound_value_num_expression: ClassVar[str] = (
-        "{value}"  # Expression for number value not bound to a field as format string with placeholder {value}
-    )
-    unbound_value_re_expression: ClassVar[str] = (
-        "_=~{value}"  # Expression for regular expression not bound to a field as format string with placeholder {value} and {flag_x} as described for re_expression
-    )
-
-    # Query finalization: appending and concatenating deferred query part
-    deferred_start: ClassVar[str] = (
-        "\n| "  # String used as separator between main query and deferred parts
-    )
-    deferred_separator: ClassVar[str] = (
-        "\n| "  # String used to join multiple deferred query parts
-    )
-    deferred_only_query: ClassVar[str] = (
-        "*"  # String used as query if final query only contains deferred expression
-    )
-
-    def finalize_query_default(
-        self, rule: SigmaRule, query: Any, index: int, state: ConversionState
-    ) -> Any:
-        return f'-LogName "{rule.logsource.service}" | Read-WinEvent | Where-Object {{{query}}}"'
+from collections import defaultdict
+from copy import copy
+from dataclasses import dataclass, field
+from functools import cached_property
+from hashlib import sha1
+from json import load
+from pathlib import Path
+from sigma.collection import SigmaCollection
+from sigma.conversion.base import TextQueryBackend
+from sigma.conversion.state import ConversionState
+from sigma.conditions import (
+    ConditionItem,
+    ConditionAND,
+    ConditionOR,
+    ConditionNOT,
+    ConditionFieldEqualsValueExpression,
+    ConditionValueExpression,
+)
+from sigma.conversion.deferred import DeferredQueryExpression
+from sigma.correlations import (
+    SigmaCorrelationRule,
+    SigmaCorrelationType,
+    SigmaRuleReference,
+)
+from sigma.exceptions import SigmaConversionError, SigmaError
+from sigma.processing.conditions import DetectionItemProcessingItemAppliedCondition
+from sigma.processing.pipeline import ProcessingItem, ProcessingPipeline
+from sigma.processing.transformations import DropDetectionItemTransformation
+from sigma.rule import SigmaRule, SigmaRuleBase
+from sigma.types import (
+    SigmaCIDRExpression,
+    SigmaCompareExpression,
+    SigmaExpansion,
+    SigmaFieldReference,
+    SigmaNumber,
+    SigmaRegularExpression,
+    SigmaRegularExpressionFlag,
+    SigmaString,
+    SigmaTimestampPart,
+    SigmaType,
+    SpecialChars,
+)
+import re
+from typing import (
+    ClassVar,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Tuple,
+    Pattern,
+    Any,
+    Optional,
+    Set,
+    Union,
+)
+from .correlation import CorrelationWindow
+
+
+@dataclass
+class PowerShellRuleQuery:
+    """Converted rule of the script output format before it is embedded into a channel reader."""
+
+    rule: SigmaRule
+    logname: str
+    eventids: Optional[List[int]]
+    condition: Optional[str]
+    definitions: List[str] = field(default_factory=list)
+    subexpressions: List[str] = field(default_factory=list)
+    index: int = 0  # Index of the converted condition of the rule
+    fields: Optional[List[str]] = (
+        None  # Fields read by the condition, None for all fields
+    )
+    cost: int = (
+        0  # Estimated cost of evaluating the condition for an event, see operand_costs
+    )
+
+
+class PowerShellBackend(TextQueryBackend):
+    """PowerShell backend."""
+
+    name: ClassVar[str] = "PowerShell backend"
+    formats: Dict[str, str] = {
+        "default": "PowerShell queries",
+        "xpath": "PowerShell queries with pushable predicates moved into -FilterXPath",
+        "script": "PowerShell script reading each channel once and dispatching events to rules by EventID",
+        "evtx": "PowerShell script scanning archived EVTX files in parallel with ForEach-Object -Parallel",
+    }
+    requires_pipeline: bool = True
+
+    # The default format lifts the EventID onto -FilterHashTable (see PromoteDetectionItemTransformation),
+    # so the detection item is dropped from the Where-Object block. The xpath format keeps it in the
+    # condition tree and pushes it down together with the other predicates.
+    output_format_processing_pipeline: ClassVar[Dict[str, ProcessingPipeline]] = (
+        defaultdict(
+            ProcessingPipeline,
+            default=ProcessingPipeline(
+                name="PowerShell default output pipeline",
+                items=[
+                    ProcessingItem(
+                        identifier="powershell_drop_promoted_eventid",
+                        detection_item_conditions=[
+                            DetectionItemProcessingItemAppliedCondition(
+                                processing_item_id="powershell_promote_eventid"
+                            )
+                        ],
+                        transformation=DropDetectionItemTransformation(),
+                    )
+                ],
+            ),
+        )
+    )
+
+    precedence: ClassVar[Tuple[ConditionItem, ConditionItem, ConditionItem]] = (
+        ConditionAND,
+        ConditionNOT,
+        ConditionOR,
+    )
+    group_expression: ClassVar[str] = (
+        "({expr})"  # Expression for precedence override grouping as format string with {expr} placeholder
+    )
+
+    # Generated query tokens
+    parenthesize: bool = True  # Put parentheses around all nested boolean expressions
+    token_separator: str = ""  # separator inserted between all boolean operators
+    or_token: ClassVar[str] = " -or "
+    and_token: ClassVar[str] = " -and "
+    not_token: ClassVar[str] = "-not "
+    eq_token: ClassVar[str] = (
+        " -eq "  # Token inserted between field and value (without separator)
+    )
+
+    # String output
+    ## Fields
+    ### Quoting
+    field_quote: ClassVar[str] = (
+        "'"  # Character used to quote field characters if field_quote_pattern matches (or not, depending on field_quote_pattern_negation). No field name quoting is done if not set.
+    )
+    field_quote_pattern: ClassVar[Pattern] = re.compile(
+        "^\\w+$"
+    )  # Quote field names if this pattern (doesn't) matches, depending on field_quote_pattern_negation. Field name is always quoted if pattern is not set.
+    field_quote_pattern_negation: ClassVar[bool] = (
+        False  # Negate field_quote_pattern result. Field name is quoted if pattern doesn't matches if set to True (default).
+    )
+
+    ### Escaping
+    field_escape: ClassVar[str] = (
+        ""  # Character to escape particular parts defined in field_escape_pattern.
+    )
+    field_escape_quote: ClassVar[bool] = (
+        False  # Escape quote string defined in field_quote
+    )
+    field_escape_pattern: ClassVar[Pattern] = re.compile(
+        ""
+    )  # All matches of this pattern are prepended with the string contained in field_escape.
+
+    ## Values
+    str_quote: ClassVar[str] = (
+        '"'  # string quoting character (added as escaping character)
+    )
+    escape_char: ClassVar[str] = (
+        ""  # Escaping character for special characters inside string
+    )
+    wildcard_multi: ClassVar[str] = "*"  # Character used as multi-character wildcard
+    wildcard_single: ClassVar[str] = "*"  # Character used as single-character wildcard
+    add_escaped: ClassVar[str] = (
+        ""  # Characters quoted in addition to wildcards and string quote
+    )
+    filter_chars: ClassVar[str] = "\\"  # Characters filtered
+    bool_values: ClassVar[Dict[bool, str]] = (
+        {  # Values to which boolean values are mapped.
+            True: "$true",
+            False: "$false",
+        }
+    )
+
+    # String matching operators. if none is appropriate eq_token is used.
+    startswith_expression: ClassVar[str] = "{field}.StartsWith({value})"
+    endswith_expression: ClassVar[str] = "{field}.EndsWith({value})"
+    contains_expression: ClassVar[str] = "{field}.Contains({value})"
+    wildcard_match_expression: ClassVar[str] = (
+        "{field} -like {value}"  # Special expression if wildcards can't be matched with the eq_token operator
+    )
+
+    # Regular expressions
+    # Regular expression query as format string with placeholders {field}, {regex}, {flag_x} where x
+    # is one of the flags shortcuts supported by Sigma (currently i, m and s) and refers to the
+    # token stored in the class variable re_flags.
+    re_expression: ClassVar[str] = '{field} -match "{regex}"'
+    re_escape_char: ClassVar[str] = (
+        ""  # Character used for escaping in regular expressions
+    )
+    re_escape: ClassVar[Tuple[str]] = ()  # List of strings that are escaped
+    re_escape_escape_char: bool = True  # If True, the escape character is also escaped
+    re_flag_prefix: bool = (
+        True  # If True, the flags are prepended as (?x) group at the beginning of the regular expression, e.g. (?i). If this is not supported by the target, it should be set to False.
+    )
+    # Mapping from SigmaRegularExpressionFlag values to static string templates that are used in
+    # flag_x placeholders in re_expression template.
+    # By default, i, m and s are defined. If a flag is not supported by the target query language,
+    # remove it from re_flags or don't define it to ensure proper error handling in case of appearance.
+    re_flags: Dict[SigmaRegularExpressionFlag, str] = {
+        SigmaRegularExpressionFlag.IGNORECASE: "i",
+        SigmaRegularExpressionFlag.MULTILINE: "m",
+        SigmaRegularExpressionFlag.DOTALL: "s",
+    }
+
+    # Case sensitive string matching expression. String is quoted/escaped like a normal string.
+    # Placeholders {field} and {value} are replaced with field name and quoted/escaped string.
+    case_sensitive_match_expression: ClassVar[str] = "{field} casematch {value}"
+    # Case sensitive string matching operators similar to standard string matching. If not provided,
+    # case_sensitive_match_expression is used.
+    case_sensitive_startswith_expression: ClassVar[str] = (
+        "{field} casematch_startswith {value}"
+    )
+    case_sensitive_endswith_expression: ClassVar[str] = (
+        "{field} casematch_endswith {value}"
+    )
+    case_sensitive_contains_expression: ClassVar[str] = (
+        "{field} casematch_contains {value}"
+    )
+
+    # CIDR expressions: define CIDR matching if backend has native support. Else pySigma expands
+    # CIDR values into string wildcard matches.
+    cidr_expression: ClassVar[Optional[str]] = (
+        None  # CIDR expression query as format string with placeholders {field}, {value} (the whole CIDR value), {network} (network part only), {prefixlen} (length of network mask prefix) and {netmask} (CIDR network mask only).
+    )
+
+    # Numeric comparison operators
+    compare_op_expression: ClassVar[str] = (
+        "{field} {operator} {value}"  # Compare operation query as format string with placeholders {field}, {operator} and {value}
+    )
+    # Mapping between CompareOperators elements and strings used as replacement for {operator} in compare_op_expression
+    compare_operators: ClassVar[Dict[SigmaCompareExpression.CompareOperators, str]] = {
+        SigmaCompareExpression.CompareOperators.LT: "-lt",
+        SigmaCompareExpression.CompareOperators.LTE: "-le",
+        SigmaCompareExpression.CompareOperators.GT: "-gt",
+        SigmaCompareExpression.CompareOperators.GTE: "-ge",
+    }
+
+    # Expression for comparing two event fields
+    field_equals_field_expression: ClassVar[Optional[str]] = (
+        None  # Field comparison expression with the placeholders {field1} and {field2} corresponding to left field and right value side of Sigma detection item
+    )
+    field_equals_field_escaping_quoting: Tuple[bool, bool] = (
+        True,
+        True,
+    )  # If regular field-escaping/quoting is applied to field1 and field2. A custom escaping/quoting can be implemented in the convert_condition_field_eq_field_escape_and_quote method.
+
+    # Null/None expressions
+    field_null_expression: ClassVar[str] = (
+        "{field} -is null"  # Expression for field has null value as format string with {field} placeholder for field name
+    )
+
+    # Field existence condition expressions.
+    field_exists_expression: ClassVar[str] = (
+        "exists({field})"  # Expression for field existence as format string with {field} placeholder for field name
+    )
+    field_not_exists_expression: ClassVar[str] = (
+        "notexists({field})"  # Expression for field non-existence as format string with {field} placeholder for field name. If not set, field_exists_expression is negated with boolean NOT.
+    )
+
+    # Field value in list, e.g. "field in (value list)" or "field containsall (value list)"
+    convert_or_as_in: ClassVar[bool] = True  # Convert OR as in-expression
+    convert_and_as_in: ClassVar[bool] = True  # Convert AND as in-expression
+    in_expressions_allow_wildcards: ClassVar[bool] = (
+        False  # Values in list can contain wildcards. If set to False (default) only plain values are converted into in-expressions.
+    )
+    field_in_list_expression: ClassVar[str] = (
+        "{field} {op} ({list})"  # Expression for field in list of values as format string with placeholders {field}, {op} and {list}
+    )
+    or_in_operator: ClassVar[str] = (
+        "-in"  # Operator used to convert OR into in-expressions. Must be set if convert_or_as_in is set
+    )
+    and_in_operator: ClassVar[str] = (
+        "contains-all"  # Operator used to convert AND into in-expressions. Must be set if convert_and_as_in is set
+    )
+    list_separator: ClassVar[str] = ", "  # List element separator
+
+    # Value not bound to a field
+    unbound_value_str_expression: ClassVar[str] = (
+        '"{value}"'  # Expression for string value not bound to a field as format string with placeholder {value}
+    )
+    unbound_value_num_expression: ClassVar[str] = (
+        "{value}"  # Expression for number value not bound to a field as format string with placeholder {value}
+    )
+    unbound_value_re_expression: ClassVar[str] = (
+        "_=~{value}"  # Expression for regular expression not bound to a field as format string with placeholder {value} and {flag_x} as described for re_expression
+    )
+
+    # Query finalization: appending and concatenating deferred query part
+    deferred_start: ClassVar[str] = (
+        "\n| "  # String used as separator between main query and deferred parts
+    )
+    deferred_separator: ClassVar[str] = (
+        "\n| "  # String used to join multiple deferred query parts
+    )
+    deferred_only_query: ClassVar[str] = (
+        "*"  # String used as query if final query only contains deferred expression
+    )
+
+    # Get-WinEvent -FilterXPath pushdown (xpath output format)
+    # Only equality, numeric comparison and AND/OR combinations of them are pushed down. The event
+    # log XPath subset has no wildcard, substring, regex or case folding support, so everything else
+    # stays in the Where-Object block.
+    xpath_field_prefix: ClassVar[str] = (
+        "$_."  # Field name prefix added by the pipeline, stripped before fields are used in XPath
+    )
+    xpath_field_pattern: ClassVar[Pattern] = re.compile(
+        "^\\w+$"
+    )  # Only fields matching this pattern can be referenced in XPath queries
+    xpath_system_fields: ClassVar[Dict[str, str]] = (
+        {  # Fields located in the System element of an event, mapped from lower-cased Sigma field names
+            "eventid": "EventID",
+            "eventrecordid": "EventRecordID",
+            "level": "Level",
+            "task": "Task",
+            "opcode": "Opcode",
+            "keywords": "Keywords",
+            "version": "Version",
+            "computer": "Computer",
+        }
+    )
+    xpath_system_expression: ClassVar[str] = "System[{field}{operator}{value}]"
+    xpath_eventdata_expression: ClassVar[str] = (
+        "EventData[Data[@Name='{field}']{operator}{value}]"
+    )
+    xpath_query_expression: ClassVar[str] = "*[{expr}]"
+    xpath_group_expression: ClassVar[str] = "({expr})"
+    xpath_and_token: ClassVar[str] = " and "
+    xpath_or_token: ClassVar[str] = " or "
+    xpath_eq_token: ClassVar[str] = "="
+    xpath_compare_operators: ClassVar[
+        Dict[SigmaCompareExpression.CompareOperators, str]
+    ] = {
+        SigmaCompareExpression.CompareOperators.LT: "<",
+        SigmaCompareExpression.CompareOperators.LTE: "<=",
+        SigmaCompareExpression.CompareOperators.GT: ">",
+        SigmaCompareExpression.CompareOperators.GTE: ">=",
+    }
+    xpath_case_sensitive: ClassVar[bool] = (
+        False  # XPath string comparison is case-sensitive. If not set, only strings without cased characters are pushed down. Can be overridden with the backend option of the same name.
+    )
+
+    # Single-pass script (script output format)
+    script_dispatch_variable: ClassVar[str] = (
+        "$Rules"  # Hashtable mapping EventIDs to script blocks with the rules for this EventID
+    )
+    script_any_event_variable: ClassVar[str] = (
+        "$AnyEventRules"  # Script block with the rules that aren't constrained to EventIDs
+    )
+    script_match_expression: ClassVar[str] = (
+        '[PSCustomObject]@{{RuleId = "{id}"; RuleTitle = "{title}"; Event = $_}}'
+    )
+
+    # Parallel scan of archived EVTX files (evtx output format)
+    # The rules of all channels are evaluated for each file, so that files of different channels
+    # can be scanned together. Files (or record ranges of large files, see
+    # sigma.backends.powershell.manifest) are distributed largest first over
+    # ForEach-Object -Parallel runspaces. Functions aren't shared with these runspaces, so
+    # Read-WinEvent is passed as source and defined again in each of them.
+    evtx_throttle_limit: ClassVar[int] = (
+        5  # Default number of files scanned in parallel. Can be overridden with the backend option of the same name.
+    )
+    evtx_prologue: ClassVar[str] = (
+        "param(\n"
+        '    [string[]]$Path = "*.evtx",\n'
+        "    [string]$Manifest,\n"
+        "    [int]$ThrottleLimit = {throttle_limit}\n"
+        ")\n"
+        "$Tasks = if ($Manifest) {{ Import-Csv -Path $Manifest }} else {{ Get-ChildItem -Path $Path -File | Sort-Object -Property Length -Descending | ForEach-Object {{ [PSCustomObject]@{{Path = $_.FullName}} }} }}\n"
+        "$ReadWinEvent = ${{function:Read-WinEvent}}.ToString()\n"
+        "$Tasks | ForEach-Object -ThrottleLimit $ThrottleLimit -Parallel {{\n"
+        "    $ReadWinEvent = $using:ReadWinEvent\n"
+        '    . ([scriptblock]::Create("function Read-WinEvent {{$ReadWinEvent}}"))\n'
+        "    $File = $_.Path\n"
+        '    $Filter = if ($_.FirstRecordId) {{ "*[System[EventRecordID >= $($_.FirstRecordId) and EventRecordID <= $($_.LastRecordId)]]" }} else {{ "*" }}'
+    )
+    evtx_reader: ClassVar[str] = (
+        "Get-WinEvent -Path $File -FilterXPath $Filter -ErrorAction SilentlyContinue | {read_winevent} | ForEach-Object {{"
+    )
+    evtx_dispatch_variable: ClassVar[str] = "$Rules_{index}"
+    evtx_any_event_variable: ClassVar[str] = "$AnyEventRules_{index}"
+    evtx_match_expression: ClassVar[str] = (
+        '[PSCustomObject]@{{File = $File; RuleId = "{id}"; RuleTitle = "{title}"; Event = $_}}'
+    )
+
+    # Native CIDR matching
+    # pySigma expands CIDR values into string prefixes, which turns odd-sized networks and lists of
+    # networks into long chains of string matches. If native_cidr is set, the CIDR values of a
+    # field are merged into a table of sorted, disjoint address ranges instead. Addresses are
+    # parsed into integers (IPv4 addresses are mapped into the IPv6 address space) by a helper
+    # defined once per script and looked up with a binary search.
+    native_cidr: ClassVar[bool] = (
+        False  # Match CIDR values with a range table instead of string prefixes. Can be overridden with the backend option of the same name.
+    )
+    cidr_helper_variable: ClassVar[str] = "$CidrContains"
+    cidr_helper_definition: ClassVar[str] = (
+        "{variable} = {{ param([string]$Address, $Table); $IP = $null; "
+        "if (-not [System.Net.IPAddress]::TryParse($Address, [ref]$IP)) {{ return $false }}; "
+        "$Bytes = $IP.MapToIPv6().GetAddressBytes(); [array]::Reverse($Bytes); "
+        "$Number = [System.Numerics.BigInteger]::new([byte[]]($Bytes + 0)); "
+        "$Index = [array]::BinarySearch($Table.Starts, $Number); "
+        "if ($Index -lt 0) {{ $Index = (-bnot $Index) - 1 }}; "
+        "$Index -ge 0 -and $Number -le $Table.Ends[$Index] }}"
+    )
+    cidr_table_variable: ClassVar[str] = (
+        "$Cidr_{hash}"  # Name of a range table variable with the placeholder {hash}, a digest of the ranges
+    )
+    cidr_table_definition: ClassVar[str] = (
+        "{variable} = @{{Starts = [System.Numerics.BigInteger[]]@({starts}); Ends = [System.Numerics.BigInteger[]]@({ends})}}"
+    )
+    cidr_expression_native: ClassVar[str] = "(& {helper} {field} {table})"
+    cidr_ipv4_mapped: ClassVar[int] = (
+        0xFFFF00000000  # Prefix of IPv4-mapped IPv6 addresses
+    )
+
+    # Field projection
+    # Read-WinEvent converts every field of an event into a property by default. If project_fields
+    # is set, the fields referenced by the rules are passed to Read-WinEvent -Field, which only
+    # reads these EventData fields without parsing the XML of the event. System fields (e.g.
+    # EventID and Channel) are always read.
+    project_fields: ClassVar[bool] = (
+        False  # Only read the fields used by the rules. Can be overridden with the backend option of the same name.
+    )
+    read_winevent_expression: ClassVar[str] = "Read-WinEvent"
+    read_winevent_projection_expression: ClassVar[str] = "Read-WinEvent -Field {fields}"
+    read_winevent_system_fields: ClassVar[Tuple[str, ...]] = (
+        "channel",
+        "timecreated",
+    )  # Lower-cased System fields read besides xpath_system_fields
+
+    # Incremental hunting
+    # Scheduled queries shouldn't read the whole retained log on every run. With the backend option
+    # time_window, only the events of the last time_window seconds are read. With the backend
+    # option bookmarks, the script format stores the last EventRecordID read from each channel in
+    # a file in the bookmarks directory, and each run only reads the events written since the
+    # previous run.
+    time_window: ClassVar[Optional[int]] = (
+        None  # Seconds before the start of the query of the oldest event read, disabled if None. Can be overridden with the backend option of the same name.
+    )
+    time_window_start_expression: ClassVar[str] = (
+        "(Get-Date).AddSeconds(-{seconds})"  # StartTime of -FilterHashTable
+    )
+    xpath_time_window_expression: ClassVar[str] = (
+        "System[TimeCreated[timediff(@SystemTime) <= {milliseconds}]]"
+    )
+    bookmarks: ClassVar[Optional[str]] = (
+        None  # Directory of the bookmark files of the script format, disabled if None. PowerShell variables like $env:ProgramData are expanded. Can be overridden with the backend option of the same name.
+    )
+    bookmark_directory_expression: ClassVar[str] = (
+        '$BookmarkDirectory = New-Item -ItemType Directory -Force -Path "{directory}"'
+    )
+    bookmark_prologue: ClassVar[str] = (
+        '$Bookmark = Join-Path $BookmarkDirectory "{name}.bookmark"\n'
+        "$LastRecordId = if (Test-Path $Bookmark) {{ [long](Get-Content $Bookmark) }} else {{ 0 }}\n"
+        '$NextRecordId = [long](Get-WinEvent -LogName "{logname}" -MaxEvents 1 -ErrorAction SilentlyContinue).RecordId\n'
+        "if ($LastRecordId -gt $NextRecordId) {{ $LastRecordId = 0 }}"  # the log was cleared
+    )
+    xpath_bookmark_expression: ClassVar[str] = (
+        "System[EventRecordID > $LastRecordId and EventRecordID <= $NextRecordId]"
+    )
+    bookmark_epilogue: ClassVar[str] = (
+        "Set-Content -Path $Bookmark -Value $NextRecordId"
+    )
+
+    # Subexpressions shared by the rules of a channel
+    # Rules reading the same channel often repeat predicates. If share_subexpressions is set, the
+    # script format computes converted subexpressions that occur in the conditions of multiple
+    # rules of a dispatch block once per event into a variable that is referenced by the rules.
+    share_subexpressions: ClassVar[bool] = (
+        False  # Share subexpressions between rules of the script format. Can be overridden with the backend option of the same name.
+    )
+    shared_min_cost: ClassVar[int] = (
+        2  # Minimum estimated cost (see operand_costs) of a shared subexpression, cheaper ones aren't worth a variable
+    )
+    shared_variable: ClassVar[str] = (
+        "$Shared_{hash}"  # Name of a shared subexpression variable with the placeholder {hash}, a digest of the subexpression
+    )
+    shared_definition: ClassVar[str] = "{variable} = ({expr})"
+    subexpressions_state_key: ClassVar[str] = (
+        "powershell_subexpressions"  # Key of the converted subexpressions of a rule in the processing state
+    )
+    shared_state_key: ClassVar[str] = (
+        "powershell_shared"  # Key of the variables of the shared subexpressions of a block in the processing state
+    )
+    shared_definitions_state_key: ClassVar[str] = (
+        "powershell_shared_definitions"  # Key of the definitions of the shared variables of a block in the processing state
+    )
+    shared_uses_state_key: ClassVar[str] = (
+        "powershell_shared_uses"  # Key of the number of references of each shared variable of a block in the processing state
+    )
+
+    # Cost-based ordering of AND/OR operands
+    # -and and -or short-circuit, so operands that are cheap to evaluate and likely to decide the
+    # result are moved to the front. Operands with the same cost keep the order of the rule.
+    reorder_operands: ClassVar[bool] = (
+        False  # Order operands by cost. Can be overridden with the backend option of the same name.
+    )
+    operand_costs: ClassVar[Dict[str, int]] = (
+        {  # Estimated cost of evaluating a comparison, by the kind of the comparison
+            "eq": 1,
+            "startswith": 2,
+            "endswith": 2,
+            "contains": 3,
+            "wildcard": 4,
+            "regex": 5,
+        }
+    )
+    operand_selectivity: ClassVar[float] = (
+        0.5  # Probability of an operand to be true if no statistics are given
+    )
+
+    # Variables hoisted out of the queries
+    # Objects that only depend on the rule (hash sets and compiled regular expressions) are defined
+    # once before the reader instead of being created for every event. Variables are named by a
+    # digest of their content, so rules using the same values share a variable.
+    definitions_state_key: ClassVar[str] = (
+        "powershell_definitions"  # Key of the variable definitions of a rule in the processing state
+    )
+
+    # Value lists hoisted into hash sets
+    # -in re-creates its array for every event and scans it linearly. Lists with at least
+    # hashset_threshold values are instead added once to a case-insensitive HashSet and looked up
+    # with a single Contains() call.
+    hashset_threshold: ClassVar[Optional[int]] = (
+        None  # Minimum number of values of a list converted into a HashSet lookup, disabled if None. Can be overridden with the backend option of the same name.
+    )
+    hashset_variable: ClassVar[str] = (
+        "$InSet_{hash}"  # Name of a HashSet variable with the placeholder {hash}, a digest of the values
+    )
+    hashset_definition: ClassVar[str] = (
+        "{variable} = [System.Collections.Generic.HashSet[string]]::new([string[]]@({list}), [System.StringComparer]::OrdinalIgnoreCase)"
+    )
+    hashset_expression: ClassVar[str] = "{variable}.Contains({field})"
+
+    # String matches merged into compiled regular expressions
+    # OR-ed contains, startswith, endswith and wildcard matches of one field scan the field once per
+    # value. If there are at least regex_threshold of them, they are merged into one anchored
+    # alternation that is compiled once and scans the field a single time. Values may span multiple
+    # lines, so wildcards match newlines (Singleline) and the alternatives are anchored with \A and
+    # \z, as $ also matches before a trailing newline.
+    regex_threshold: ClassVar[Optional[int]] = (
+        None  # Minimum number of OR-ed string matches of one field merged into a regex, disabled if None. Can be overridden with the backend option of the same name.
+    )
+    regex_variable: ClassVar[str] = (
+        "$Regex_{hash}"  # Name of a regex variable with the placeholder {hash}, a digest of the regex
+    )
+    regex_definition: ClassVar[str] = (
+        "{variable} = [regex]::new('{regex}', [System.Text.RegularExpressions.RegexOptions]'IgnoreCase, Singleline, Compiled')"
+    )
+    regex_expression: ClassVar[str] = (
+        "{variable}.IsMatch([string]{field})"  # IsMatch() doesn't accept $null, which is cast to an empty string
+    )
+    # Keywords (values not bound to a field)
+    # The keywords of a rule are matched with one compiled regex against the values of all fields
+    # of an event, joined by newlines. Wildcards don't match newlines, so they don't span fields.
+    keyword_variable: ClassVar[str] = (
+        "$Keywords_{hash}"  # Name of a keyword regex variable with the placeholder {hash}, a digest of the regex
+    )
+    keyword_definition: ClassVar[str] = (
+        "{variable} = [regex]::new('{regex}', [System.Text.RegularExpressions.RegexOptions]'IgnoreCase, Compiled')"
+    )
+    keyword_expression: ClassVar[str] = (
+        '{variable}.IsMatch(($_.PSObject.Properties.Value -join "`n"))'
+    )
+    regex_escape_pattern: ClassVar[Pattern] = re.compile(
+        r"([\\.$^{}\[\]()|*+?])"
+    )  # Characters escaped in regex literals
+
+    # Case-insensitive ordinal string matching
+    # Sigma string matches are case-insensitive, but the String methods of startswith_expression,
+    # endswith_expression and contains_expression compare case-sensitively. If ordinal_ignore_case
+    # is set, they are replaced by the overloads comparing with OrdinalIgnoreCase, which is
+    # culture-independent and faster than -like. Fields are cast to [string], so that missing
+    # fields ($null) don't raise an error. Contains(string, StringComparison) isn't available in
+    # Windows PowerShell, so contains is matched with IndexOf(). Backslashes aren't filtered from
+    # the values, as these overloads match them literally (e.g. endswith \cmd.exe).
+    ordinal_ignore_case: ClassVar[bool] = (
+        False  # Match strings case-insensitively with ordinal comparisons. Can be overridden with the backend option of the same name.
+    )
+    ordinal_ignore_case_expressions: ClassVar[Dict[str, str]] = {
+        "startswith_expression": "([string]{field}).StartsWith({value}, [System.StringComparison]::OrdinalIgnoreCase)",
+        "endswith_expression": "([string]{field}).EndsWith({value}, [System.StringComparison]::OrdinalIgnoreCase)",
+        "contains_expression": "(([string]{field}).IndexOf({value}, [System.StringComparison]::OrdinalIgnoreCase) -ge 0)",
+    }
+
+    # Correlation rules
+    # event_count, value_count and temporal correlation rules are converted into a streaming
+    # pipeline: the events matched by the referenced rules are read oldest first, tagged with
+    # their time, group-by key and value (the value_count field or the referenced rule) and added
+    # to a sliding window. The window keeps the events of the timespan in one queue and counters
+    # per key, so memory is proportional to the events and keys within the timespan. A match is
+    # emitted as soon as the condition becomes true for a key. The same window is implemented in
+    # Python by sigma.backends.powershell.correlation.CorrelationWindow. Events of multiple
+    # referenced rules are read by one EventLogReader per rule and merged oldest first.
+    correlation_methods: ClassVar[Dict[str, str]] = {
+        "default": "Streaming sliding window per group-by key",
+    }
+    correlation_helper_variable: ClassVar[str] = "$CorrelationWindow"
+    correlation_helper_definition: ClassVar[str] = (
+        "{variable} = {{\n"
+        "    param($Window, [long]$Time, [string]$Key, [string]$Value)\n"
+        "    while ($Window.Queue.Count -and $Window.Queue.Peek()[0] -lt $Time - $Window.Span) {{\n"
+        "        $OldTime, $OldKey, $OldValue = $Window.Queue.Dequeue()\n"
+        "        $Group = $Window.Groups[$OldKey]\n"
+        "        $Group.Events -= 1\n"
+        "        $Group.Counts[$OldValue] -= 1\n"
+        "        if ($Group.Counts[$OldValue] -eq 0) {{ $Group.Counts.Remove($OldValue) }}\n"
+        "        if ($Group.Events -eq 0) {{ $Window.Groups.Remove($OldKey) }}\n"
+        "    }}\n"
+        "    $Group = $Window.Groups[$Key]\n"
+        "    if ($null -eq $Group) {{ $Group = @{{Events = 0; Counts = @{{}}; Alerted = $false}}; $Window.Groups[$Key] = $Group }}\n"
+        "    $Window.Queue.Enqueue(@($Time, $Key, $Value))\n"
+        "    $Group.Events += 1\n"
+        "    $Group.Counts[$Value] += 1\n"
+        "    $Count = if ($Window.Distinct) {{ $Group.Counts.PSBase.Count }} else {{ $Group.Events }}\n"
+        "    $Alert = switch ($Window.Operator) {{ gt {{ $Count -gt $Window.Threshold }} gte {{ $Count -ge $Window.Threshold }} lt {{ $Count -lt $Window.Threshold }} lte {{ $Count -le $Window.Threshold }} eq {{ $Count -eq $Window.Threshold }} }}\n"
+        "    if (-not $Alert) {{ $Group.Alerted = $false }} elseif (-not $Group.Alerted) {{ $Group.Alerted = $true; $Count }}\n"
+        "}}"
+    )
+    correlation_window_variable: ClassVar[str] = (
+        "$Window_{hash}"  # Name of the window of a correlation rule with the placeholder {hash}, a digest of the rule
+    )
+    correlation_window_definition: ClassVar[str] = (
+        '{variable} = @{{Span = {span}; Operator = "{operator}"; Threshold = {threshold}; Distinct = {distinct}; '
+        "Queue = [System.Collections.Generic.Queue[object]]::new(); Groups = @{{}}}}"
+    )
+    correlation_time_expression: ClassVar[str] = (
+        "[DateTimeOffset]::Parse($_.TimeCreated).ToUnixTimeSeconds()"
+    )
+    correlation_event_expression: ClassVar[str] = (
+        "[PSCustomObject]@{{Time = {time}; Key = {key}; Value = {value}; Event = $_}}"
+    )
+    correlation_merge_variable: ClassVar[str] = "$MergeWinEvents"
+    correlation_merge_definition: ClassVar[str] = (
+        "{variable} = {{\n"
+        "    param([object[]]$Queries)\n"
+        "    $Readers = @($Queries | ForEach-Object {{ [System.Diagnostics.Eventing.Reader.EventLogReader]::new([System.Diagnostics.Eventing.Reader.EventLogQuery]::new($_[0], 'LogName', $_[1])) }})\n"
+        "    $Heads = @($Readers | ForEach-Object {{ $_.ReadEvent() }})\n"
+        "    while ($true) {{\n"
+        "        $Next = -1\n"
+        "        for ($Index = 0; $Index -lt $Heads.Count; $Index++) {{\n"
+        "            if ($null -ne $Heads[$Index] -and ($Next -lt 0 -or $Heads[$Index].TimeCreated -lt $Heads[$Next].TimeCreated)) {{ $Next = $Index }}\n"
+        "        }}\n"
+        "        if ($Next -lt 0) {{ break }}\n"
+        "        [PSCustomObject]@{{Reader = $Next; Record = $Heads[$Next]}}\n"
+        "        $Heads[$Next] = $Readers[$Next].ReadEvent()\n"
+        "    }}\n"
+        "    $Readers | ForEach-Object {{ $_.Dispose() }}\n"
+        "}}"
+    )  # Merges readers of the events of each referenced rule, oldest first, holding one event per reader
+    correlation_add_expression: ClassVar[str] = (
+        "$Count = & {helper} {window} $_.Time $_.Key $_.Value"
+    )
+    correlation_match_expression: ClassVar[str] = (
+        '[PSCustomObject]@{{RuleId = "{id}"; RuleTitle = "{title}"; GroupBy = $_.Key; Count = $Count; Event = $_.Event}}'
+    )
+
+    def __init__(
+        self,
+        processing_pipeline: Optional[ProcessingPipeline] = None,
+        collect_errors: bool = False,
+        **backend_options: Dict,
+    ):
+        super().__init__(processing_pipeline, collect_errors, **backend_options)
+        if self.backend_options.get("ordinal_ignore_case", self.ordinal_ignore_case):
+            for name, expression in self.ordinal_ignore_case_expressions.items():
+                setattr(self, name, expression)
+            self.filter_chars = ""
+
+    def convert_rule_file(
+        self, path: Path, output_format: Optional[str] = None
+    ) -> Tuple[List[Any], List[Tuple[SigmaRule, SigmaError]]]:
+        """
+        Convert the rules of a single file without finalizing the output, so that the queries of
+        multiple files can be combined with finalize_converted(). Returns the queries and the
+        errors collected while converting the file.
+        """
+        return self.convert_rule_files([path], output_format)[0]
+
+    def convert_rule_files(
+        self, paths: List[Path], output_format: Optional[str] = None
+    ) -> List[Tuple[List[Any], List[Tuple[SigmaRule, SigmaError]]]]:
+        """
+        Convert the rules of files that reference each other, e.g. a correlation rule and the
+        rules it correlates (see references.rule_file_groups), like convert_rule_file(). The
+        files are loaded into one collection, so references between them are resolved. Returns
+        the queries and the errors of each file.
+        """
+        output_format = output_format or self.default_format
+        results = {path: (list(), list()) for path in paths}
+        rule_collection = SigmaCollection.load_ruleset(inputs=paths)
+        self.resolve_rule_references(rule_collection)
+        for rule in rule_collection.rules:
+            errors = len(self.errors)
+            queries, file_errors = results[rule.source.path]
+            queries.extend(
+                self.convert_rule(rule, output_format)
+                if isinstance(rule, SigmaRule)
+                else self.convert_correlation_rule(rule, output_format)
+            )
+            file_errors.extend(self.errors[errors:])
+        return list(results.values())
+
+    def convert(
+        self,
+        rule_collection: SigmaCollection,
+        output_format: Optional[str] = None,
+        correlation_method: Optional[str] = None,
+    ) -> Any:
+        output_format = output_format or self.default_format
+        return self.finalize(
+            self.convert_collection(rule_collection, output_format, correlation_method),
+            output_format,
+        )
+
+    def convert_collection(
+        self,
+        rule_collection: SigmaCollection,
+        output_format: str,
+        correlation_method: Optional[str] = None,
+    ) -> List[Any]:
+        """Convert the rules and correlation rules of a collection like convert(), without
+        finalizing the output."""
+        self.resolve_rule_references(rule_collection)
+        return [
+            query
+            for rule in rule_collection.rules
+            for query in (
+                self.convert_rule(rule, output_format)
+                if isinstance(rule, SigmaRule)
+                else self.convert_correlation_rule(
+                    rule, output_format, correlation_method
+                )
+            )
+        ]
+
+    @staticmethod
+    def resolve_rule_references(rule_collection: SigmaCollection) -> None:
+        """
+        Resolve the rule references of the correlation rules of a collection and order its rules,
+        so that the rules referenced by a correlation rule are converted before it. Otherwise the
+        order of the rules is kept. SigmaCollection.resolve_rule_references() sorts the rules by
+        comparing whether one references the other, which isn't a total order, so a correlation
+        rule can still end up in front of the rules it references.
+        """
+        rule_collection.resolve_rule_references()
+        ordered: List[SigmaRuleBase] = list()
+        seen: Set[int] = set()
+
+        def add(rule: SigmaRuleBase) -> None:
+            if id(rule) in seen:
+                return
+            seen.add(id(rule))
+            if isinstance(rule, SigmaCorrelationRule):
+                for reference in rule.rules:
+                    add(reference.rule)
+            ordered.append(rule)
+
+        for rule in rule_collection.rules:
+            add(rule)
+        rule_collection.rules = ordered
+
+    def convert_snapshot(self, snapshot, output_format: Optional[str] = None) -> Any:
+        """Convert the rules of a RuleSnapshot like convert()."""
+        output_format = output_format or self.default_format
+        return self.finalize_converted(
+            self.convert_snapshot_queries(snapshot, output_format), output_format
+        )
+
+    def convert_snapshot_queries(self, snapshot, output_format: str) -> List[Any]:
+        """
+        Convert the rules of a RuleSnapshot like convert_collection(), without finalizing the
+        output. The rules were already processed by the processing pipeline when the snapshot was
+        taken, so it's replaced by the replay pipeline of the snapshot while converting and only
+        the pipeline of the output format is applied. Errors recorded in the snapshot are
+        collected or raised like conversion errors.
+        """
+        for rule, error in snapshot.errors:
+            if not self.collect_errors:
+                raise error
+            self.errors.append((rule, error))
+        pipelines = (self.backend_processing_pipeline, self.processing_pipeline)
+        self.backend_processing_pipeline = ProcessingPipeline()
+        self.processing_pipeline = snapshot.replay_pipeline(self)
+        try:
+            return self.convert_collection(snapshot.collection(), output_format)
+        finally:
+            self.backend_processing_pipeline, self.processing_pipeline = pipelines
+
+    def rule_eventids(self, rule: SigmaRule, index: int = 0) -> Optional[List[int]]:
+        """Return the EventIDs a converted rule is restricted to or None if it isn't restricted."""
+        eventid = getattr(rule, "eventid", None)
+        if eventid is not None:
+            return [value.number for value in eventid]
+        for arg in self.conjuncts(rule.detection.parsed_condition[index].parsed):
+            eventids = self.condition_eventids(arg)
+            if eventids is not None:
+                return eventids
+        return None
+
+    def finalize_converted(self, queries: List[Any], output_format: str) -> Any:
+        """
+        Finalize queries that were converted with convert_rule() outside of convert(), e.g. by
+        other backend instances in worker processes or loaded from a ConversionCache.
+        """
+        self.last_processing_pipeline = (
+            self.backend_processing_pipeline
+            + self.processing_pipeline
+            + self.output_format_processing_pipeline[output_format]
+        )
+        return self.finalize(queries, output_format)
+
+    def convert_condition(self, cond: ConditionItem, state: ConversionState) -> Any:
+        # All detection items were promoted into the filter of the reader
+        if cond is None:
+            return ""
+        shared = state.processing_state.get(self.shared_state_key)
+        if shared and self.condition_cost(cond) >= self.shared_min_cost:
+            return self.convert_condition_shared(cond, state, shared)
+        expr = super().convert_condition(cond, state)
+        if (
+            isinstance(expr, str)
+            and self.backend_options.get(
+                "share_subexpressions", self.share_subexpressions
+            )
+            and self.condition_cost(cond) >= self.shared_min_cost
+        ):
+            state.processing_state.setdefault(self.subexpressions_state_key, dict())[
+                expr
+            ] = None
+        return expr
+
+    def convert_condition_shared(
+        self, cond: ConditionItem, state: ConversionState, shared: Dict[str, str]
+    ) -> Any:
+        """Convert a condition into the variable of a shared subexpression, if it is one of them.
+        Subexpressions are recorded as converted without shared variables. The definition of a
+        variable is converted when it is referenced first, after the shorter shared
+        subexpressions it references."""
+        variable = shared.get(
+            self.convert_condition(cond, ConversionState(processing_state=dict()))
+        )
+        if variable is None:
+            return super().convert_condition(cond, state)
+        definitions = state.processing_state[self.shared_definitions_state_key]
+        if variable not in definitions:
+            definitions[variable] = super().convert_condition(cond, state)
+        uses = state.processing_state[self.shared_uses_state_key]
+        uses[variable] = uses.get(variable, 0) + 1
+        return variable
+
+    def convert_condition_as_in_expression(
+        self, cond: Union[ConditionOR, ConditionAND], state: ConversionState
+    ) -> Union[str, DeferredQueryExpression]:
+        threshold = self.backend_options.get(
+            "hashset_threshold", self.hashset_threshold
+        )
+        if (
+            threshold is None
+            or not isinstance(cond, ConditionOR)
+            or len(cond.args) < int(threshold)
+        ):
+            return super().convert_condition_as_in_expression(cond, state)
+        values = self.list_separator.join(
+            (
+                self.convert_value_str(arg.value, state)
+                if isinstance(arg.value, SigmaString)
+                else f'"{arg.value}"'
+            )
+            for arg in cond.args
+        )
+        variable = self.define_variable(
+            self.hashset_variable, self.hashset_definition, values, state, list=values
+        )
+        return self.hashset_expression.format(
+            variable=variable, field=self.escape_and_quote_field(cond.args[0].field)
+        )
+
+    def convert_condition_as_regex(
+        self, cond: ConditionOR, state: ConversionState
+    ) -> Optional[str]:
+        """Convert OR-ed string matches of one field into the match of a compiled regex, if enabled
+        by the backend option regex_threshold. Returns None if the condition doesn't qualify.
+        """
+        threshold = self.backend_options.get("regex_threshold", self.regex_threshold)
+        if threshold is None or len(cond.args) < int(threshold):
+            return None
+        if not all(
+            isinstance(arg, ConditionFieldEqualsValueExpression)
+            and arg.field == cond.args[0].field
+            and type(arg.value) is SigmaString
+            and all(isinstance(part, (str, SpecialChars)) for part in arg.value.s)
+            for arg in cond.args
+        ):
+            return None
+        if not any(arg.value.contains_special() for arg in cond.args):
+            return None  # Plain values are converted into in-expressions
+        regex = "|".join(
+            self.convert_value_regex_alternative(arg.value) for arg in cond.args
+        )
+        variable = self.define_variable(
+            self.regex_variable,
+            self.regex_definition,
+            regex,
+            state,
+            regex=regex.replace("'", "''"),
+        )
+        return self.regex_expression.format(
+            variable=variable, field=self.escape_and_quote_field(cond.args[0].field)
+        )
+
+    def convert_condition_field_eq_val_cidr(
+        self, cond: ConditionFieldEqualsValueExpression, state: ConversionState
+    ) -> Union[str, DeferredQueryExpression]:
+        cidr = self.convert_condition_as_cidr_table([cond], state)
+        if cidr is not None:
+            return cidr
+        return super().convert_condition_field_eq_val_cidr(cond, state)
+
+    def convert_condition_as_cidr_table(
+        self, args: List[ConditionItem], state: ConversionState
+    ) -> Optional[str]:
+        """Convert OR-ed CIDR matches of one field into a lookup in a table of address ranges, if
+        enabled by the backend option native_cidr. Returns None if not all operands are CIDR
+        matches of the same field."""
+        if not self.backend_options.get("native_cidr", self.native_cidr):
+            return None
+        if not all(
+            isinstance(arg, ConditionFieldEqualsValueExpression)
+            and isinstance(arg.value, SigmaCIDRExpression)
+            and arg.field == args[0].field
+            for arg in args
+        ):
+            return None
+        ranges = list()
+        for arg in args:
+            network = arg.value.network
+            start = int(network.network_address)
+            if network.version == 4:
+                start += self.cidr_ipv4_mapped
+            ranges.append((start, start + network.num_addresses - 1))
+        merged = list()
+        for start, end in sorted(ranges):
+            if merged and start <= merged[-1][1] + 1:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        starts = self.list_separator.join(f"'{start}'" for start, _ in merged)
+        ends = self.list_separator.join(f"'{end}'" for _, end in merged)
+        helper = self.define_variable(
+            self.cidr_helper_variable, self.cidr_helper_definition, "", state
+        )
+        table = self.define_variable(
+            self.cidr_table_variable,
+            self.cidr_table_definition,
+            starts + ends,
+            state,
+            starts=starts,
+            ends=ends,
+        )
+        return self.cidr_expression_native.format(
+            helper=helper, field=self.escape_and_quote_field(args[0].field), table=table
+        )
+
+    def convert_condition_val(
+        self, cond: ConditionValueExpression, state: ConversionState
+    ) -> Union[str, DeferredQueryExpression]:
+        keywords = self.convert_condition_as_keywords([cond], state)
+        if keywords is not None:
+            return keywords
+        return super().convert_condition_val(cond, state)
+
+    def convert_condition_as_keywords(
+        self, args: List[ConditionItem], state: ConversionState
+    ) -> Optional[str]:
+        """Convert OR-ed keywords into the match of one compiled regex against the values of all
+        fields. Returns None if not all operands are keywords."""
+        if not all(
+            isinstance(arg, ConditionValueExpression)
+            and isinstance(
+                arg.value, (SigmaString, SigmaNumber, SigmaRegularExpression)
+            )
+            and not isinstance(arg.value, SigmaTimestampPart)
+            for arg in args
+        ):
+            return None
+        regex = "|".join(
+            (
+                f"(?:{arg.value.regexp})"
+                if isinstance(arg.value, SigmaRegularExpression)
+                else (
+                    self.convert_value_regex_alternative(arg.value, anchored=False)
+                    if isinstance(arg.value, SigmaString)
+                    else self.regex_escape_pattern.sub(r"\\\1", str(arg.value))
+                )
+            )
+            for arg in args
+        )
+        variable = self.define_variable(
+            self.keyword_variable,
+            self.keyword_definition,
+            regex,
+            state,
+            regex=regex.replace("'", "''"),
+        )
+        return self.keyword_expression.format(variable=variable)
+
+    def convert_value_regex_alternative(
+        self, value: SigmaString, anchored: bool = True
+    ) -> str:
+        """Convert a string with wildcards into a regex. If anchored, the regex is anchored at the
+        ends without a leading or trailing multi-character wildcard. Keywords are matched anywhere
+        in the text, so they aren't anchored."""
+        parts = list(value.s)
+        start = "\\A" if anchored else ""
+        end = "\\z" if anchored else ""
+        if parts and parts[0] == SpecialChars.WILDCARD_MULTI:
+            parts.pop(0)
+            start = ""
+        if parts and parts[-1] == SpecialChars.WILDCARD_MULTI:
+            parts.pop()
+            end = ""
+        return (
+            start
+            + "".join(
+                (
+                    self.regex_escape_pattern.sub(r"\\\1", part)
+                    if isinstance(part, str)
+                    else ".*" if part == SpecialChars.WILDCARD_MULTI else "."
+                )
+                for part in parts
+            )
+            + end
+        )
+
+    def define_variable(
+        self,
+        name: str,
+        definition: str,
+        content: str,
+        state: ConversionState,
+        **kwargs: str,
+    ) -> str:
+        """Add the definition of a variable named by a digest of its content to the definitions
+        of the rule and return the name of the variable."""
+        variable = name.format(hash=sha1(content.encode()).hexdigest()[:8])
+        state.processing_state.setdefault(self.definitions_state_key, dict())[
+            variable
+        ] = definition.format(variable=variable, **kwargs)
+        return variable
+
+    def definitions(self, query: str, state: ConversionState) -> List[str]:
+        """Return the definitions of the variables used by a query."""
+        return [
+            definition
+            for variable, definition in state.processing_state.get(
+                self.definitions_state_key, {}
+            ).items()
+            if variable in query
+        ]
+
+    def convert_condition_and(
+        self, cond: ConditionAND, state: ConversionState
+    ) -> Union[str, DeferredQueryExpression]:
+        return super().convert_condition_and(self.ordered_condition(cond, state), state)
+
+    def convert_condition_not(
+        self, cond: ConditionNOT, state: ConversionState
+    ) -> Union[str, DeferredQueryExpression]:
+        # -not binds tighter than comparison operators like -eq or -in, so the negated expression
+        # is grouped unless it's already a group, e.g. -not ($_.EventID -eq 4688).
+        expr = super().convert_condition_not(cond, state)
+        if not isinstance(expr, str) or not expr.startswith(self.not_token):
+            return expr
+        negated = expr[len(self.not_token) :]
+        if self.is_group(negated):
+            return expr
+        return self.not_token + self.group_expression.format(expr=negated)
+
+    @staticmethod
+    def is_group(expr: str) -> bool:
+        """Check if an expression is enclosed in a single pair of parentheses, ignoring
+        parentheses in quoted strings."""
+        if not expr.startswith("(") or not expr.endswith(")"):
+            return False
+        depth = 0
+        quote = None
+        for index, char in enumerate(expr):
+            if quote is not None:
+                if char == quote:
+                    quote = None
+            elif char in "\"'":
+                quote = char
+            elif char == "(":
+                depth += 1
+            elif char == ")":
+                depth -= 1
+                if depth == 0 and index < len(expr) - 1:
+                    return False
+        return depth == 0
+
+    def convert_condition_or(
+        self, cond: ConditionOR, state: ConversionState
+    ) -> Union[str, DeferredQueryExpression]:
+        cond = self.ordered_condition(cond, state)
+        merged = (
+            self.convert_condition_as_keywords(cond.args, state)
+            or self.convert_condition_as_regex(cond, state)
+            or self.convert_condition_as_cidr_table(cond.args, state)
+        )
+        if merged is not None:
+            return merged
+        return super().convert_condition_or(cond, state)
+
+    def ordered_condition(
+        self, cond: Union[ConditionAND, ConditionOR], state: ConversionState
+    ) -> Union[ConditionAND, ConditionOR]:
+        """Return a copy of an AND or OR condition with its operands ordered by order_operands.
+        The parsed condition of the rule isn't changed, as it's converted again, e.g. into other
+        output formats or with shared subexpressions."""
+        args = self.order_operands(cond, cond.args, state)
+        if args is cond.args:
+            return cond
+        ordered = copy(cond)
+        ordered.args = args
+        return ordered
+
+    def order_operands(
+        self,
+        cond: Union[ConditionAND, ConditionOR],
+        args: List[ConditionItem],
+        state: ConversionState,
+    ) -> List[ConditionItem]:
+        """Order the operands of an AND or OR condition by their estimated cost per decision, if
+        enabled by the backend option reorder_operands. An operand of an AND decides the result if
+        it's false, an operand of an OR if it's true."""
+        if not self.backend_options.get("reorder_operands", self.reorder_operands):
+            return args
+
+        def rank(arg: ConditionItem) -> float:
+            cost, selectivity = self.operand_cost(arg, state)
+            decisive = (
+                1 - selectivity if isinstance(cond, ConditionAND) else selectivity
+            )
+            return cost / max(decisive, 1e-6)
+
+        return sorted(args, key=rank)
+
+    def operand_cost(
+        self,
+        cond: Union[
+            ConditionItem, ConditionFieldEqualsValueExpression, ConditionValueExpression
+        ],
+        state: ConversionState,
+    ) -> Tuple[int, float]:
+        """Return the estimated cost and selectivity of an operand."""
+        if isinstance(cond, ConditionNOT):
+            cost, selectivity = self.operand_cost(cond.args[0], state)
+            return cost, 1 - selectivity
+        if isinstance(cond, (ConditionAND, ConditionOR)):
+            costs = [self.operand_cost(arg, state) for arg in cond.args]
+            unselected = 1.0
+            selected = 1.0
+            for _, selectivity in costs:
+                unselected *= 1 - selectivity
+                selected *= selectivity
+            return sum(cost for cost, _ in costs), (
+                selected if isinstance(cond, ConditionAND) else 1 - unselected
+            )
+
+        selectivity = self.operand_selectivity
+        if self.selectivities:
+            # The predicate is converted like it was recorded by scripts/evaluate.py, without
+            # going through convert_condition, which computes costs for shared subexpressions.
+            try:
+                predicate = super().convert_condition(
+                    cond, ConversionState(processing_state=dict())
+                )
+            except SigmaError:
+                predicate = None
+            selectivity = self.selectivities.get(predicate, selectivity)
+        return self.condition_cost(cond), selectivity
+
+    def condition_cost(
+        self,
+        cond: Union[
+            ConditionItem, ConditionFieldEqualsValueExpression, ConditionValueExpression
+        ],
+    ) -> int:
+        """Return the estimated cost of evaluating a condition for an event."""
+        if isinstance(cond, (ConditionNOT, ConditionAND, ConditionOR)):
+            return sum(self.condition_cost(arg) for arg in cond.args)
+        cost = self.value_cost(cond.value)
+        if isinstance(cond, ConditionValueExpression):
+            cost = max(cost, self.operand_costs["contains"])
+        return cost
+
+    def value_cost(self, value: SigmaType) -> int:
+        if isinstance(value, SigmaExpansion):
+            return sum(
+                self.value_cost(expanded_value) for expanded_value in value.values
+            )
+        if isinstance(value, SigmaRegularExpression):
+            return self.operand_costs["regex"]
+        if isinstance(value, SigmaCIDRExpression):
+            return self.operand_costs["wildcard"]
+        if not isinstance(value, SigmaString):
+            return self.operand_costs["eq"]
+        wildcards = [
+            index
+            for index, part in enumerate(value.s)
+            if isinstance(part, SpecialChars)
+        ]
+        last = len(value.s) - 1
+        if not wildcards:
+            return self.operand_costs["eq"]
+        if any(value.s[index] != SpecialChars.WILDCARD_MULTI for index in wildcards):
+            return self.operand_costs["wildcard"]
+        if wildcards == [last]:
+            return self.operand_costs["startswith"]
+        if wildcards == [0]:
+            return self.operand_costs["endswith"]
+        if wildcards == [0, last] and last == 2:
+            return self.operand_costs["contains"]
+        return self.operand_costs["wildcard"]
+
+    @cached_property
+    def selectivities(self) -> Dict[str, float]:
+        """Selectivity of converted predicates from the JSON file written by
+        scripts/evaluate.py, given by the backend option selectivity_stats."""
+        path = self.backend_options.get("selectivity_stats")
+        if path is None:
+            return {}
+        with open(path) as stats_file:
+            stats = load(stats_file)
+        counts = defaultdict(lambda: [0, 0])
+        for rule in stats["rules"]:
+            for predicate in rule["predicates"]:
+                counts[predicate["predicate"]][0] += predicate["matches"]
+                counts[predicate["predicate"]][1] += rule["events"]
+        return {
+            predicate: matches / events
+            for predicate, (matches, events) in counts.items()
+            if events
+        }
+
+    def finalize_query_default(
+        self, rule: SigmaRule, query: Any, index: int, state: ConversionState
+    ) -> Any:
+        reader = (
+            self.reader_filter(rule)
+            + " | "
+            + self.read_winevent(
+                self.condition_fields([rule.detection.parsed_condition[index].parsed])
+            )
+        )
+        if not query:
+            return reader
+        return f"{reader} | Where-Object {{{query}}}"
+
+    def reader_filter(self, rule: SigmaRule) -> str:
+        """Return the Get-WinEvent parameters selecting the channel, the EventIDs promoted by the
+        pipeline and the time window of a rule."""
+        eventid = getattr(rule, "eventid", None)
+        filters = [f'LogName = "{rule.logsource.service}"']
+        if eventid is not None:
+            filters.append(f"Id = {', '.join(str(value) for value in eventid)}")
+        time_window = self.backend_options.get("time_window", self.time_window)
+        if time_window is not None:
+            start_time = self.time_window_start_expression.format(seconds=time_window)
+            filters.append(f"StartTime = {start_time}")
+        if len(filters) > 1:
+            return f"-FilterHashTable @{{{'; '.join(filters)}}}"
+        return f'-LogName "{rule.logsource.service}"'
+
+    def finalize_query_xpath(
+        self, rule: SigmaRule, query: Any, index: int, state: ConversionState
+    ) -> Any:
+        """
+        Split the condition of the rule into an XPath filter evaluated by the event log service
+        and the remaining predicates evaluated by Where-Object. The remaining predicates are
+        converted again as the query passed in still contains the pushed down ones.
+        """
+        cond = rule.detection.parsed_condition[index].parsed
+        pushed = list()
+        remaining = list()
+        for arg in self.conjuncts(cond):
+            xpath = self.convert_condition_xpath(arg)
+            if xpath is None:
+                remaining.append(arg)
+            else:
+                pushed.append((arg, xpath))
+
+        reader = f'-LogName "{rule.logsource.service}"'
+        time_window = self.xpath_time_window()
+        if time_window is not None:
+            pushed.append((None, time_window))
+        if pushed:
+            xpath = self.xpath_query_expression.format(
+                expr=self.xpath_and_token.join(
+                    (
+                        self.xpath_group_expression.format(expr=expr)
+                        if len(pushed) > 1 and isinstance(arg, ConditionOR)
+                        else expr
+                    )
+                    for arg, expr in pushed
+                )
+            )
+            reader += f' -FilterXPath "{self.escape_powershell_string(xpath)}"'
+        reader += " | " + self.read_winevent(self.condition_fields(remaining))
+        if not remaining:
+            return reader
+
+        where = self.convert_conjuncts(cond, remaining, state)
+        return f"{reader} | Where-Object {{{where}}}"
+
+    def finalize_output_xpath(self, queries: List[str]) -> List[str]:
+        return list(queries)
+
+    def read_winevent(self, fields: Optional[Iterable[str]]) -> str:
+        """Return the Read-WinEvent command reading the given fields, or all fields if fields is
+        None or field projection is disabled."""
+        if fields is None or not self.backend_options.get(
+            "project_fields", self.project_fields
+        ):
+            return self.read_winevent_expression
+        return self.read_winevent_projection_expression.format(
+            fields=", ".join(
+                f'"{self.escape_powershell_string(field)}"' for field in fields
+            )
+            or "@()"
+        )
+
+    def condition_fields(
+        self, conds: Iterable[Optional[ConditionItem]]
+    ) -> Optional[List[str]]:
+        """Return the EventData fields referenced by conditions, or None if all fields are
+        needed, e.g. by keywords or fields that can't be projected."""
+        fields = dict()
+        stack = [cond for cond in reversed(list(conds)) if cond is not None]
+        while stack:
+            cond = stack.pop()
+            if isinstance(cond, ConditionValueExpression):
+                return None
+            if not isinstance(cond, ConditionFieldEqualsValueExpression):
+                stack.extend(reversed(cond.args))
+                continue
+            names = [cond.field]
+            if isinstance(cond.value, SigmaFieldReference):
+                names.append(cond.value.field)
+            for name in names:
+                name = name.removeprefix(self.xpath_field_prefix)
+                if not self.xpath_field_pattern.match(name):
+                    return None
+                if (
+                    name.lower() not in self.xpath_system_fields
+                    and name.lower() not in self.read_winevent_system_fields
+                ):
+                    fields[name] = None
+        return list(fields)
+
+    def xpath_time_window(self) -> Optional[str]:
+        """Return the XPath restricting events to the time window or None if it's disabled."""
+        time_window = self.backend_options.get("time_window", self.time_window)
+        if time_window is None:
+            return None
+        return self.xpath_time_window_expression.format(
+            milliseconds=int(float(time_window) * 1000)
+        )
+
+    def finalize_query(
+        self,
+        rule: SigmaRule,
+        query: Any,
+        index: int,
+        state: ConversionState,
+        output_format: str,
+    ) -> Any:
+        # Correlation queries are complete pipelines with their own readers
+        if isinstance(rule, SigmaCorrelationRule):
+            return query
+        # Rules of the script and evtx formats are embedded into one reader by
+        # finalize_output_script or finalize_output_evtx, so the per-query postprocessing that turns each query into a
+        # standalone Get-WinEvent command doesn't apply.
+        if output_format in ("script", "evtx"):
+            return self.finalize_query_script(rule, query, index, state)
+        query = super().finalize_query(rule, query, index, state, output_format)
+        return "\n".join(self.definitions(query, state) + [query])
+
+    def convert_correlation_event_count_rule(
+        self,
+        rule: SigmaCorrelationRule,
+        output_format: Optional[str] = None,
+        method: str = "default",
+    ) -> List[str]:
+        return self.convert_correlation_window(rule, output_format)
+
+    def convert_correlation_value_count_rule(
+        self,
+        rule: SigmaCorrelationRule,
+        output_format: Optional[str] = None,
+        method: str = "default",
+    ) -> List[str]:
+        return self.convert_correlation_window(rule, output_format)
+
+    def convert_correlation_temporal_rule(
+        self,
+        rule: SigmaCorrelationRule,
+        output_format: Optional[str] = None,
+        method: str = "default",
+    ) -> List[str]:
+        return self.convert_correlation_window(rule, output_format)
+
+    def convert_correlation_rule(
+        self,
+        rule: SigmaCorrelationRule,
+        output_format: Optional[str] = None,
+        method: Optional[str] = None,
+    ) -> List[Any]:
+        # Collect errors of correlation rules like those of rules (see convert_rule)
+        try:
+            return super().convert_correlation_rule(rule, output_format, method)
+        except SigmaError as error:
+            if not self.collect_errors:
+                raise
+            self.errors.append((rule, error))
+            return []
+
+    def convert_correlation_window(
+        self, rule: SigmaCorrelationRule, output_format: Optional[str] = None
+    ) -> List[str]:
+        """
+        Convert a correlation rule into a pipeline that reads the events of the referenced rules
+        oldest first and adds them to a sliding window (see CorrelationWindow). Archived EVTX
+        files are scanned in parallel by the evtx format, so their events can't be correlated in
+        order.
+        """
+        if output_format == "evtx":
+            raise SigmaConversionError(
+                "Correlation rules aren't supported by the evtx output format",
+                source=rule.source,
+            )
+        window = CorrelationWindow.from_correlation_rule(rule)
+        state = ConversionState()
+        helper = self.define_variable(
+            self.correlation_helper_variable,
+            self.correlation_helper_definition,
+            "",
+            state,
+        )
+        variable = self.define_variable(
+            self.correlation_window_variable,
+            self.correlation_window_definition,
+            str(rule.id or rule.name or rule.title),
+            state,
+            span=str(window.timespan),
+            operator=window.operator,
+            threshold=str(window.threshold),
+            distinct=self.bool_values[window.distinct],
+        )
+        definitions = list(state.processing_state[self.definitions_state_key].values())
+
+        readers = list()
+        for reference in rule.rules:
+            referenced_rule = reference.rule
+            if not isinstance(referenced_rule, SigmaRule):
+                raise SigmaConversionError(
+                    "Correlation rules referencing correlation rules aren't supported",
+                    source=rule.source,
+                )
+            key_fields = [
+                self.correlation_field(rule, reference, field)
+                for field in rule.group_by or []
+            ]
+            value_fields = list()
+            if rule.type == SigmaCorrelationType.VALUE_COUNT:
+                value_fields.append(
+                    self.correlation_field(rule, reference, rule.condition.fieldref)
+                )
+                value = f"[string]{value_fields[0]}"
+            elif rule.type == SigmaCorrelationType.TEMPORAL:
+                value = f'"{self.escape_powershell_string(reference.reference)}"'
+            else:
+                value = '""'
+            event = self.correlation_event_expression.format(
+                time=self.correlation_time_expression,
+                key='"{}"'.format("|".join(f"$({field})" for field in key_fields)),
+                value=value,
+            )
+            for index, (query, query_state) in enumerate(
+                zip(
+                    referenced_rule.get_conversion_result(),
+                    referenced_rule.get_conversion_states(),
+                )
+            ):
+                fields = self.condition_fields(
+                    [referenced_rule.detection.parsed_condition[index].parsed]
+                )
+                if fields is not None:
+                    fields = list(
+                        dict.fromkeys(
+                            fields
+                            + [
+                                field.removeprefix(self.xpath_field_prefix)
+                                for field in key_fields + value_fields
+                            ]
+                        )
+                    )
+                readers.append((referenced_rule, query, event, fields))
+                definitions.extend(self.definitions(query or "", query_state))
+
+        lines = list(dict.fromkeys(definitions))
+        if len(readers) == 1:
+            referenced_rule, query, event, fields = readers[0]
+            reader = f"Get-WinEvent {self.reader_filter(referenced_rule)} -Oldest | {self.read_winevent(fields)}"
+            if query:
+                reader += f" | Where-Object {{{query}}}"
+            lines.append(f"{reader} | ForEach-Object {{ {event} }} | ForEach-Object {{")
+        else:
+            # The events of multiple readers are merged as they are read instead of sorting all
+            # of them, so memory stays bounded by the events within the timespan.
+            merge = self.define_variable(
+                self.correlation_merge_variable,
+                self.correlation_merge_definition,
+                "",
+                state,
+            )
+            lines.append(state.processing_state[self.definitions_state_key][merge])
+            lines.append(f"& {merge} @(")
+            lines.extend(
+                f'    ,@("{self.escape_powershell_string(str(referenced_rule.logsource.service))}", "{self.reader_xpath(referenced_rule)}")'
+                for referenced_rule, _, _, _ in readers
+            )
+            all_fields = (
+                None
+                if any(fields is None for _, _, _, fields in readers)
+                else list(
+                    dict.fromkeys(
+                        field for _, _, _, fields in readers for field in fields
+                    )
+                )
+            )
+            lines.append(") | ForEach-Object {")
+            lines.append("    $Reader = $_.Reader")
+            lines.append(
+                f"    $_.Record | {self.read_winevent(all_fields)} | ForEach-Object {{"
+            )
+            for index, (_, query, event, _) in enumerate(readers):
+                keyword = "elseif" if index else "if"
+                match = f"if ({query}) {{ {event} }}" if query else event
+                lines.append(f"        {keyword} ($Reader -eq {index}) {{ {match} }}")
+            lines.append("    }")
+            lines.append("} | ForEach-Object {")
+        match = self.correlation_match_expression.format(
+            id=self.escape_powershell_string(str(rule.id or "")),
+            title=self.escape_powershell_string(rule.title or ""),
+        )
+        lines.append(
+            "    "
+            + self.correlation_add_expression.format(helper=helper, window=variable)
+        )
+        lines.append(f"    if ($Count) {{ {match} }}")
+        lines.append("}")
+        return ["\n".join(lines)]
+
+    def correlation_field(
+        self,
+        rule: SigmaCorrelationRule,
+        reference: SigmaRuleReference,
+        name: str,
+    ) -> str:
+        """Return the field of a referenced rule that a group-by or value_count field of a
+        correlation rule refers to, resolving field aliases."""
+        alias = rule.aliases.aliases.get(name)
+        if alias is None:
+            return name
+        return alias.mapping.get(reference, name)
+
+    def finalize_query_script(
+        self, rule: SigmaRule, query: Any, index: int, state: ConversionState
+    ) -> PowerShellRuleQuery:
+        """Split the EventID constraint used for dispatching from the condition of the rule."""
+        cond = rule.detection.parsed_condition[index].parsed
+        eventids, remaining = self.split_eventids(cond)
+        if eventids is not None:
+            # Only the subexpressions of the remaining operands are shared with other rules
+            state.processing_state.pop(self.subexpressions_state_key, None)
+        condition = (
+            query
+            if eventids is None
+            else self.convert_conjuncts(cond, remaining, state)
+        )
+        return PowerShellRuleQuery(
+            rule=rule,
+            logname=str(rule.logsource.service),
+            eventids=eventids,
+            condition=condition,
+            definitions=self.definitions(condition or "", state),
+            subexpressions=list(
+                state.processing_state.get(self.subexpressions_state_key, {})
+            ),
+            index=index,
+            fields=self.condition_fields([cond]),
+            cost=sum(self.condition_cost(arg) for arg in remaining if arg is not None),
+        )
+
+    def finalize_output_script(self, queries: List[PowerShellRuleQuery]) -> str:
+        """
+        Build one script that reads each channel once. Rules constrained to EventIDs are
+        dispatched through a hashtable keyed by EventID, all other rules are evaluated for every
+        event of the channel. Correlation rules are appended as pipelines reading their own
+        events.
+        """
+        channels: Dict[str, List[PowerShellRuleQuery]] = dict()
+        correlations = list()
+        for query in queries:
+            if isinstance(query, str):
+                correlations.append(query)
+            else:
+                channels.setdefault(query.logname, list()).append(query)
+        bookmarks = self.backend_options.get("bookmarks", self.bookmarks)
+        return "\n".join(
+            (
+                [self.bookmark_directory_expression.format(directory=bookmarks)]
+                if bookmarks is not None and channels
+                else []
+            )
+            + [
+                self.convert_channel_script(logname, channel_queries)
+                for logname, channel_queries in channels.items()
+            ]
+            + correlations
+        )
+
+    def finalize_output_evtx(self, queries: List[PowerShellRuleQuery]) -> str:
+        """
+        Build one script that scans EVTX files given by -Path or by a manifest written by
+        scripts/evtx_manifest.py in parallel. Events are dispatched by channel and EventID to the
+        rules and every match is tagged with the file, the rule id and the title.
+        """
+        channels: Dict[str, List[PowerShellRuleQuery]] = dict()
+        for query in queries:
+            channels.setdefault(query.logname, list()).append(query)
+        lines = self.evtx_prologue.format(
+            throttle_limit=self.backend_options.get(
+                "evtx_throttle_limit", self.evtx_throttle_limit
+            )
+        ).splitlines()
+        block = list(
+            dict.fromkeys(
+                definition for query in queries for definition in query.definitions
+            )
+        )
+        reader = list()
+        for index, (logname, channel_queries) in enumerate(channels.items()):
+            tables, body, _ = self.convert_dispatch_script(
+                channel_queries,
+                self.evtx_dispatch_variable.format(index=index),
+                self.evtx_any_event_variable.format(index=index),
+                self.evtx_match_expression,
+            )
+            block.append(f"# {logname}")
+            block.extend(tables)
+            reader.append(
+                f'{"elseif" if index else "if"} ($_.Channel -eq "{self.escape_powershell_string(logname)}") {{'
+            )
+            reader.extend(f"    {line}" for line in body)
+            reader.append("}")
+        block.append(
+            self.evtx_reader.format(
+                read_winevent=self.read_winevent(self.queries_fields(queries))
+            )
+        )
+        block.extend(f"    {line}" for line in reader)
+        block.append("}")
+        lines.extend(f"    {line}" for line in block)
+        lines.append("}")
+        return "\n".join(lines)
+
+    def convert_channel_script(
+        self, logname: str, queries: List[PowerShellRuleQuery]
+    ) -> str:
+        """Emit the dispatch tables and the reader of a single channel."""
+        bookmarks = self.backend_options.get("bookmarks", self.bookmarks) is not None
+        lines = [f"# {logname}"]
+        if bookmarks:
+            lines.extend(
+                self.bookmark_prologue.format(
+                    name=re.sub(r"\W", "_", logname), logname=logname
+                ).splitlines()
+            )
+        lines.extend(
+            dict.fromkeys(
+                definition for query in queries for definition in query.definitions
+            )
+        )
+        tables, body, dispatch = self.convert_dispatch_script(
+            queries,
+            self.script_dispatch_variable,
+            self.script_any_event_variable,
+            self.script_match_expression,
+        )
+        lines.extend(tables)
+
+        reader = f'Get-WinEvent -LogName "{logname}"'
+        xpath = list()
+        # The event log service only has to return dispatched EventIDs
+        if dispatch is not None:
+            xpath.append(
+                self.xpath_or_token.join(
+                    self.xpath_system_expression.format(
+                        field="EventID", operator=self.xpath_eq_token, value=eventid
+                    )
+                    for eventid in dispatch
+                )
+            )
+        time_window = self.xpath_time_window()
+        if time_window is not None:
+            xpath.append(time_window)
+        if bookmarks:
+            xpath.append(self.xpath_bookmark_expression)
+        if xpath:
+            reader += f' -FilterXPath "{self.xpath_query(xpath)}"'
+        # Get-WinEvent fails if no event was written since the previous run
+        if bookmarks:
+            reader += " -ErrorAction SilentlyContinue"
+        lines.append(
+            f"{reader} | {self.read_winevent(self.queries_fields(queries))} | ForEach-Object {{"
+        )
+        lines.extend(f"    {line}" for line in body)
+        lines.append("}")
+        if bookmarks:
+            lines.append(self.bookmark_epilogue)
+        return "\n".join(lines)
+
+    def xpath_query(self, xpath: List[str]) -> str:
+        """Return the XPath query of events matching all of the XPath expressions."""
+        if not xpath:
+            return "*"
+        return self.xpath_query_expression.format(
+            expr=self.xpath_and_token.join(
+                (
+                    self.xpath_group_expression.format(expr=expr)
+                    if len(xpath) > 1 and self.xpath_or_token in expr
+                    else expr
+                )
+                for expr in xpath
+            )
+        )
+
+    def reader_xpath(self, rule: SigmaRule) -> str:
+        """Return the XPath query selecting the EventIDs promoted by the pipeline and the time
+        window of a rule, like reader_filter()."""
+        xpath = list()
+        eventid = getattr(rule, "eventid", None)
+        if eventid is not None:
+            xpath.append(
+                self.xpath_or_token.join(
+                    self.xpath_system_expression.format(
+                        field="EventID", operator=self.xpath_eq_token, value=value
+                    )
+                    for value in eventid
+                )
+            )
+        time_window = self.xpath_time_window()
+        if time_window is not None:
+            xpath.append(time_window)
+        return self.xpath_query(xpath)
+
+    @staticmethod
+    def queries_fields(queries: List[PowerShellRuleQuery]) -> Optional[List[str]]:
+        """Return the fields read by any of the queries, or None if one reads all fields."""
+        if any(query.fields is None for query in queries):
+            return None
+        return list(dict.fromkeys(field for query in queries for field in query.fields))
+
+    def convert_dispatch_script(
+        self,
+        queries: List[PowerShellRuleQuery],
+        dispatch_variable: str,
+        any_event_variable: str,
+        match_expression: str,
+    ) -> Tuple[List[str], List[str], Optional[List[int]]]:
+        """
+        Emit the hashtable dispatch_variable with the rules of each EventID and the script block
+        any_event_variable with the rules that aren't constrained to EventIDs. Returns the lines
+        defining them, the lines evaluating them for an event and the dispatched EventIDs, or
+        None if there are rules evaluated for every event.
+        """
+        dispatch: Dict[int, List[PowerShellRuleQuery]] = dict()
+        any_event = list()
+        for query in queries:
+            if query.eventids is None:
+                any_event.append(query)
+            else:
+                for eventid in query.eventids:
+                    dispatch.setdefault(eventid, list()).append(query)
+
+        lines = list()
+        body = list()
+        if dispatch:
+            lines.append(f"{dispatch_variable} = @{{")
+            for eventid, eventid_queries in dispatch.items():
+                lines.append(f'    "{eventid}" = {{')
+                lines.extend(
+                    self.convert_block_script(
+                        eventid_queries, "        ", match_expression
+                    )
+                )
+                lines.append("    }")
+            lines.append("}")
+            body.append(
+                f"if ({dispatch_variable}.ContainsKey($_.EventID)) {{ . {dispatch_variable}[$_.EventID] }}"
+            )
+        if any_event:
+            lines.append(f"{any_event_variable} = {{")
+            lines.extend(self.convert_block_script(any_event, "    ", match_expression))
+            lines.append("}")
+            body.append(f". {any_event_variable}")
+        return lines, body, None if any_event else list(dispatch)
+
+    def convert_block_script(
+        self,
+        queries: List[PowerShellRuleQuery],
+        indent: str,
+        match_expression: Optional[str] = None,
+    ) -> List[str]:
+        """Emit the rules evaluated for the same events, preceded by the subexpressions they
+        share."""
+        definitions, conditions = self.share_block_subexpressions(queries)
+        return [f"{indent}{definition}" for definition in definitions] + [
+            self.convert_rule_script(query, indent, condition, match_expression)
+            for query, condition in zip(queries, conditions)
+        ]
+
+    def share_block_subexpressions(
+        self, queries: List[PowerShellRuleQuery]
+    ) -> Tuple[List[str], List[Optional[str]]]:
+        """
+        Convert subexpressions that occur in the conditions of multiple rules into variables, if
+        enabled by the backend option share_subexpressions. The conditions of the rules using
+        them are converted again with the shared subexpressions substituted in the condition
+        tree, so a shared subexpression can itself reference shorter ones. Variables that end up
+        being referenced once, e.g. because they only occur within a longer shared subexpression,
+        aren't worth their definition and are dropped, longest first. Returns the definitions of
+        the variables, in the order they have to be evaluated, and the conditions of the rules.
+        """
+        conditions = [query.condition for query in queries]
+        if not self.backend_options.get(
+            "share_subexpressions", self.share_subexpressions
+        ):
+            return [], conditions
+        users: Dict[str, int] = dict()
+        for query in queries:
+            for expr in query.subexpressions:
+                users[expr] = users.get(expr, 0) + 1
+        shared = {
+            expr: self.shared_variable.format(hash=sha1(expr.encode()).hexdigest()[:8])
+            for expr, count in users.items()
+            if count >= 2
+        }
+        while shared:
+            processing_state = {
+                self.shared_state_key: shared,
+                self.shared_definitions_state_key: dict(),
+                self.shared_uses_state_key: dict(),
+            }
+            conditions = [
+                (
+                    self.convert_query_condition(
+                        query, ConversionState(processing_state=processing_state)
+                    )
+                    if any(expr in shared for expr in query.subexpressions)
+                    else query.condition
+                )
+                for query in queries
+            ]
+            uses = processing_state[self.shared_uses_state_key]
+            unused = [
+                expr for expr, variable in shared.items() if uses.get(variable, 0) < 2
+            ]
+            if not unused:
+                definitions = processing_state[self.shared_definitions_state_key]
+                return [
+                    self.shared_definition.format(variable=variable, expr=expr)
+                    for variable, expr in definitions.items()
+                ], conditions
+            del shared[max(unused, key=len)]
+        return [], [query.condition for query in queries]
+
+    def convert_query_condition(
+        self, query: PowerShellRuleQuery, state: ConversionState
+    ) -> Optional[str]:
+        """Convert the condition of a query again, e.g. with shared subexpressions."""
+        cond = query.rule.detection.parsed_condition[query.index].parsed
+        eventids, remaining = self.split_eventids(cond)
+        if eventids is None:
+            return self.convert_condition(cond, state)
+        return self.convert_conjuncts(cond, remaining, state)
+
+    def convert_rule_script(
+        self,
+        query: PowerShellRuleQuery,
+        indent: str,
+        condition: Optional[str] = None,
+        match_expression: Optional[str] = None,
+    ) -> str:
+        """Emit the condition check of a single rule that outputs a tagged match. condition
+        overrides the condition of the query, e.g. with shared subexpressions replaced.
+        """
+        match = (match_expression or self.script_match_expression).format(
+            id=self.escape_powershell_string(str(query.rule.id or "")),
+            title=self.escape_powershell_string(query.rule.title or ""),
+        )
+        condition = condition or query.condition
+        if condition is None:
+            return f"{indent}{match}"
+        return f"{indent}if ({condition}) {{ {match} }}"
+
+    def convert_conjuncts(
+        self,
+        cond: ConditionItem,
+        conjuncts: List[ConditionItem],
+        state: ConversionState,
+    ) -> Optional[str]:
+        """Convert a subset of the operands yielded by conjuncts(cond) into an AND expression.
+        Returns None if no operands are left."""
+        if not conjuncts:
+            return None
+        conjuncts_state = ConversionState(processing_state=state.processing_state)
+        conjuncts = self.order_operands(cond, conjuncts, conjuncts_state)
+        return self.and_token.join(
+            (
+                self.convert_condition(arg, conjuncts_state)
+                if len(conjuncts) == 1 or self.compare_precedence(cond, arg)
+                else self.convert_condition_group(arg, conjuncts_state)
+            )
+            for arg in conjuncts
+        )
+
+    def condition_eventids(self, cond: ConditionItem) -> Optional[List[int]]:
+        """Return the EventIDs if the condition is an EventID equality or an OR of them."""
+        if isinstance(cond, ConditionOR):
+            eventids = [self.condition_eventids(arg) for arg in cond.args]
+            if any(arg_eventids is None for arg_eventids in eventids):
+                return None
+            return [eventid for arg_eventids in eventids for eventid in arg_eventids]
+        if (
+            isinstance(cond, ConditionFieldEqualsValueExpression)
+            and cond.field.removeprefix(self.xpath_field_prefix).lower() == "eventid"
+            and isinstance(cond.value, SigmaNumber)
+        ):
+            return [cond.value.number]
+        return None
+
+    def split_eventids(
+        self, cond: ConditionItem
+    ) -> Tuple[Optional[List[int]], List[ConditionItem]]:
+        """Split the first AND-ed EventID constraint from the other operands of a condition.
+        Returns the EventIDs, None if there is no such constraint, and the other operands.
+        """
+        eventids = None
+        remaining = list()
+        for arg in self.conjuncts(cond):
+            arg_eventids = self.condition_eventids(arg) if eventids is None else None
+            if arg_eventids is None:
+                remaining.append(arg)
+            else:
+                eventids = arg_eventids
+        return eventids, remaining
+
+    def conjuncts(self, cond: ConditionItem) -> Iterator[ConditionItem]:
+        """Yield the operands of a (nested) AND condition or the condition itself."""
+        if isinstance(cond, ConditionAND):
+            for arg in cond.args:
+                yield from self.conjuncts(arg)
+        else:
+            yield cond
+
+    def convert_condition_xpath(self, cond: ConditionItem) -> Optional[str]:
+        """Convert a condition into an event log XPath expression. Returns None if the condition
+        can't be evaluated by the event log service."""
+        if isinstance(cond, (ConditionAND, ConditionOR)):
+            converted = [self.convert_condition_xpath(arg) for arg in cond.args]
+            if any(expr is None for expr in converted):
+                return None
+            token = (
+                self.xpath_and_token
+                if isinstance(cond, ConditionAND)
+                else self.xpath_or_token
+            )
+            return token.join(
+                (
+                    self.xpath_group_expression.format(expr=expr)
+                    if isinstance(arg, (ConditionAND, ConditionOR))
+                    else expr
+                )
+                for arg, expr in zip(cond.args, converted)
+            )
+        elif isinstance(cond, ConditionFieldEqualsValueExpression):
+            return self.convert_condition_field_xpath(cond)
+        else:  # NOT isn't supported by the event log XPath subset, keywords need full-text search
+            return None
+
+    def convert_condition_field_xpath(
+        self, cond: ConditionFieldEqualsValueExpression
+    ) -> Optional[str]:
+        """Convert a field/value comparison into an XPath expression or return None."""
+        field = cond.field.removeprefix(self.xpath_field_prefix)
+        if not self.xpath_field_pattern.match(field):
+            return None
+
+        if isinstance(cond.value, SigmaCompareExpression):
+            operator = self.xpath_compare_operators[cond.value.op]
+            value = str(cond.value.number)
+        else:
+            operator = self.xpath_eq_token
+            value = self.convert_value_xpath(cond.value)
+            if value is None:
+                return None
+
+        system_field = self.xpath_system_fields.get(field.lower())
+        if system_field is not None:
+            return self.xpath_system_expression.format(
+                field=system_field, operator=operator, value=value
+            )
+        return self.xpath_eventdata_expression.format(
+            field=field, operator=operator, value=value
+        )
+
+    def convert_value_xpath(self, value: Any) -> Optional[str]:
+        """Convert a plain number or string into an XPath literal or return None."""
+        if isinstance(value, SigmaNumber):
+            return str(value)
+        if not isinstance(value, SigmaString) or value.contains_special():
+            return None
+        plain = value.to_plain()
+        case_sensitive = self.backend_options.get(
+            "xpath_case_sensitive", self.xpath_case_sensitive
+        )
+        if not case_sensitive and plain.lower() != plain.upper():
+            return None
+        if "'" not in plain:
+            return f"'{plain}'"
+        if '"' not in plain:
+            return f'"{plain}"'
+        return None  # XPath 1.0 literals can't contain both quote characters
+
+    @staticmethod
+    def escape_powershell_string(value: str) -> str:
+        """Escape a value for use inside a double-quoted PowerShell string."""
+        return re.sub('([`$"])', "`\\1", value)
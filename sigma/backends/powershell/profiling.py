@@ -0,0 +1,147 @@
+from dataclasses import asdict, dataclass
+from functools import wraps
+from heapq import nlargest
+from inspect import getattr_static, isfunction
+from sigma.processing.pipeline import ProcessingItem, QueryPostprocessingItem
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type
+
+from .powershell import PowerShellBackend
+
+
+@dataclass
+class ProfileStats:
+    """Call count, cumulative and maximum time of a processing item or backend method."""
+
+    calls: int = 0
+    total: float = 0.0
+    max: float = 0.0
+
+
+class ConversionProfiler:
+    """
+    Context manager that records the time spent in each processing item, in each
+    convert_condition_* method of the backend and in the conversion of each rule:
+
+        with ConversionProfiler() as profiler:
+            backend.convert(rules)
+        print(profiler.table())
+
+    The methods are only instrumented while the context is entered and are restored on exit, so
+    conversions outside of a profiler run the original methods without any overhead.
+    """
+
+    def __init__(
+        self,
+        backend_class: Type[PowerShellBackend] = PowerShellBackend,
+        rules: int = 10,
+    ):
+        self.backend_class = backend_class
+        self.rules = rules
+        self.items: Dict[str, ProfileStats] = dict()
+        self.methods: Dict[str, ProfileStats] = dict()
+        self.rule_times: List[Tuple[str, Optional[str], ProfileStats]] = list()
+        self.originals: List[Tuple[type, str, Optional[Callable]]] = list()
+
+    def __enter__(self) -> "ConversionProfiler":
+        for item_class in (ProcessingItem, QueryPostprocessingItem):
+            self.instrument(item_class, "apply", self.item_stats)
+        for method in dir(self.backend_class):
+            if method.startswith("convert_condition") and isfunction(
+                getattr_static(self.backend_class, method)
+            ):
+                self.instrument(self.backend_class, method, self.method_stats(method))
+        self.instrument(self.backend_class, "convert_rule", self.rule_stats)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        for cls, method, original in reversed(self.originals):
+            if original is None:
+                delattr(cls, method)
+            else:
+                setattr(cls, method, original)
+        self.originals.clear()
+
+    def instrument(
+        self,
+        cls: type,
+        method: str,
+        stats: Callable[[Any, tuple], ProfileStats],
+    ) -> None:
+        """Replace a method of a class by a wrapper that records the time of calls into the stats
+        returned by stats(self, args). Nested calls of the same method on the same object are
+        counted, but their time is only recorded once by the outermost call."""
+        self.originals.append((cls, method, cls.__dict__.get(method)))
+        function = getattr(cls, method)
+        active = set()
+
+        @wraps(function)
+        def profiled(obj, *args, **kwargs):
+            if id(obj) in active:
+                stats(obj, args).calls += 1
+                return function(obj, *args, **kwargs)
+            active.add(id(obj))
+            start = perf_counter()
+            try:
+                return function(obj, *args, **kwargs)
+            finally:
+                duration = perf_counter() - start
+                active.discard(id(obj))
+                call_stats = stats(obj, args)
+                call_stats.calls += 1
+                call_stats.total += duration
+                call_stats.max = max(call_stats.max, duration)
+
+        setattr(cls, method, profiled)
+
+    def item_stats(self, item: Any, args: tuple) -> ProfileStats:
+        name = item.identifier or type(item.transformation).__name__
+        if isinstance(item, QueryPostprocessingItem):
+            name = "postprocessing:" + name
+        return self.items.setdefault(name, ProfileStats())
+
+    def method_stats(self, method: str) -> Callable[[Any, tuple], ProfileStats]:
+        return lambda backend, args: self.methods.setdefault(method, ProfileStats())
+
+    def rule_stats(self, backend: Any, args: tuple) -> ProfileStats:
+        rule = args[0]
+        stats = ProfileStats()
+        self.rule_times.append(
+            (rule.title, str(rule.id) if rule.id is not None else None, stats)
+        )
+        return stats
+
+    def slowest_rules(self) -> List[Tuple[str, Optional[str], ProfileStats]]:
+        return nlargest(self.rules, self.rule_times, key=lambda rule: rule[2].total)
+
+    def to_dict(self) -> dict:
+        return {
+            "processing_items": {
+                name: asdict(stats) for name, stats in self.items.items()
+            },
+            "methods": {name: asdict(stats) for name, stats in self.methods.items()},
+            "slowest_rules": [
+                {"title": title, "id": rule_id, "time": stats.total}
+                for title, rule_id, stats in self.slowest_rules()
+            ],
+        }
+
+    def table(self) -> str:
+        lines = [f"{'':<48}{'calls':>10}{'total (s)':>12}{'max (ms)':>12}"]
+        for heading, stats in (
+            ("processing items", self.items),
+            ("backend methods", self.methods),
+        ):
+            lines.append(heading)
+            for name, item_stats in sorted(
+                stats.items(), key=lambda item: -item[1].total
+            ):
+                lines.append(
+                    f"  {name:<46}{item_stats.calls:>10}{item_stats.total:>12.3f}{item_stats.max * 1000:>12.3f}"
+                )
+        lines.append("slowest rules")
+        for title, rule_id, stats in self.slowest_rules():
+            lines.append(
+                f"  {title[:46]:<46}{'':>10}{stats.total:>12.3f}  {rule_id or ''}"
+            )
+        return "\n".join(lines)
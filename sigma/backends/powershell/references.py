@@ -0,0 +1,70 @@
+from pathlib import Path
+from typing import Dict, List, Optional
+import re
+import yaml
+
+# Rule files are scanned for correlation rules and the names and ids of rules without parsing
+# them, as only a few files contain correlation rules. Sigma rules are block-style YAML
+# documents, so their attributes start at the beginning of a line.
+correlation_pattern = re.compile(rb"^correlation:", re.MULTILINE)
+identifier_pattern = re.compile(rb"^(?:id|name):[ \t]*[\"']?([^\"'\s#]+)", re.MULTILINE)
+
+
+def correlation_references(content: bytes) -> List[str]:
+    """Return the names and ids of the rules referenced by the correlation rules of a file."""
+    if not correlation_pattern.search(content):
+        return []
+    try:
+        documents = list(yaml.safe_load_all(content))
+    except yaml.YAMLError:
+        return []  # raised again when the file is converted
+    return [
+        str(reference)
+        for document in documents
+        if isinstance(document, dict) and isinstance(document.get("correlation"), dict)
+        for reference in document["correlation"].get("rules") or []
+    ]
+
+
+def rule_file_groups(
+    paths: List[Path], contents: Optional[List[bytes]] = None
+) -> List[List[Path]]:
+    """
+    Group rule files that have to be converted together, because correlation rules of one file
+    reference rules of another. Files without such references are groups of their own. Groups
+    are ordered by their first file and keep the order of paths.
+    """
+    if contents is None:
+        contents = [path.read_bytes() for path in paths]
+    references = [correlation_references(content) for content in contents]
+    groups = list(range(len(paths)))
+
+    def find(index: int) -> int:
+        while groups[index] != index:
+            groups[index] = groups[groups[index]]
+            index = groups[index]
+        return index
+
+    if any(references):
+        identifiers: Dict[str, List[int]] = dict()
+        for index, content in enumerate(contents):
+            for identifier in identifier_pattern.findall(content):
+                identifiers.setdefault(identifier.decode(), list()).append(index)
+        for index, file_references in enumerate(references):
+            for reference in file_references:
+                for other in identifiers.get(reference, []):
+                    groups[find(other)] = find(index)
+    grouped: Dict[int, List[Path]] = dict()
+    for index, path in enumerate(paths):
+        grouped.setdefault(find(index), list()).append(path)
+    return list(grouped.values())
+
+
+def group_content(path: Path, group: List[Path], contents: Dict[Path, bytes]) -> bytes:
+    """Content identifying the conversion result of a rule file, e.g. as key of a cache entry.
+    The result of a file in a group also depends on the other files of the group."""
+    content = contents[path]
+    for other in group:
+        if other != path:
+            content += b"\0" + contents[other]
+    return content
@@ -0,0 +1,273 @@
+from contextlib import contextmanager
+from copy import deepcopy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from json import dumps
+from pathlib import Path
+from queue import Queue
+from sigma.collection import SigmaCollection
+from sigma.exceptions import SigmaError
+from sigma.pipelines.powershell import powershell_pipeline
+from socketserver import ThreadingMixIn, UnixStreamServer
+from threading import Event, Lock, Thread
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple, Union
+from urllib.parse import parse_qs, urlsplit
+from yaml import YAMLError
+from .powershell import PowerShellBackend
+from .references import rule_file_groups
+
+
+def default_backend() -> PowerShellBackend:
+    # Transformations keep a reference to the pipeline that applies them, so each backend of the
+    # pool gets its own copy of the shared pipeline.
+    return PowerShellBackend(
+        processing_pipeline=deepcopy(powershell_pipeline()), collect_errors=True
+    )
+
+
+class BackendPool:
+    """Backends with a warm processing pipeline that are handed out to one request at a time, as
+    a backend keeps conversion state (e.g., collected errors) while converting a rule. A backend
+    that raised an unexpected exception may be left in the middle of a conversion, so it's
+    replaced by a new one.
+    """
+
+    def __init__(self, size: int, factory: Callable[[], PowerShellBackend]):
+        self.factory = factory
+        self.backends: Queue = Queue()
+        for _ in range(size):
+            self.backends.put(factory())
+
+    @contextmanager
+    def backend(self) -> Iterator[PowerShellBackend]:
+        backend = self.backends.get()
+        try:
+            yield backend
+        except (SigmaError, YAMLError):
+            backend.errors.clear()
+            self.backends.put(backend)
+            raise
+        except BaseException:
+            self.backends.put(self.factory())
+            raise
+        else:
+            backend.errors.clear()
+            self.backends.put(backend)
+
+
+class RuleDirectoryWatcher:
+    """
+    Keeps the converted queries of all rule files below a path. refresh() only converts files
+    that were added or changed (by modification time and size) since the last refresh and drops
+    the queries of deleted files. Files with correlation rules are converted together with the
+    files of the rules they reference, so a change of any of them converts all of them again.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        backend: PowerShellBackend,
+        output_format: str = "default",
+    ):
+        self.path = Path(path)
+        self.backend = backend
+        self.output_format = output_format
+        self.signatures: Dict[Path, Tuple[int, int]] = dict()
+        self.files: Dict[Path, Tuple[List[Any], List[str]]] = dict()
+        self.groups: Set[Tuple[Path, ...]] = set()
+        self.lock = Lock()
+
+    def refresh(self) -> List[Path]:
+        """Convert added and changed rule files and return their paths."""
+        changed = list()
+        with self.lock:
+            paths = sorted(set(SigmaCollection.resolve_paths([self.path])))
+            signatures = dict()
+            for path in paths:
+                stat = path.stat()
+                signatures[path] = (stat.st_mtime_ns, stat.st_size)
+            if signatures == self.signatures:
+                return changed
+            groups = {tuple(group) for group in rule_file_groups(paths)}
+            for group in sorted(groups):
+                if group in self.groups and all(
+                    self.signatures.get(path) == signatures[path] for path in group
+                ):
+                    continue
+                try:
+                    results = [
+                        (queries, [str(error) for _, error in errors])
+                        for queries, errors in self.backend.convert_rule_files(
+                            list(group), self.output_format
+                        )
+                    ]
+                except (SigmaError, YAMLError) as error:
+                    results = [([], [str(error)])] + [([], [])] * (len(group) - 1)
+                self.backend.errors.clear()
+                self.files.update(zip(group, results))
+                changed.extend(group)
+            for path in set(self.files) - set(paths):
+                del self.files[path]
+            self.signatures = signatures
+            self.groups = groups
+        return sorted(changed)
+
+    def output(self) -> dict:
+        """Return the finalized queries and the errors of all rule files."""
+        with self.lock:
+            return {
+                "queries": self.backend.finalize_converted(
+                    [query for queries, _ in self.files.values() for query in queries],
+                    self.output_format,
+                ),
+                "errors": [
+                    error for _, errors in self.files.values() for error in errors
+                ],
+            }
+
+
+class ThreadingUnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    pass
+
+
+class ConversionRequestHandler(BaseHTTPRequestHandler):
+    """
+    POST /convert[?output=<format>] converts the rule YAML in the request body.
+    GET /rules returns the queries of the watched rules directory.
+    GET /health returns the status of the server.
+    """
+
+    def do_GET(self) -> None:
+        path = urlsplit(self.path).path
+        watcher = self.server.conversion_server.watcher
+        if path == "/health":
+            self.respond(200, {"status": "ok"})
+        elif path == "/rules" and watcher is not None:
+            self.respond(200, watcher.output())
+        else:
+            self.respond(404, {"error": f"not found: {path}"})
+
+    def do_POST(self) -> None:
+        url = urlsplit(self.path)
+        if url.path != "/convert":
+            self.respond(404, {"error": f"not found: {url.path}"})
+            return
+        conversion_server = self.server.conversion_server
+        output_format = parse_qs(url.query).get(
+            "output", [conversion_server.output_format]
+        )[0]
+        if output_format not in PowerShellBackend.formats:
+            self.respond(400, {"error": f"unknown output format: {output_format}"})
+            return
+        content = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        try:
+            result = conversion_server.convert(content.decode(), output_format)
+        except (SigmaError, YAMLError, UnicodeDecodeError) as error:
+            self.respond(400, {"error": str(error)})
+            return
+        except Exception as error:
+            self.respond(500, {"error": f"{type(error).__name__}: {error}"})
+            return
+        self.respond(200, result)
+
+    def respond(self, status: int, body: dict) -> None:
+        content = dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def address_string(self) -> str:
+        # Unix socket clients don't have an address
+        return self.client_address[0] if self.client_address else "local"
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+class ConversionServer:
+    """
+    Long-running conversion server that keeps warm backends in memory and converts rules sent
+    over HTTP on localhost or on a Unix socket:
+
+        with ConversionServer(socket="/run/sigma2powershell.sock", workers=4) as server:
+            server.serve_forever()
+
+    Requests are handled by one thread each and converted by one of the backends of the pool. If
+    rules is given, the rule files below it are converted at startup and checked for changes
+    every interval seconds.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 8080,
+        socket: Optional[Union[str, Path]] = None,
+        workers: int = 4,
+        output_format: str = "default",
+        rules: Optional[Union[str, Path]] = None,
+        interval: float = 2.0,
+        backend_factory: Callable[[], PowerShellBackend] = default_backend,
+    ):
+        self.output_format = output_format
+        self.pool = BackendPool(workers, backend_factory)
+        self.watcher = (
+            RuleDirectoryWatcher(rules, backend_factory(), output_format)
+            if rules is not None
+            else None
+        )
+        self.interval = interval
+        self.stopped = Event()
+        if socket is not None:
+            Path(socket).unlink(missing_ok=True)
+            self.http_server = ThreadingUnixHTTPServer(
+                str(socket), ConversionRequestHandler
+            )
+        else:
+            self.http_server = ThreadingHTTPServer(
+                (host, port), ConversionRequestHandler
+            )
+        self.http_server.daemon_threads = True
+        # Request handlers only know the socket server they were accepted by
+        self.http_server.conversion_server = self
+
+    @property
+    def address(self) -> Union[str, Tuple[str, int]]:
+        return self.http_server.server_address
+
+    def __enter__(self) -> "ConversionServer":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def convert(self, content: str, output_format: str) -> dict:
+        """Convert the rules of a YAML document and return the queries and the errors."""
+        rule_collection = SigmaCollection.from_yaml(content)
+        with self.pool.backend() as backend:
+            queries = backend.convert_collection(rule_collection, output_format)
+            return {
+                "queries": backend.finalize_converted(queries, output_format),
+                "errors": [str(error) for _, error in backend.errors],
+            }
+
+    def watch(self) -> None:
+        while not self.stopped.wait(self.interval):
+            self.watcher.refresh()
+
+    def serve_forever(self) -> None:
+        if self.watcher is not None:
+            self.watcher.refresh()
+            Thread(target=self.watch, daemon=True).start()
+        self.http_server.serve_forever()
+
+    def shutdown(self) -> None:
+        """Stop serve_forever(), e.g. from another thread."""
+        self.stopped.set()
+        self.http_server.shutdown()
+
+    def close(self) -> None:
+        self.stopped.set()
+        self.http_server.server_close()
+        if isinstance(self.http_server, UnixStreamServer):
+            Path(self.http_server.server_address).unlink(missing_ok=True)
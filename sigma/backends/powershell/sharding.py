@@ -0,0 +1,183 @@
+from dataclasses import dataclass, field
+from heapq import heapreplace
+from json import dump, load
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+from .powershell import PowerShellBackend, PowerShellRuleQuery
+
+# Estimated cost of reading an event of a channel with Get-WinEvent and Read-WinEvent, in units
+# of PowerShellBackend.operand_costs. It's paid once per channel and shard.
+CHANNEL_READ_COST = 10
+# Estimated cost of dispatching an event to a rule, paid in addition to its condition
+RULE_COST = 1
+
+
+@dataclass
+class Shard:
+    """Rules of the script format deployed together, grouped by channel."""
+
+    index: int
+    channels: Dict[str, List[PowerShellRuleQuery]] = field(default_factory=dict)
+    correlations: List[str] = field(default_factory=list)
+    cost: float = 0.0
+
+    @property
+    def queries(self) -> List[Any]:
+        return [
+            query for queries in self.channels.values() for query in queries
+        ] + self.correlations
+
+
+def read_channel_weights(path: Union[str, Path]) -> Dict[str, float]:
+    """Read the relative event volume of channels from a JSON object mapping channel names to
+    weights, e.g. {"Security": 20, "Microsoft-Windows-Sysmon/Operational": 50}. Channels that
+    aren't listed have a weight of 1."""
+    with open(path) as weights_file:
+        return {
+            channel: float(weight) for channel, weight in load(weights_file).items()
+        }
+
+
+def build_shards(
+    queries: List[Any],
+    shards: int,
+    weights: Optional[Dict[str, float]] = None,
+    read_cost: float = CHANNEL_READ_COST,
+) -> List[Shard]:
+    """
+    Distribute the queries of the script format over shards with similar estimated cost per
+    event. The cost of a channel is its weight times the cost of reading an event and
+    evaluating the rules of the channel. Rules of a channel are kept together, so each shard
+    reads a channel once, and the channels are assigned largest first to the least loaded
+    shard. As long as it lowers the cost of the most loaded shard, the channel of its largest
+    part is split into one more part of similar cost, which is assigned to a shard that doesn't
+    read the channel yet. Correlation pipelines read their own events and are assigned like a
+    channel read.
+    """
+    weights = weights or {}
+    channels: Dict[str, List[PowerShellRuleQuery]] = dict()
+    correlations = list()
+    for query in queries:
+        if isinstance(query, PowerShellRuleQuery):
+            channels.setdefault(query.logname, list()).append(query)
+        else:
+            correlations.append(query)
+    shards = max(shards, 1)
+    parts = {channel: 1 for channel in channels}
+    result = pack_shards(channels, parts, correlations, shards, weights, read_cost)
+    while True:
+        largest = max(result, key=lambda shard: shard.cost)
+        candidates = sorted(
+            (
+                channel
+                for channel in largest.channels
+                if parts[channel] < min(shards, len(channels[channel]))
+            ),
+            key=lambda channel: -rules_cost(largest.channels[channel]),
+        )
+        for channel in candidates:
+            trial = pack_shards(
+                channels,
+                {**parts, channel: parts[channel] + 1},
+                correlations,
+                shards,
+                weights,
+                read_cost,
+            )
+            if max(shard.cost for shard in trial) < largest.cost:
+                parts[channel] += 1
+                result = trial
+                break
+        else:
+            return result
+
+
+def rules_cost(queries: List[PowerShellRuleQuery]) -> float:
+    """Estimated cost of evaluating the rules for an event of their channel."""
+    return sum(RULE_COST + query.cost for query in queries)
+
+
+def pack_shards(
+    channels: Dict[str, List[PowerShellRuleQuery]],
+    parts: Dict[str, int],
+    correlations: List[str],
+    shards: int,
+    weights: Dict[str, float],
+    read_cost: float,
+) -> List[Shard]:
+    """Split the rules of each channel into the given number of parts of similar cost and assign
+    the parts largest first to the least loaded shard that doesn't read the channel yet.
+    """
+    items: List[Tuple[float, Optional[str], List[Any]]] = list()
+    for channel, channel_queries in channels.items():
+        loads: List[List[PowerShellRuleQuery]] = [list() for _ in range(parts[channel])]
+        heap = [(0.0, index) for index in range(parts[channel])]
+        for query in sorted(channel_queries, key=lambda query: -query.cost):
+            load, index = heap[0]
+            loads[index].append(query)
+            heapreplace(heap, (load + RULE_COST + query.cost, index))
+        weight = weights.get(channel, 1.0)
+        items.extend(
+            (weight * (read_cost + rules_cost(part)), channel, part) for part in loads
+        )
+    items.extend((read_cost, None, [query]) for query in correlations)
+
+    result = [Shard(index) for index in range(1, shards + 1)]
+    for cost, channel, part in sorted(items, key=lambda item: -item[0]):
+        shard = min(
+            (
+                shard
+                for shard in result
+                if channel is None or channel not in shard.channels
+            ),
+            key=lambda shard: shard.cost,
+        )
+        if channel is None:
+            shard.correlations.extend(part)
+        else:
+            shard.channels[channel] = part
+        shard.cost += cost
+    return result
+
+
+def write_shards(
+    backend: PowerShellBackend,
+    shards: List[Shard],
+    directory: Union[str, Path],
+    weights: Optional[Dict[str, float]] = None,
+) -> List[Path]:
+    """Write each shard as script shard-<index>.ps1 and its manifest shard-<index>.json into
+    directory. Returns the paths of the scripts."""
+    weights = weights or {}
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    paths = list()
+    for shard in shards:
+        path = directory / f"shard-{shard.index}.ps1"
+        path.write_text(backend.finalize_converted(shard.queries, "script") + "\n")
+        manifest = {
+            "shard": shard.index,
+            "script": path.name,
+            "cost": round(shard.cost, 2),
+            "channels": [
+                {
+                    "channel": channel,
+                    "weight": weights.get(channel, 1.0),
+                    "rules": [
+                        {
+                            "id": str(query.rule.id) if query.rule.id else None,
+                            "title": query.rule.title,
+                            "eventids": query.eventids,
+                            "cost": RULE_COST + query.cost,
+                        }
+                        for query in queries
+                    ],
+                }
+                for channel, queries in shard.channels.items()
+            ],
+            "correlations": len(shard.correlations),
+        }
+        with open(directory / f"shard-{shard.index}.json", "w") as manifest_file:
+            dump(manifest, manifest_file, indent=2)
+        paths.append(path)
+    return paths
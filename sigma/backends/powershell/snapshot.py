@@ -0,0 +1,483 @@
+from dataclasses import dataclass, field, fields
+from hashlib import sha256
+from inspect import getsource
+from pathlib import Path
+from sigma.collection import SigmaCollection
+from sigma.conditions import SigmaCondition
+from sigma.correlations import (
+    SigmaCorrelationCondition,
+    SigmaCorrelationFieldAlias,
+    SigmaCorrelationFieldAliases,
+    SigmaCorrelationRule,
+    SigmaCorrelationTimespan,
+    SigmaRuleReference,
+)
+from sigma.exceptions import SigmaConfigurationError, SigmaError, SigmaRuleLocation
+from sigma.processing.pipeline import ProcessingItem, ProcessingPipeline
+from sigma.processing.transformations import Transformation
+from sigma.rule import (
+    SigmaDetection,
+    SigmaDetectionItem,
+    SigmaDetections,
+    SigmaLogSource,
+    SigmaRule,
+    SigmaRuleBase,
+)
+from sys import modules
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+from .powershell import PowerShellBackend
+import pickle
+
+# Attributes of rules that aren't kept in snapshots: the location of the rule file is kept as
+# path, the others are only set while a rule is converted.
+excluded_attributes = frozenset(
+    (
+        "source",
+        "errors",
+        "applied_processing_items",
+        "_backreferences",
+        "_conversion_result",
+        "_conversion_states",
+        "_output",
+    )
+)
+
+
+class Record:
+    """Base class of the records of a snapshot. Records are pickled as a tuple of their slots,
+    so the names of the slots aren't repeated for every record."""
+
+    __slots__ = ()
+
+    def __init__(self, *values: Any):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+
+    def __getstate__(self) -> Tuple[Any, ...]:
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state: Tuple[Any, ...]) -> None:
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+
+class DetectionItemRecord(Record):
+    """Detection item with the values that result from its modifiers and the pipeline."""
+
+    __slots__ = ("field", "modifiers", "value", "value_linking", "applied")
+
+    @classmethod
+    def from_detection_item(cls, item: SigmaDetectionItem) -> "DetectionItemRecord":
+        return cls(
+            item.field,
+            item.modifiers,
+            item.value,
+            item.value_linking,
+            frozenset(item.applied_processing_items),
+        )
+
+    def build(self, source: Optional[SigmaRuleLocation]) -> SigmaDetectionItem:
+        item = SigmaDetectionItem(
+            self.field,
+            list(self.modifiers),
+            list(self.value),
+            self.value_linking,
+            source,
+            auto_modifiers=False,
+        )
+        item.applied_processing_items = set(self.applied)
+        return item
+
+
+class DetectionRecord(Record):
+    """Detection of detection items and nested detections."""
+
+    __slots__ = ("items", "item_linking")
+
+    @classmethod
+    def from_detection(cls, detection: SigmaDetection) -> "DetectionRecord":
+        return cls(
+            [
+                (
+                    cls.from_detection(item)
+                    if isinstance(item, SigmaDetection)
+                    else DetectionItemRecord.from_detection_item(item)
+                )
+                for item in detection.detection_items
+            ],
+            detection.item_linking,
+        )
+
+    def build(self, source: Optional[SigmaRuleLocation]) -> SigmaDetection:
+        return SigmaDetection(
+            [item.build(source) for item in self.items], source, self.item_linking
+        )
+
+
+@dataclass
+class SnapshotCondition(SigmaCondition):
+    """
+    Condition of a rule built from a snapshot. The condition string is parsed into a tree of
+    condition items whenever the condition is accessed, which takes most of the time of
+    converting a rule, so the parse tree is pickled when the snapshot is taken and unpickled
+    instead. If the pipeline of the output format changes the condition, it's parsed again.
+    """
+
+    tree: Optional[bytes] = field(default=None, compare=False, repr=False)
+    tree_condition: Optional[str] = field(
+        init=False, default=None, compare=False, repr=False
+    )
+
+    def __post_init__(self):
+        self.tree_condition = self.condition
+
+    def parse(self, postprocess: bool = True):
+        if self.tree is None or self.condition != self.tree_condition:
+            return super().parse(postprocess)
+        # Postprocessing links the condition items to the detections, so each access needs its
+        # own copy of the tree.
+        parsed = pickle.loads(self.tree)
+        if postprocess:
+            return parsed.postprocess(self.detections, source=self.source)
+        return parsed
+
+    @staticmethod
+    def parse_tree(
+        condition: SigmaCondition, trees: Dict[str, Optional[bytes]]
+    ) -> Optional[bytes]:
+        """Pickled parse tree of a condition or None if it can't be parsed, which is raised
+        when the rule is converted."""
+        if condition.condition not in trees:
+            try:
+                trees[condition.condition] = pickle.dumps(
+                    condition.parse(postprocess=False),
+                    protocol=pickle.HIGHEST_PROTOCOL,
+                )
+            except SigmaError:
+                trees[condition.condition] = None
+        return trees[condition.condition]
+
+
+class RuleRecord(Record):
+    """
+    Rule after the processing pipeline was applied. Besides the detections and conditions, it
+    keeps the metadata of the rule, the attributes that transformations added to the rule (e.g.,
+    the EventIDs promoted by PromoteDetectionItemTransformation) and the pipeline state.
+    """
+
+    __slots__ = (
+        "metadata",
+        "logsource",
+        "detections",
+        "conditions",
+        "applied",
+        "attributes",
+        "state",
+        "path",
+    )
+
+    @classmethod
+    def from_rule(
+        cls,
+        rule: SigmaRule,
+        state: Dict[str, Any],
+        trees: Dict[str, Optional[bytes]],
+    ) -> "RuleRecord":
+        """Record a rule. trees caches the parse trees of condition strings, so rules with the
+        same condition share its parse tree in the snapshot."""
+        logsource = rule.logsource
+        return cls(
+            rule_metadata(rule),
+            (logsource.category, logsource.product, logsource.service),
+            {
+                name: DetectionRecord.from_detection(detection)
+                for name, detection in rule.detection.detections.items()
+            },
+            [
+                (
+                    condition.condition,
+                    SnapshotCondition.parse_tree(condition, trees),
+                    frozenset(condition.applied_processing_items),
+                )
+                for condition in rule.detection.parsed_condition
+            ],
+            frozenset(rule.applied_processing_items),
+            rule_attributes(rule),
+            dict(state),
+            rule_path(rule),
+        )
+
+    def build(self) -> SigmaRule:
+        source = SigmaRuleLocation(self.path) if self.path is not None else None
+        detections = SigmaDetections(
+            {name: record.build(source) for name, record in self.detections.items()},
+            [condition for condition, _, _ in self.conditions],
+            source,
+        )
+        detections.parsed_condition = [
+            SnapshotCondition(condition, detections, source, tree)
+            for condition, tree, _ in self.conditions
+        ]
+        for condition, (_, _, applied) in zip(
+            detections.parsed_condition, self.conditions
+        ):
+            condition.applied_processing_items = set(applied)
+        rule = SigmaRule(
+            **self.metadata,
+            logsource=SigmaLogSource(*self.logsource),
+            detection=detections,
+            source=source,
+        )
+        rule.applied_processing_items = set(self.applied)
+        for name, value in self.attributes.items():
+            setattr(rule, name, value)
+        rule.snapshot_state = self.state
+        return rule
+
+
+class CorrelationRecord(Record):
+    """Correlation rule after the processing pipeline was applied to its fields."""
+
+    __slots__ = (
+        "metadata",
+        "type",
+        "rules",
+        "generate",
+        "timespan",
+        "group_by",
+        "aliases",
+        "condition",
+        "applied",
+        "state",
+        "path",
+    )
+
+    @classmethod
+    def from_rule(
+        cls, rule: SigmaCorrelationRule, state: Dict[str, Any]
+    ) -> "CorrelationRecord":
+        condition = rule.condition
+        return cls(
+            rule_metadata(rule),
+            rule.type,
+            [reference.reference for reference in rule.rules],
+            rule.generate,
+            rule.timespan.spec,
+            rule.group_by,
+            {
+                alias.alias: {
+                    reference.reference: field
+                    for reference, field in alias.mapping.items()
+                }
+                for alias in rule.aliases
+            },
+            (
+                (condition.op, condition.count, condition.fieldref)
+                if condition is not None
+                else None
+            ),
+            frozenset(rule.applied_processing_items),
+            dict(state),
+            rule_path(rule),
+        )
+
+    def build(self) -> SigmaCorrelationRule:
+        source = SigmaRuleLocation(self.path) if self.path is not None else None
+        rule = SigmaCorrelationRule(
+            **self.metadata,
+            type=self.type,
+            rules=[SigmaRuleReference(reference) for reference in self.rules],
+            generate=self.generate,
+            timespan=SigmaCorrelationTimespan(self.timespan),
+            group_by=self.group_by,
+            aliases=SigmaCorrelationFieldAliases(
+                {
+                    alias: SigmaCorrelationFieldAlias(
+                        alias,
+                        {
+                            SigmaRuleReference(reference): field
+                            for reference, field in mapping.items()
+                        },
+                    )
+                    for alias, mapping in self.aliases.items()
+                }
+            ),
+            condition=(
+                SigmaCorrelationCondition(*self.condition)
+                if self.condition is not None
+                else None
+            ),
+            source=source,
+        )
+        rule.applied_processing_items = set(self.applied)
+        rule.snapshot_state = self.state
+        return rule
+
+
+def rule_metadata(rule: SigmaRuleBase) -> Dict[str, Any]:
+    """Fields of the rule base (title, id, level, tags etc.) that are set."""
+    metadata = {
+        field.name: getattr(rule, field.name)
+        for field in fields(SigmaRuleBase)
+        if field.init and field.name not in excluded_attributes
+    }
+    return {
+        name: value
+        for name, value in metadata.items()
+        if value is not None and not (isinstance(value, (list, dict)) and not value)
+    }
+
+
+def rule_attributes(rule: SigmaRule) -> Dict[str, Any]:
+    """Attributes that transformations added to a rule."""
+    names = {field.name for field in fields(SigmaRule)} | {"snapshot_state"}
+    return {name: value for name, value in vars(rule).items() if name not in names}
+
+
+def rule_path(rule: SigmaRuleBase) -> Optional[str]:
+    return str(rule.source.path) if rule.source is not None else None
+
+
+@dataclass
+class RestoreStateTransformation(Transformation):
+    """Restores the pipeline state that was recorded with a rule in a snapshot, so that the
+    conversion sees the same state as after the processing pipeline."""
+
+    def apply(
+        self, pipeline: ProcessingPipeline, rule: Union[SigmaRule, SigmaCorrelationRule]
+    ) -> None:
+        super().apply(pipeline, rule)
+        pipeline.state.update(getattr(rule, "snapshot_state", {}))
+
+
+class RuleSnapshot:
+    """
+    Rules after the processing pipeline of a backend was applied, stored as compact records, so
+    that they can be converted into multiple output formats or by later runs without parsing the
+    rule files and applying the pipeline again. Only the pipelines of the output formats are
+    applied when a snapshot is converted with PowerShellBackend.convert_snapshot().
+
+    Snapshots are written as a header with a fingerprint of the processing pipeline followed by
+    the pickled records. Loading a snapshot that was taken with another pipeline raises a
+    SigmaConfigurationError. As with the ConversionCache, only load snapshots you wrote yourself.
+    """
+
+    magic: bytes = b"PSSNAP1\n"
+
+    def __init__(
+        self,
+        records: List[Union[RuleRecord, CorrelationRecord]],
+        errors: List[Tuple[SigmaRuleBase, SigmaError]],
+        fingerprint: str,
+    ):
+        self.records = records
+        self.errors = errors
+        self.fingerprint = fingerprint
+
+    @classmethod
+    def from_collection(
+        cls, backend: PowerShellBackend, rule_collection: SigmaCollection
+    ) -> "RuleSnapshot":
+        """Apply the processing pipeline of the backend to the rules of a collection. Errors are
+        collected if the backend collects errors, otherwise raised."""
+        pipeline = cls.pipeline(backend)
+        pipeline.vars.update(
+            {"backend_" + key: value for key, value in backend.backend_options.items()}
+        )
+        backend.resolve_rule_references(rule_collection)
+        records = list()
+        errors = list()
+        trees: Dict[str, Optional[bytes]] = dict()
+        for rule in rule_collection.rules:
+            try:
+                pipeline.apply(rule)
+            except SigmaError as error:
+                if not backend.collect_errors:
+                    raise
+                errors.append((rule, error))
+                continue
+            records.append(
+                RuleRecord.from_rule(rule, pipeline.state, trees)
+                if isinstance(rule, SigmaRule)
+                else CorrelationRecord.from_rule(rule, pipeline.state)
+            )
+        return cls(records, errors, cls.pipeline_fingerprint(backend))
+
+    @classmethod
+    def from_ruleset(
+        cls, backend: PowerShellBackend, inputs: Iterable[Union[str, Path]]
+    ) -> "RuleSnapshot":
+        """Load rule files and directories and apply the processing pipeline of the backend."""
+        return cls.from_collection(
+            backend, SigmaCollection.load_ruleset(inputs=list(inputs))
+        )
+
+    @staticmethod
+    def pipeline(backend: PowerShellBackend) -> ProcessingPipeline:
+        return backend.backend_processing_pipeline + backend.processing_pipeline
+
+    @classmethod
+    def pipeline_fingerprint(cls, backend: PowerShellBackend) -> str:
+        """Hash the processing pipeline and the source of the modules of its transformations,
+        which determine the records of a snapshot."""
+        fingerprint = sha256()
+        from importlib.metadata import version  # slow to import and only needed here
+
+        fingerprint.update(version("pysigma").encode())
+        pipeline = cls.pipeline(backend)
+        fingerprint.update(repr(pipeline.items).encode())
+        fingerprint.update(repr(sorted(backend.backend_options.items())).encode())
+        module_names = {__name__} | {
+            type(item.transformation).__module__ for item in pipeline.items
+        }
+        for module_name in sorted(module_names):
+            fingerprint.update(getsource(modules[module_name]).encode())
+        return fingerprint.hexdigest()
+
+    def replay_pipeline(self, backend: PowerShellBackend) -> ProcessingPipeline:
+        """Pipeline that takes the place of the processing pipeline of the backend when the
+        snapshot is converted. It restores the pipeline state of each rule and keeps the
+        postprocessing items, finalizers and variables."""
+        pipeline = self.pipeline(backend)
+        return ProcessingPipeline(
+            items=[ProcessingItem(RestoreStateTransformation())],
+            postprocessing_items=pipeline.postprocessing_items,
+            finalizers=pipeline.finalizers,
+            vars=dict(pipeline.vars),
+        )
+
+    def collection(self) -> SigmaCollection:
+        """Build new rule objects from the records, as conversion modifies rules."""
+        return SigmaCollection([record.build() for record in self.records])
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def save(self, path: Union[str, Path]) -> None:
+        with open(path, "wb") as snapshot_file:
+            snapshot_file.write(self.magic)
+            snapshot_file.write(self.fingerprint.encode() + b"\n")
+            pickle.dump(
+                (self.records, self.errors),
+                snapshot_file,
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+
+    @classmethod
+    def load(
+        cls, path: Union[str, Path], backend: Optional[PowerShellBackend] = None
+    ) -> "RuleSnapshot":
+        """Load a snapshot. If a backend is given, the snapshot must have been taken with the
+        same processing pipeline."""
+        content = Path(path).read_bytes()
+        end = content.find(b"\n", len(cls.magic))
+        if not content.startswith(cls.magic) or end < 0:
+            raise SigmaConfigurationError(f"{path} isn't a rule snapshot")
+        fingerprint = content[len(cls.magic) : end].decode()
+        if backend is not None and fingerprint != cls.pipeline_fingerprint(backend):
+            raise SigmaConfigurationError(
+                f"Rule snapshot {path} was taken with another processing pipeline"
+            )
+        # The records are unpickled from a view of the file content instead of a copy
+        records, errors = pickle.loads(memoryview(content)[end + 1 :])
+        return cls(records, errors, fingerprint)
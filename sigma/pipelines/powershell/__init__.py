@@ -1,4 +1,8 @@
-from .powershell import powershell_pipeline
+from .powershell import (
+    DetectionItemVisitor,
+    DetectionVisitorTransformation,
+    powershell_pipeline,
+)
 
 # TODO: add all pipelines that should be exposed to the user of your backend in the import statement above.
 
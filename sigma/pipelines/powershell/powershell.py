@@ -1,68 +1,281 @@
 from sigma.pipelines.base import Pipeline
-from dataclasses import dataclass
-from sigma.pipelines.common import (
-    logsource_windows,
-    logsource_windows_network_connection,
-    windows_logsource_mapping,
+from dataclasses import dataclass, field
+from functools import lru_cache
+from sigma.conditions import ConditionNOT, ConditionOR
+from sigma.exceptions import SigmaTransformationError
+from sigma.pipelines.common import windows_logsource_mapping
+from sigma.processing.conditions import (
+    IsSigmaCorrelationRuleCondition,
+    IsSigmaRuleCondition,
+    LogsourceCondition,
 )
-from sigma.processing.conditions import IncludeFieldCondition, LogsourceCondition
 from sigma.processing.pipeline import ProcessingPipeline, ProcessingItem
 from sigma.processing.transformations import (
     AddFieldnamePrefixTransformation,
-    ChangeLogsourceTransformation,
     DropDetectionItemTransformation,
     FieldMappingTransformation,
     RuleFailureTransformation,
     Transformation,
 )
-from sigma.rule import SigmaRule
+from sigma.rule import SigmaDetection, SigmaDetectionItem, SigmaLogSource, SigmaRule
+from sigma.types import SigmaNumber
 from sigma.processing.postprocessing import EmbedQueryTransformation
 from sigma.processing.pipeline import (
     ProcessingItem,
     ProcessingPipeline,
     QueryPostprocessingItem,
 )
-from sigma.rule import SigmaRule
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+sysmon_category_eventids = (
+    {  # Mapping between Sigma log source categories and Sysmon EventIDs
+        "process_creation": [1],
+        "file_change": [2],
+        "network_connection": [3],
+        "sysmon_status": [4, 16],
+        "process_termination": [5],
+        "driver_load": [6],
+        "image_load": [7],
+        "create_remote_thread": [8],
+        "raw_access_thread": [9],
+        "process_access": [10],
+        "file_event": [11],
+        "registry_add": [12],
+        "registry_delete": [12],
+        "registry_set": [13],
+        "registry_rename": [14],
+        "registry_event": [12, 13, 14],
+        "create_stream_hash": [15],
+        "pipe_created": [17, 18],
+        "wmi_event": [19, 20, 21],
+        "dns_query": [22],
+        "file_delete": [23, 26],
+        "clipboard_capture": [24],
+        "process_tampering": [25],
+        "file_delete_detected": [26],
+        "file_block_executable": [27],
+        "file_block_shredding": [28],
+        "file_executable_detected": [29],
+        "sysmon_error": [255],
+    }
+)
+
+windows_category_mapping = (
+    {  # Mapping between other Sigma log source categories and channels/EventIDs
+        "ps_module": ("Microsoft-Windows-PowerShell/Operational", [4103]),
+        "ps_script": ("Microsoft-Windows-PowerShell/Operational", [4104]),
+        "ps_classic_start": ("Windows PowerShell", [400]),
+        "ps_classic_provider_start": ("Windows PowerShell", [600]),
+        "ps_classic_script": ("Windows PowerShell", [800]),
+    }
+)
+
+# Index of (product, category, service) log sources to their channel and the EventIDs a rule is
+# restricted to, if the log source only covers some events of the channel.
+windows_channel_index: Dict[
+    Tuple[str, Optional[str], Optional[str]],
+    Tuple[Union[str, List[str]], Optional[List[int]]],
+] = {
+    **{
+        ("windows", None, service): (channel, None)
+        for service, channel in windows_logsource_mapping.items()
+    },
+    **{
+        ("windows", category, None): (windows_logsource_mapping["sysmon"], eventids)
+        for category, eventids in sysmon_category_eventids.items()
+    },
+    **{
+        ("windows", category, None): route
+        for category, route in windows_category_mapping.items()
+    },
+}
 
 
 @dataclass
-class PromoteDetectionItemTransformation(Transformation):
-    """Promotes a detection item to the rule component level."""
+class LogsourceRoutingTransformation(Transformation):
+    """Changes the log source of a rule to its channel with a single index lookup. Rules of log
+    source categories that only cover some EventIDs of a channel are restricted to them. Log
+    sources covering multiple channels (e.g. service powershell) can't be read by one query and
+    fail the rule.
+    """
+
+    index: Dict[
+        Tuple[str, Optional[str], Optional[str]],
+        Tuple[Union[str, List[str]], Optional[List[int]]],
+    ]
+    detection_name: str = "_logsource_eventid"
+
+    def apply(self, pipeline, rule: SigmaRule) -> None:
+        super().apply(pipeline, rule)
+        logsource = rule.logsource
+        route = (
+            self.index.get((logsource.product, logsource.category, logsource.service))
+            or self.index.get((logsource.product, logsource.category, None))
+            or self.index.get((logsource.product, None, logsource.service))
+        )
+        if route is None:
+            return
+        channel, eventids = route
+        if not isinstance(channel, str):
+            raise SigmaTransformationError(
+                f"Logsource {logsource.service or logsource.category} covers multiple channels ({', '.join(channel)}), but a rule can only read one."
+            )
+        rule.logsource = SigmaLogSource(service=channel)
+        if eventids is not None:
+            rule.detection.detections[self.detection_name] = (
+                SigmaDetection.from_definition({"EventID": eventids})
+            )
+            self.processing_item_applied(rule.detection.detections[self.detection_name])
+            for condition in rule.detection.parsed_condition:
+                condition.condition = (
+                    f"{self.detection_name} and ({condition.condition})"
+                )
+
+
+class DetectionItemVisitor:
+    """Callbacks of a DetectionVisitorTransformation. start and finish are called once per rule,
+    visit for each detection item of the rule."""
+
+    def start(
+        self, transformation: "DetectionVisitorTransformation", rule: SigmaRule
+    ) -> None:
+        pass
+
+    def visit(
+        self,
+        transformation: "DetectionVisitorTransformation",
+        rule: SigmaRule,
+        detection_item: SigmaDetectionItem,
+    ) -> None:
+        pass
+
+    def finish(
+        self, transformation: "DetectionVisitorTransformation", rule: SigmaRule
+    ) -> None:
+        pass
+
+
+@dataclass
+class RemoveWhiteSpaceVisitor(DetectionItemVisitor):
+    """Removes white space characters from detection item field names."""
+
+    def visit(
+        self, transformation, rule: SigmaRule, detection_item: SigmaDetectionItem
+    ) -> None:
+        if detection_item.field is not None and len(detection_item.field.split()) > 1:
+            detection_item.field = "".join(detection_item.field.split())
+
+
+@dataclass
+class PromoteDetectionItemVisitor(DetectionItemVisitor):
+    """Promotes the first detection item of a field with one or more OR-ed numbers that applies to
+    the whole rule (i.e. isn't negated or part of an OR) to an attribute of the rule, e.g. the
+    EventIDs of the FilterHashTable. The promoted detection item is marked with the identifier.
+    The pipeline and its visitors are shared by backends converting in parallel threads, so
+    whether a rule already has a promoted detection item is kept in the attribute of the rule.
+    """
 
     field: str
+    identifier: Optional[str] = None
+
+    def start(self, transformation, rule: SigmaRule) -> None:
+        for condition in rule.detection.parsed_condition:
+            condition.parsed  # links detection items to their parent condition items
+
+    def visit(
+        self, transformation, rule: SigmaRule, detection_item: SigmaDetectionItem
+    ) -> None:
+        if (
+            getattr(rule, self.field.lower(), None) is None
+            and detection_item.field is not None
+            and detection_item.field.lower() == self.field.lower()
+            and detection_item.value
+            and all(isinstance(value, SigmaNumber) for value in detection_item.value)
+            and (
+                len(detection_item.value) == 1
+                or detection_item.value_linking is ConditionOR
+            )
+            and not detection_item.parent_condition_chain_contains(ConditionNOT)
+            and not detection_item.parent_condition_chain_contains(ConditionOR)
+        ):
+            setattr(rule, self.field.lower(), list(detection_item.value))
+            if self.identifier is not None:
+                detection_item.applied_processing_items.add(self.identifier)
+
+
+@dataclass
+class DetectionVisitorTransformation(Transformation):
+    """Walks the detections of a rule, including nested detections, once and calls all visitors
+    for each detection item, so that the cost of a rule doesn't grow with the number of visitors.
+    """
+
+    visitors: List[DetectionItemVisitor]
 
     def apply(self, pipeline, rule: SigmaRule) -> None:
         super().apply(pipeline, rule)
-        for detection in rule.detection.detections.values():
+        for visitor in self.visitors:
+            visitor.start(self, rule)
+        for detection_item in self.detection_items(rule.detection.detections.values()):
+            for visitor in self.visitors:
+                visitor.visit(self, rule, detection_item)
+        for visitor in self.visitors:
+            visitor.finish(self, rule)
+
+    @classmethod
+    def detection_items(
+        cls, detections: Iterable[SigmaDetection]
+    ) -> Iterator[SigmaDetectionItem]:
+        for detection in detections:
             for detection_item in detection.detection_items:
-                if "field" in detection_item.__dataclass_fields__:
-                    if detection_item.field == self.field:
-                        setattr(rule, self.field.lower(), detection_item.value[0])
+                if isinstance(detection_item, SigmaDetection):
+                    yield from cls.detection_items([detection_item])
+                else:
+                    yield detection_item
 
 
 @dataclass
-class RemoveWhiteSpaceTransformation(Transformation):
+class RemoveWhiteSpaceTransformation(DetectionVisitorTransformation):
     """Removes white space characters from detection item field names."""
 
+    visitors: List[DetectionItemVisitor] = field(
+        default_factory=lambda: [RemoveWhiteSpaceVisitor()]
+    )
+
+
+@dataclass
+class PromoteDetectionItemTransformation(DetectionVisitorTransformation):
+    """Promotes a detection item to the rule component level."""
+
+    visitors: List[DetectionItemVisitor] = field(default_factory=list)
+    field: str = "EventID"
+
     def apply(self, pipeline, rule: SigmaRule) -> None:
+        if not self.visitors:
+            self.visitors = [
+                PromoteDetectionItemVisitor(
+                    self.field, getattr(self.processing_item, "identifier", None)
+                )
+            ]
         super().apply(pipeline, rule)
-        for detection in rule.detection.detections.values():
-            for detection_item in detection.detection_items:
-                if detection_item.field != None:
-                    if len(detection_item.field.split()) > 1:
-                        detection_item.field = "".join(detection_item.field.split())
 
 
 @Pipeline
+@lru_cache(maxsize=None)
 def powershell_pipeline() -> ProcessingPipeline:
+    """The pipeline is built once and shared by all callers. Combine it with other pipelines
+    using + instead of modifying it."""
     return ProcessingPipeline(
         name="PowerShell pipeline",
         allowed_backends=frozenset(),
         priority=20,
         items=[
             ProcessingItem(
+                rule_condition_linking=any,
                 rule_condition_negation=True,
-                rule_conditions=[LogsourceCondition(product="windows")],
+                rule_conditions=[
+                    LogsourceCondition(product="windows"),
+                    IsSigmaCorrelationRuleCondition(),
+                ],  # correlation rules don't have a log source, their rules were already checked
                 transformation=RuleFailureTransformation(
                     message="Invalid logsource product."
                 ),
@@ -70,36 +283,25 @@ def powershell_pipeline() -> ProcessingPipeline:
         ]
         + [
             ProcessingItem(
-                rule_conditions=[
-                    logsource_windows(logsource)
-                ],  # if rule matches what is returned by logsource_windows func (e.g., product = windows, service = security)
-                transformation=ChangeLogsourceTransformation(
-                    service=channel
-                ),  # change service value (e.g., sysmon) to channel value (e.g., Microsoft-Windows-Sysmon/Operational)
-            )
-            for logsource, channel in windows_logsource_mapping.items()  # returns multiple kv pairs (service:channel mappings)
-        ]
-        + [
-            ProcessingItem(
-                rule_conditions=[
-                    logsource_windows_network_connection()
-                ],  # TODO: scale this so all sysmon event categories are covered
-                transformation=ChangeLogsourceTransformation(
-                    service=windows_logsource_mapping["sysmon"]
-                ),
+                identifier="powershell_logsource_routing",
+                rule_conditions=[IsSigmaRuleCondition()],
+                transformation=LogsourceRoutingTransformation(
+                    index=windows_channel_index
+                ),  # change log source (e.g., service sysmon or category process_creation) to channel (e.g., Microsoft-Windows-Sysmon/Operational)
             )
         ]
-        + [ProcessingItem(transformation=RemoveWhiteSpaceTransformation())]
         + [
             ProcessingItem(
-                # field name conditions are evaluated against fields in detection items and in the component-level field list of a rule
-                field_name_conditions=[
-                    IncludeFieldCondition(
-                        fields=["[eE][vV][eE][nN][tT][iI][dD]"], type="re"
-                    )
-                ],
-                # TODO: change logic to automatically grab the same field specified for IncludeFieldCondition
-                transformation=PromoteDetectionItemTransformation(field="EventID"),
+                identifier="powershell_detection_visitor",
+                rule_conditions=[IsSigmaRuleCondition()],
+                transformation=DetectionVisitorTransformation(
+                    visitors=[
+                        RemoveWhiteSpaceVisitor(),
+                        PromoteDetectionItemVisitor(
+                            field="EventID", identifier="powershell_promote_eventid"
+                        ),
+                    ]
+                ),  # remove white space from field names and promote the EventIDs into the FilterHashTable in a single pass over the detections
             )
         ]
         + [
@@ -1,8 +1,15 @@
+import re
 import pytest
+from json import dumps
+from textwrap import dedent
 from sigma.pipelines.powershell import powershell_pipeline
 from sigma.backends.powershell import PowerShellBackend
 from sigma.collection import SigmaCollection
-from sigma.exceptions import SigmaFeatureNotSupportedByBackendError
+from sigma.conversion.state import ConversionState
+from sigma.exceptions import (
+    SigmaFeatureNotSupportedByBackendError,
+    SigmaTransformationError,
+)
 
 
 @pytest.fixture
@@ -57,7 +64,7 @@ def test_powershell_or_expression(powershell_backend: PowerShellBackend):
             )
         )
         == [
-            'Get-WinEvent -FilterHashTable @{LogName = "Security"; Id = 4688} | Read-WinEvent | Where-Object {$_.fieldA -eq "valueA" -or $_.fieldB -eq "valueB"}'
+            'Get-WinEvent -LogName "Security" | Read-WinEvent | Where-Object {$_.EventID -eq 4688 -or $_.fieldA -eq "valueA" -or $_.fieldB -eq "valueB"}'
         ]
     )
 
@@ -90,6 +97,29 @@ def test_powershell_and_or_expression(powershell_backend: PowerShellBackend):
     )
 
 
+def test_powershell_eventid_only_expression(powershell_backend: PowerShellBackend):
+    assert (
+        powershell_backend.convert(
+            SigmaCollection.from_yaml(
+                """
+            title: Test
+            status: test
+            logsource:
+                product: windows
+                service: security
+            detection:
+                selection:
+                    EventID: 4688
+                condition: selection
+        """
+            )
+        )
+        == [
+            'Get-WinEvent -FilterHashTable @{LogName = "Security"; Id = 4688} | Read-WinEvent'
+        ]
+    )
+
+
 def test_powershell_or_and_expression(powershell_backend: PowerShellBackend):
     assert (
         powershell_backend.convert(
@@ -224,13 +254,888 @@ def test_powershell_field_name_with_whitespace(powershell_backend: PowerShellBac
     )
 
 
-def test_powershell_format1_output(powershell_backend: PowerShellBackend):
-    """Test for output format format1."""
-    # TODO: implement a test for the output format
-    pass
+def test_powershell_negated_eventid_not_promoted(
+    powershell_backend: PowerShellBackend,
+):
+    assert (
+        powershell_backend.convert(
+            SigmaCollection.from_yaml(
+                """
+            title: Test
+            status: test
+            logsource:
+                product: windows
+                service: security
+            detection:
+                sel:
+                    fieldA: valueA
+                filter:
+                    EventID: 4688
+                condition: sel and not filter
+        """
+            )
+        )
+        == [
+            'Get-WinEvent -LogName "Security" | Read-WinEvent | Where-Object {$_.fieldA -eq "valueA" -and (-not ($_.EventID -eq 4688))}'
+        ]
+    )
+
+
+def test_powershell_not_list(powershell_backend: PowerShellBackend):
+    assert (
+        powershell_backend.convert(
+            SigmaCollection.from_yaml(
+                """
+            title: Test
+            status: test
+            logsource:
+                product: windows
+                service: security
+            detection:
+                sel:
+                    fieldA: valueA
+                filter:
+                    User:
+                        - a
+                        - b
+                condition: sel and not filter
+        """
+            )
+        )
+        == [
+            'Get-WinEvent -LogName "Security" | Read-WinEvent | Where-Object {$_.fieldA -eq "valueA" -and (-not ($_.User -in ("a", "b")))}'
+        ]
+    )
+
+
+def test_powershell_xpath_output(powershell_backend: PowerShellBackend):
+    """Test for output format xpath."""
+    assert (
+        powershell_backend.convert(
+            SigmaCollection.from_yaml(
+                """
+            title: Test
+            status: test
+            logsource:
+                product: windows
+                service: security
+            detection:
+                sel:
+                    EventID:
+                        - 4624
+                        - 4625
+                    LogonType: 3
+                    IpPort|gte: 1024
+                    TargetUserName|endswith: $
+                    Status: "0xc000006d"
+                condition: sel
+        """
+            ),
+            output_format="xpath",
+        )
+        == [
+            'Get-WinEvent -LogName "Security" -FilterXPath "*[(System[EventID=4624] or System[EventID=4625]) and EventData[Data[@Name=\'LogonType\']=3] and EventData[Data[@Name=\'IpPort\']>=1024]]" | Read-WinEvent | Where-Object {$_.TargetUserName.EndsWith("$") -and $_.Status -eq "0xc000006d"}'
+        ]
+    )
+
+
+def test_powershell_xpath_output_case_sensitive():
+    backend = PowerShellBackend(powershell_pipeline(), xpath_case_sensitive=True)
+    assert (
+        backend.convert(
+            SigmaCollection.from_yaml(
+                """
+            title: Test
+            status: test
+            logsource:
+                product: windows
+                service: security
+            detection:
+                sel:
+                    EventID: 4688
+                    NewProcessName: C:\\Windows\\System32\\cmd.exe
+                condition: sel
+        """
+            ),
+            output_format="xpath",
+        )
+        == [
+            "Get-WinEvent -LogName \"Security\" -FilterXPath \"*[System[EventID=4688] and EventData[Data[@Name='NewProcessName']='C:\\Windows\\System32\\cmd.exe']]\" | Read-WinEvent"
+        ]
+    )
+
+
+def test_powershell_script_output(powershell_backend: PowerShellBackend):
+    """Test for output format script."""
+    assert (
+        powershell_backend.convert(
+            SigmaCollection.from_yaml(
+                """
+            title: Test 1
+            id: 00000000-0000-0000-0000-000000000001
+            status: test
+            logsource:
+                product: windows
+                service: security
+            detection:
+                sel:
+                    EventID:
+                        - 4624
+                        - 4625
+                    fieldA: valueA
+                condition: sel
+---
+            title: Test 2
+            id: 00000000-0000-0000-0000-000000000002
+            status: test
+            logsource:
+                product: windows
+                service: security
+            detection:
+                sel:
+                    EventID: 4625
+                condition: sel
+---
+            title: Test 3
+            id: 00000000-0000-0000-0000-000000000003
+            status: test
+            logsource:
+                product: windows
+                service: security
+            detection:
+                sel:
+                    fieldB: valueB
+                condition: sel
+        """
+            ),
+            output_format="script",
+        )
+        == """# Security
+$Rules = @{
+    "4624" = {
+        if ($_.fieldA -eq "valueA") { [PSCustomObject]@{RuleId = "00000000-0000-0000-0000-000000000001"; RuleTitle = "Test 1"; Event = $_} }
+    }
+    "4625" = {
+        if ($_.fieldA -eq "valueA") { [PSCustomObject]@{RuleId = "00000000-0000-0000-0000-000000000001"; RuleTitle = "Test 1"; Event = $_} }
+        [PSCustomObject]@{RuleId = "00000000-0000-0000-0000-000000000002"; RuleTitle = "Test 2"; Event = $_}
+    }
+}
+$AnyEventRules = {
+    if ($_.fieldB -eq "valueB") { [PSCustomObject]@{RuleId = "00000000-0000-0000-0000-000000000003"; RuleTitle = "Test 3"; Event = $_} }
+}
+Get-WinEvent -LogName "Security" | Read-WinEvent | ForEach-Object {
+    if ($Rules.ContainsKey($_.EventID)) { . $Rules[$_.EventID] }
+    . $AnyEventRules
+}"""
+    )
+
+
+def test_powershell_script_output_eventid_filter(
+    powershell_backend: PowerShellBackend,
+):
+    assert powershell_backend.convert(
+        SigmaCollection.from_yaml(
+            """
+            title: Test
+            status: test
+            logsource:
+                product: windows
+                service: security
+            detection:
+                sel:
+                    EventID: 4625
+                    fieldA: valueA
+                condition: sel
+        """
+        ),
+        output_format="script",
+    ).endswith(
+        """Get-WinEvent -LogName "Security" -FilterXPath "*[System[EventID=4625]]" | Read-WinEvent | ForEach-Object {
+    if ($Rules.ContainsKey($_.EventID)) { . $Rules[$_.EventID] }
+}"""
+    )
+
+
+def test_powershell_sysmon_category(powershell_backend: PowerShellBackend):
+    assert (
+        powershell_backend.convert(
+            SigmaCollection.from_yaml(
+                """
+            title: Test
+            status: test
+            logsource:
+                product: windows
+                category: process_creation
+            detection:
+                sel:
+                    Image|endswith: '\\powershell.exe'
+                condition: sel
+        """
+            )
+        )
+        == [
+            'Get-WinEvent -FilterHashTable @{LogName = "Microsoft-Windows-Sysmon/Operational"; Id = 1} | Read-WinEvent | Where-Object {$_.Image.EndsWith("powershell.exe")}'
+        ]
+    )
+
+
+def test_powershell_sysmon_category_multiple_eventids(
+    powershell_backend: PowerShellBackend,
+):
+    assert (
+        powershell_backend.convert(
+            SigmaCollection.from_yaml(
+                """
+            title: Test
+            status: test
+            logsource:
+                product: windows
+                category: registry_event
+            detection:
+                sel:
+                    TargetObject|contains: '\\Run\\'
+                condition: sel
+        """
+            )
+        )
+        == [
+            'Get-WinEvent -FilterHashTable @{LogName = "Microsoft-Windows-Sysmon/Operational"; Id = 12, 13, 14} | Read-WinEvent | Where-Object {$_.TargetObject.Contains("Run")}'
+        ]
+    )
+
+
+@pytest.mark.parametrize("service", ["powershell", "applocker", "security-mitigations"])
+def test_powershell_multiple_channel_service(
+    powershell_backend: PowerShellBackend, service: str
+):
+    with pytest.raises(SigmaTransformationError, match="covers multiple channels"):
+        powershell_backend.convert(
+            SigmaCollection.from_yaml(
+                f"""
+            title: Test
+            status: test
+            logsource:
+                product: windows
+                service: {service}
+            detection:
+                sel:
+                    EventID: 4104
+                condition: sel
+        """
+            )
+        )
+
+
+def test_powershell_pipeline_cached():
+    assert powershell_pipeline() is powershell_pipeline()
+
+
+reorder_rule = """
+            title: Test
+            status: test
+            logsource:
+                product: windows
+                service: security
+            detection:
+                sel:
+                    EventID: 4688
+                    CommandLine|re: 'x.*y'
+                    NewProcessName|contains: cmd
+                    ParentProcessName|endswith: svc.exe
+                    SubjectUserName: admin
+                condition: sel
+        """
+
+
+def test_powershell_reorder_operands():
+    backend = PowerShellBackend(powershell_pipeline(), reorder_operands=True)
+    assert backend.convert(SigmaCollection.from_yaml(reorder_rule)) == [
+        'Get-WinEvent -FilterHashTable @{LogName = "Security"; Id = 4688} | Read-WinEvent | Where-Object {$_.SubjectUserName -eq "admin" -and $_.ParentProcessName.EndsWith("svc.exe") -and $_.NewProcessName.Contains("cmd") -and $_.CommandLine -match "x.*y"}'
+    ]
+
+
+def test_powershell_reorder_operands_keeps_condition():
+    backend = PowerShellBackend(powershell_pipeline(), reorder_operands=True)
+    rule = SigmaCollection.from_yaml(reorder_rule).rules[0]
+    cond = rule.detection.parsed_condition[0].parsed
+    fields = [arg.field for arg in cond.args]
+    backend.convert_condition(cond, ConversionState())
+    assert [arg.field for arg in cond.args] == fields
+
+
+def write_selectivity_stats(stats):
+    stats.write_text(
+        dumps(
+            {
+                "rules": [
+                    {
+                        "events": 100,
+                        "predicates": [
+                            {
+                                "predicate": '$_.SubjectUserName -eq "admin"',
+                                "matches": 99,
+                            },
+                            {"predicate": '$_.CommandLine -match "x.*y"', "matches": 1},
+                        ],
+                    }
+                ]
+            }
+        )
+    )
+
+
+def test_powershell_reorder_operands_selectivity_stats(tmp_path):
+    stats = tmp_path / "evaluation.json"
+    write_selectivity_stats(stats)
+    backend = PowerShellBackend(
+        powershell_pipeline(), reorder_operands=True, selectivity_stats=str(stats)
+    )
+    assert backend.convert(SigmaCollection.from_yaml(reorder_rule)) == [
+        'Get-WinEvent -FilterHashTable @{LogName = "Security"; Id = 4688} | Read-WinEvent | Where-Object {$_.ParentProcessName.EndsWith("svc.exe") -and $_.CommandLine -match "x.*y" -and $_.NewProcessName.Contains("cmd") -and $_.SubjectUserName -eq "admin"}'
+    ]
+
+
+def test_powershell_shared_subexpressions_selectivity_stats(tmp_path):
+    stats = tmp_path / "evaluation.json"
+    write_selectivity_stats(stats)
+    backend = PowerShellBackend(
+        powershell_pipeline(),
+        reorder_operands=True,
+        selectivity_stats=str(stats),
+        share_subexpressions=True,
+    )
+    assert backend.convert(SigmaCollection.from_yaml(reorder_rule)) == [
+        'Get-WinEvent -FilterHashTable @{LogName = "Security"; Id = 4688} | Read-WinEvent | Where-Object {$_.ParentProcessName.EndsWith("svc.exe") -and $_.CommandLine -match "x.*y" -and $_.NewProcessName.Contains("cmd") -and $_.SubjectUserName -eq "admin"}'
+    ]
+    assert backend.convert(
+        SigmaCollection.from_yaml("---".join([dedent(reorder_rule)] * 2)),
+        output_format="script",
+    ).splitlines()[3:7] == [
+        '        $Shared_1363fe88 = ($_.ParentProcessName.EndsWith("svc.exe"))',
+        '        $Shared_98b9954e = ($_.CommandLine -match "x.*y")',
+        '        $Shared_8ab27521 = ($_.NewProcessName.Contains("cmd"))',
+        '        if ($Shared_1363fe88 -and $Shared_98b9954e -and $Shared_8ab27521 -and $_.SubjectUserName -eq "admin") { [PSCustomObject]@{RuleId = ""; RuleTitle = "Test"; Event = $_} }',
+    ]
+
+
+hashset_rule = """
+            title: Test
+            id: 00000000-0000-0000-0000-000000000001
+            status: test
+            logsource:
+                product: windows
+                service: security
+            detection:
+                sel:
+                    EventID: 4688
+                    NewProcessName:
+                        - a.exe
+                        - b.exe
+                        - c.exe
+                    SubjectUserName:
+                        - alice
+                        - bob
+                condition: sel
+        """
+
+
+def test_powershell_hashset():
+    backend = PowerShellBackend(powershell_pipeline(), hashset_threshold=3)
+    assert backend.convert(SigmaCollection.from_yaml(hashset_rule)) == [
+        '$InSet_cbd63b6b = [System.Collections.Generic.HashSet[string]]::new([string[]]@("a.exe", "b.exe", "c.exe"), [System.StringComparer]::OrdinalIgnoreCase)\n'
+        'Get-WinEvent -FilterHashTable @{LogName = "Security"; Id = 4688} | Read-WinEvent | Where-Object {($InSet_cbd63b6b.Contains($_.NewProcessName)) -and ($_.SubjectUserName -in ("alice", "bob"))}'
+    ]
+
+
+def test_powershell_hashset_script_output():
+    backend = PowerShellBackend(powershell_pipeline(), hashset_threshold=3)
+    assert backend.convert(
+        SigmaCollection.from_yaml(hashset_rule), output_format="script"
+    ).splitlines()[:3] == [
+        "# Security",
+        '$InSet_cbd63b6b = [System.Collections.Generic.HashSet[string]]::new([string[]]@("a.exe", "b.exe", "c.exe"), [System.StringComparer]::OrdinalIgnoreCase)',
+        "$Rules = @{",
+    ]
+
+
+def test_powershell_regex_merge():
+    backend = PowerShellBackend(powershell_pipeline(), regex_threshold=2)
+    assert (
+        backend.convert(
+            SigmaCollection.from_yaml(
+                """
+            title: Test
+            status: test
+            logsource:
+                product: windows
+                service: security
+            detection:
+                sel:
+                    EventID: 4688
+                    CommandLine|contains:
+                        - 'sekurlsa::'
+                        - "it's"
+                    NewProcessName|endswith:
+                        - '\\cmd.exe'
+                        - '\\pwsh?.exe'
+                    SubjectUserName:
+                        - alice
+                        - bob
+                    ParentProcessName|startswith: C:\\Windows
+                condition: sel
+        """
+            )
+        )
+        == [
+            "$Regex_c1c88e8e = [regex]::new('sekurlsa::|it''s', [System.Text.RegularExpressions.RegexOptions]'IgnoreCase, Singleline, Compiled')\n"
+            "$Regex_8ff6933e = [regex]::new('\\\\cmd\\.exe\\z|\\\\pwsh.\\.exe\\z', [System.Text.RegularExpressions.RegexOptions]'IgnoreCase, Singleline, Compiled')\n"
+            'Get-WinEvent -FilterHashTable @{LogName = "Security"; Id = 4688} | Read-WinEvent | Where-Object {($Regex_c1c88e8e.IsMatch([string]$_.CommandLine)) -and ($Regex_8ff6933e.IsMatch([string]$_.NewProcessName)) -and ($_.SubjectUserName -in ("alice", "bob")) -and $_.ParentProcessName.StartsWith("C:Windows")}'
+        ]
+    )
+
+
+def test_powershell_regex_merge_multiline():
+    backend = PowerShellBackend(powershell_pipeline(), regex_threshold=2)
+    [query] = backend.convert(
+        SigmaCollection.from_yaml(
+            """
+            title: Test
+            status: test
+            logsource:
+                product: windows
+                service: security
+            detection:
+                sel:
+                    EventID: 4104
+                    ScriptBlockText:
+                        - 'IEX*DownloadString'
+                        - 'Invoke-Expression?'
+                condition: sel
+        """
+        )
+    )
+    regex = re.search(r"\[regex\]::new\('(.*)', .*'(.*)'\)", query)
+    assert regex.groups() == (
+        "\\AIEX.*DownloadString\\z|\\AInvoke-Expression.\\z",
+        "IgnoreCase, Singleline, Compiled",
+    )
+    # \z of .NET is \Z in Python, which otherwise agrees on these constructs
+    pattern = re.compile(
+        regex.group(1).replace("\\z", "\\Z"), re.IGNORECASE | re.DOTALL
+    )
+    assert pattern.search("iex (New-Object Net.WebClient)\n.DownloadString")
+    assert pattern.search("Invoke-Expression\n")
+    assert not pattern.search("IEX $a.DownloadString\n")
+    assert not pattern.search("Invoke-Expression;\n")
+
+
+def test_powershell_keywords(powershell_backend: PowerShellBackend):
+    assert (
+        powershell_backend.convert(
+            SigmaCollection.from_yaml(
+                """
+            title: Test
+            status: test
+            logsource:
+                product: windows
+                service: security
+            detection:
+                keywords:
+                    - 'sekurlsa::'
+                    - 'Kiwi Legit Printer'
+                    - '*\\mimilib.dll'
+                    - 4711
+                condition: keywords
+        """
+            )
+        )
+        == [
+            "$Keywords_0fed94fd = [regex]::new('sekurlsa::|Kiwi Legit Printer|\\\\mimilib\\.dll|4711', [System.Text.RegularExpressions.RegexOptions]'IgnoreCase, Compiled')\n"
+            'Get-WinEvent -LogName "Security" | Read-WinEvent | Where-Object {$Keywords_0fed94fd.IsMatch(($_.PSObject.Properties.Value -join "`n"))}'
+        ]
+    )
+
+
+def test_powershell_eventid_list_promoted(powershell_backend: PowerShellBackend):
+    assert (
+        powershell_backend.convert(
+            SigmaCollection.from_yaml(
+                """
+            title: Test
+            status: test
+            logsource:
+                product: windows
+                service: security
+            detection:
+                sel:
+                    EventID:
+                        - 4624
+                        - 4625
+                    LogonType: 10
+                condition: sel
+        """
+            )
+        )
+        == [
+            'Get-WinEvent -FilterHashTable @{LogName = "Security"; Id = 4624, 4625} | Read-WinEvent | Where-Object {$_.LogonType -eq 10}'
+        ]
+    )
+
+
+def test_powershell_nested_detection(powershell_backend: PowerShellBackend):
+    assert (
+        powershell_backend.convert(
+            SigmaCollection.from_yaml(
+                """
+            title: Test
+            status: test
+            logsource:
+                product: windows
+                service: security
+            detection:
+                sel:
+                    - EventID: 4688
+                      New Process Name: cmd.exe
+                condition: sel
+        """
+            )
+        )
+        == [
+            'Get-WinEvent -FilterHashTable @{LogName = "Security"; Id = 4688} | Read-WinEvent | Where-Object {$_.NewProcessName -eq "cmd.exe"}'
+        ]
+    )
+
+
+def test_powershell_shared_subexpressions():
+    rules = "\n---\n".join(
+        f"""
+title: Test {index}
+status: test
+logsource:
+    product: windows
+    service: security
+detection:
+    sel:
+        EventID: 4688
+        NewProcessName|endswith: powershell.exe
+        CommandLine|contains: {value}
+    condition: sel
+"""
+        for index, value in enumerate(["-enc", "-nop"])
+    )
+    backend = PowerShellBackend(powershell_pipeline(), share_subexpressions=True)
+    assert backend.convert(
+        SigmaCollection.from_yaml(rules), output_format="script"
+    ).splitlines()[2:6] == [
+        '    "4688" = {',
+        '        $Shared_6137133c = ($_.NewProcessName.EndsWith("powershell.exe"))',
+        '        if ($Shared_6137133c -and $_.CommandLine.Contains("-enc")) { [PSCustomObject]@{RuleId = ""; RuleTitle = "Test 0"; Event = $_} }',
+        '        if ($Shared_6137133c -and $_.CommandLine.Contains("-nop")) { [PSCustomObject]@{RuleId = ""; RuleTitle = "Test 1"; Event = $_} }',
+    ]
+
+
+def test_powershell_shared_subexpressions_nested():
+    rules = "\n---\n".join(
+        f"""
+title: Test {index}
+status: test
+logsource:
+    product: windows
+    service: security
+detection:
+    sel:
+        EventID: 4688
+        CommandLine|contains: {value}
+    powershell:
+        NewProcessName|endswith: powershell.exe
+    pwsh:
+        NewProcessName|endswith: pwsh.exe
+    condition: {condition}
+"""
+        for index, (value, condition) in enumerate(
+            [
+                ("-enc", "sel and (powershell or pwsh)"),
+                ("-nop", "sel and (powershell or pwsh)"),
+                ("-w hidden", "sel and powershell"),
+            ]
+        )
+    )
+    backend = PowerShellBackend(powershell_pipeline(), share_subexpressions=True)
+    lines = backend.convert(
+        SigmaCollection.from_yaml(rules), output_format="script"
+    ).splitlines()
+    # The shared OR references the shared EndsWith, which is also used by the third rule
+    assert lines[3:8] == [
+        '        $Shared_6137133c = ($_.NewProcessName.EndsWith("powershell.exe"))',
+        '        $Shared_6b2b708a = ($Shared_6137133c -or $_.NewProcessName.EndsWith("pwsh.exe"))',
+        '        if ($_.CommandLine.Contains("-enc") -and ($Shared_6b2b708a)) { [PSCustomObject]@{RuleId = ""; RuleTitle = "Test 0"; Event = $_} }',
+        '        if ($_.CommandLine.Contains("-nop") -and ($Shared_6b2b708a)) { [PSCustomObject]@{RuleId = ""; RuleTitle = "Test 1"; Event = $_} }',
+        '        if ($_.CommandLine.Contains("-w hidden") -and $Shared_6137133c) { [PSCustomObject]@{RuleId = ""; RuleTitle = "Test 2"; Event = $_} }',
+    ]
+    # Without the third rule, the EndsWith is only referenced by the shared OR
+    lines = backend.convert(
+        SigmaCollection.from_yaml(rules.rsplit("---", 1)[0]), output_format="script"
+    ).splitlines()
+    assert lines[3] == (
+        '        $Shared_6b2b708a = ($_.NewProcessName.EndsWith("powershell.exe") -or $_.NewProcessName.EndsWith("pwsh.exe"))'
+    )
+    assert "$Shared_6137133c" not in "\n".join(lines)
+
+
+def test_powershell_time_window():
+    backend = PowerShellBackend(powershell_pipeline(), time_window=300)
+    rule = SigmaCollection.from_yaml(hashset_rule)
+    assert backend.convert(rule)[0].startswith(
+        'Get-WinEvent -FilterHashTable @{LogName = "Security"; Id = 4688; StartTime = (Get-Date).AddSeconds(-300)} | Read-WinEvent'
+    )
+    rule = SigmaCollection.from_yaml(hashset_rule)
+    assert backend.convert(rule, output_format="xpath")[0].startswith(
+        'Get-WinEvent -LogName "Security" -FilterXPath "*[System[EventID=4688] and System[TimeCreated[timediff(@SystemTime) <= 300000]]]"'
+    )
+
+
+def test_powershell_script_output_bookmarks():
+    backend = PowerShellBackend(
+        powershell_pipeline(), bookmarks="$env:ProgramData\\sigma2powershell"
+    )
+    script = backend.convert(
+        SigmaCollection.from_yaml(hashset_rule), output_format="script"
+    ).splitlines()
+    assert script[:6] == [
+        '$BookmarkDirectory = New-Item -ItemType Directory -Force -Path "$env:ProgramData\\sigma2powershell"',
+        "# Security",
+        '$Bookmark = Join-Path $BookmarkDirectory "Security.bookmark"',
+        "$LastRecordId = if (Test-Path $Bookmark) { [long](Get-Content $Bookmark) } else { 0 }",
+        '$NextRecordId = [long](Get-WinEvent -LogName "Security" -MaxEvents 1 -ErrorAction SilentlyContinue).RecordId',
+        "if ($LastRecordId -gt $NextRecordId) { $LastRecordId = 0 }",
+    ]
+    assert script[-4] == (
+        'Get-WinEvent -LogName "Security" -FilterXPath "*[System[EventID=4688] and System[EventRecordID > $LastRecordId and EventRecordID <= $NextRecordId]]" -ErrorAction SilentlyContinue | Read-WinEvent | ForEach-Object {'
+    )
+    assert script[-1] == "Set-Content -Path $Bookmark -Value $NextRecordId"
+
+
+def test_powershell_evtx_output(powershell_backend: PowerShellBackend):
+    script = powershell_backend.convert(
+        SigmaCollection.from_yaml(hashset_rule), output_format="evtx"
+    ).splitlines()
+    assert script[:5] == [
+        "param(",
+        '    [string[]]$Path = "*.evtx",',
+        "    [string]$Manifest,",
+        "    [int]$ThrottleLimit = 5",
+        ")",
+    ]
+    assert script[12:] == [
+        "    # Security",
+        "    $Rules_0 = @{",
+        '        "4688" = {',
+        '            if (($_.NewProcessName -in ("a.exe", "b.exe", "c.exe")) -and ($_.SubjectUserName -in ("alice", "bob"))) { [PSCustomObject]@{File = $File; RuleId = "00000000-0000-0000-0000-000000000001"; RuleTitle = "Test"; Event = $_} }',
+        "        }",
+        "    }",
+        "    Get-WinEvent -Path $File -FilterXPath $Filter -ErrorAction SilentlyContinue | Read-WinEvent | ForEach-Object {",
+        '        if ($_.Channel -eq "Security") {',
+        "            if ($Rules_0.ContainsKey($_.EventID)) { . $Rules_0[$_.EventID] }",
+        "        }",
+        "    }",
+        "}",
+    ]
+
+
+def test_powershell_project_fields():
+    backend = PowerShellBackend(powershell_pipeline(), project_fields=True)
+    assert backend.convert(SigmaCollection.from_yaml(hashset_rule)) == [
+        'Get-WinEvent -FilterHashTable @{LogName = "Security"; Id = 4688} | Read-WinEvent -Field "NewProcessName", "SubjectUserName" | Where-Object {($_.NewProcessName -in ("a.exe", "b.exe", "c.exe")) -and ($_.SubjectUserName -in ("alice", "bob"))}'
+    ]
+    script = backend.convert(
+        SigmaCollection.from_yaml(hashset_rule), output_format="script"
+    )
+    assert (
+        'Get-WinEvent -LogName "Security" -FilterXPath "*[System[EventID=4688]]" | Read-WinEvent -Field "NewProcessName", "SubjectUserName" | ForEach-Object {'
+        in script.splitlines()
+    )
+
+
+def test_powershell_project_fields_keywords():
+    backend = PowerShellBackend(powershell_pipeline(), project_fields=True)
+    assert (
+        "| Read-WinEvent | Where-Object"
+        in backend.convert(
+            SigmaCollection.from_yaml(
+                """
+            title: Test
+            status: test
+            logsource:
+                product: windows
+                service: security
+            detection:
+                keywords:
+                    - 'sekurlsa::'
+                condition: keywords
+        """
+            )
+        )[0]
+    )
+
+
+def test_powershell_native_cidr():
+    backend = PowerShellBackend(powershell_pipeline(), native_cidr=True)
+    assert (
+        backend.convert(
+            SigmaCollection.from_yaml(
+                """
+            title: Test
+            status: test
+            logsource:
+                product: windows
+                service: security
+            detection:
+                sel:
+                    EventID: 5156
+                    DestAddress|cidr:
+                        - 192.168.0.0/16
+                        - 10.0.0.0/8
+                        - 192.168.1.0/24
+                        - fe80::/10
+                condition: sel
+        """
+            )
+        )[0].splitlines()[1:]
+        == [
+            "$Cidr_d426fba9 = @{Starts = [System.Numerics.BigInteger[]]@('281470849515520', '281473913978880', '338288524927261089654018896841347694592'); Ends = [System.Numerics.BigInteger[]]@('281470866292735', '281473914044415', '338620831926207318622244848606417780735')}",
+            'Get-WinEvent -FilterHashTable @{LogName = "Security"; Id = 5156} | Read-WinEvent | Where-Object {(& $CidrContains $_.DestAddress $Cidr_d426fba9)}',
+        ]
+    )
+
+
+def test_powershell_ordinal_ignore_case():
+    backend = PowerShellBackend(powershell_pipeline(), ordinal_ignore_case=True)
+    assert (
+        backend.convert(
+            SigmaCollection.from_yaml(
+                """
+            title: Test
+            status: test
+            logsource:
+                product: windows
+                service: security
+            detection:
+                sel:
+                    EventID: 4688
+                    NewProcessName|endswith: '\\powershell.exe'
+                    ParentProcessName|startswith: explorer
+                filter:
+                    CommandLine|contains: legit
+                condition: sel and not filter
+        """
+            )
+        )
+        == [
+            'Get-WinEvent -FilterHashTable @{LogName = "Security"; Id = 4688} | Read-WinEvent | Where-Object {(([string]$_.NewProcessName).EndsWith("\\powershell.exe", [System.StringComparison]::OrdinalIgnoreCase) -and ([string]$_.ParentProcessName).StartsWith("explorer", [System.StringComparison]::OrdinalIgnoreCase)) -and (-not (([string]$_.CommandLine).IndexOf("legit", [System.StringComparison]::OrdinalIgnoreCase) -ge 0))}'
+        ]
+    )
+
+
+def test_powershell_correlation_event_count(powershell_backend: PowerShellBackend):
+    query = powershell_backend.convert(
+        SigmaCollection.from_yaml(
+            """
+title: Failed logon
+name: failed_logon
+status: test
+logsource:
+    product: windows
+    service: security
+detection:
+    selection:
+        EventID: 4625
+        LogonType: 3
+    condition: selection
+---
+title: Brute force
+id: 0e95725d-7320-415d-80f7-004da920fc12
+status: test
+correlation:
+    type: event_count
+    rules: failed_logon
+    group-by:
+        - TargetUserName
+        - IpAddress
+    timespan: 5m
+    condition:
+        gte: 10
+"""
+        )
+    )
+    assert len(query) == 1
+    lines = query[0].splitlines()
+    assert lines[0] == "$CorrelationWindow = {"
+    assert lines[-5:] == [
+        '$Window_2941fc33 = @{Span = 300; Operator = "gte"; Threshold = 10; Distinct = $false; Queue = [System.Collections.Generic.Queue[object]]::new(); Groups = @{}}',
+        'Get-WinEvent -FilterHashTable @{LogName = "Security"; Id = 4625} -Oldest | Read-WinEvent | Where-Object {$_.LogonType -eq 3} | ForEach-Object { [PSCustomObject]@{Time = [DateTimeOffset]::Parse($_.TimeCreated).ToUnixTimeSeconds(); Key = "$($_.TargetUserName)|$($_.IpAddress)"; Value = ""; Event = $_} } | ForEach-Object {',
+        "    $Count = & $CorrelationWindow $Window_2941fc33 $_.Time $_.Key $_.Value",
+        '    if ($Count) { [PSCustomObject]@{RuleId = "0e95725d-7320-415d-80f7-004da920fc12"; RuleTitle = "Brute force"; GroupBy = $_.Key; Count = $Count; Event = $_.Event} }',
+        "}",
+    ]
+
 
+def test_powershell_correlation_temporal(powershell_backend: PowerShellBackend):
+    rules = """
+title: Network logon
+name: network_logon
+status: test
+logsource:
+    product: windows
+    service: security
+detection:
+    selection:
+        EventID: 4624
+        LogonType: 3
+    condition: selection
+---
+title: Whoami
+name: whoami
+status: test
+logsource:
+    product: windows
+    category: process_creation
+detection:
+    selection:
+        Image|endswith: '\\whoami.exe'
+    condition: selection
+---
+title: Network logon followed by recon
+status: test
+correlation:
+    type: temporal
+    rules:
+        - network_logon
+        - whoami
+    aliases:
+        user:
+            network_logon: TargetUserName
+            whoami: User
+    group-by: user
+    timespan: 1h
+"""
+    lines = powershell_backend.convert(SigmaCollection.from_yaml(rules))[0].splitlines()
+    # The events of both rules are merged oldest first as they are read
+    merge = lines.index("& $MergeWinEvents @(")
+    assert lines[merge : merge + 9] == [
+        "& $MergeWinEvents @(",
+        '    ,@("Security", "*[System[EventID=4624]]")',
+        '    ,@("Microsoft-Windows-Sysmon/Operational", "*[System[EventID=1]]")',
+        ") | ForEach-Object {",
+        "    $Reader = $_.Reader",
+        "    $_.Record | Read-WinEvent | ForEach-Object {",
+        '        if ($Reader -eq 0) { if ($_.LogonType -eq 3) { [PSCustomObject]@{Time = [DateTimeOffset]::Parse($_.TimeCreated).ToUnixTimeSeconds(); Key = "$($_.TargetUserName)"; Value = "network_logon"; Event = $_} } }',
+        '        elseif ($Reader -eq 1) { if ($_.Image.EndsWith("whoami.exe")) { [PSCustomObject]@{Time = [DateTimeOffset]::Parse($_.TimeCreated).ToUnixTimeSeconds(); Key = "$($_.User)"; Value = "whoami"; Event = $_} } }',
+        "    }",
+    ]
+    assert "Sort-Object" not in "\n".join(lines)
+    assert any("Threshold = 2; Distinct = $true" in line for line in lines)
 
-def test_powershell_format2_output(powershell_backend: PowerShellBackend):
-    """Test for output format format2."""
-    # TODO: implement a test for the output format
-    pass
+    backend = PowerShellBackend(powershell_pipeline(), collect_errors=True)
+    backend.convert(SigmaCollection.from_yaml(rules), "evtx")
+    assert len(backend.errors) == 1
+    assert "aren't supported by the evtx output format" in str(backend.errors[0][1])
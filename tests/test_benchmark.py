@@ -0,0 +1,33 @@
+import pytest
+from pathlib import Path
+from scripts.benchmark import benchmark, write_synthetic_ruleset
+
+
+@pytest.mark.parametrize("output_format", ["default", "xpath", "script", "evtx"])
+def test_benchmark_synthetic(tmp_path: Path, output_format: str):
+    write_synthetic_ruleset(tmp_path, 20, 0)
+    result = benchmark("synthetic-20", [tmp_path], output_format)
+    assert result["rules"] == 20
+    assert result["errors"] == 0
+    assert list(result["stages"]) == [
+        "load",
+        "pipeline",
+        "conversion",
+        "finalization",
+        "postprocessing",
+        "output",
+        "total",
+    ]
+    assert result["stages"]["finalization"] > 0
+    assert "2:powershell_detection_visitor" in result["pipeline_items"]
+    assert sum(result["pipeline_items"].values()) == result["stages"]["pipeline"]
+
+
+def test_benchmark_synthetic_deterministic(tmp_path: Path):
+    for ruleset in ["a", "b"]:
+        (tmp_path / ruleset).mkdir()
+        write_synthetic_ruleset(tmp_path / ruleset, 5, 1)
+    for index in range(5):
+        assert (tmp_path / "a" / f"rule_{index}.yml").read_text() == (
+            tmp_path / "b" / f"rule_{index}.yml"
+        ).read_text()
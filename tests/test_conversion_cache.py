@@ -0,0 +1,105 @@
+import pytest
+from sigma.pipelines.powershell import powershell_pipeline
+from sigma.backends.powershell import ConversionCache, PowerShellBackend
+
+RULE = """
+title: Test
+status: test
+logsource:
+    product: windows
+    service: security
+detection:
+    sel:
+        EventID: 4688
+        field: {}
+    condition: sel
+"""
+
+
+@pytest.fixture
+def powershell_backend():
+    pipeline = powershell_pipeline()
+    return PowerShellBackend(pipeline, collect_errors=True)
+
+
+def test_conversion_cache_hit(tmp_path, powershell_backend: PowerShellBackend):
+    (tmp_path / "rule.yml").write_text(RULE.format("value"))
+    with ConversionCache(tmp_path / "cache.db", powershell_backend) as cache:
+        queries = cache.convert([tmp_path / "rule.yml"])
+        assert cache.get((tmp_path / "rule.yml").read_bytes()) == (queries, [])
+        assert cache.convert([tmp_path / "rule.yml"]) == queries
+
+
+def test_conversion_cache_changed_rule(tmp_path, powershell_backend: PowerShellBackend):
+    (tmp_path / "rule.yml").write_text(RULE.format("value"))
+    with ConversionCache(tmp_path / "cache.db", powershell_backend) as cache:
+        cache.convert([tmp_path / "rule.yml"])
+        (tmp_path / "rule.yml").write_text(RULE.format("changed"))
+        assert cache.convert([tmp_path / "rule.yml"]) == [
+            'Get-WinEvent -FilterHashTable @{LogName = "Security"; Id = 4688} | Read-WinEvent | Where-Object {$_.field -eq "changed"}'
+        ]
+
+
+def test_conversion_cache_fingerprint(powershell_backend: PowerShellBackend):
+    fingerprint = ConversionCache.backend_fingerprint(powershell_backend, "default")
+    assert fingerprint == ConversionCache.backend_fingerprint(
+        PowerShellBackend(powershell_pipeline()), "default"
+    )
+    assert fingerprint != ConversionCache.backend_fingerprint(
+        powershell_backend, "xpath"
+    )
+    assert fingerprint != ConversionCache.backend_fingerprint(
+        PowerShellBackend(powershell_pipeline(), xpath_case_sensitive=True), "default"
+    )
+
+
+def test_conversion_cache_errors(tmp_path, powershell_backend: PowerShellBackend):
+    (tmp_path / "rule.yml").write_text(RULE.format("value").replace("windows", "linux"))
+    with ConversionCache(tmp_path / "cache.db", powershell_backend) as cache:
+        cache.convert([tmp_path / "rule.yml"])
+        cache.convert([tmp_path / "rule.yml"])
+    assert len(powershell_backend.errors) == 2
+
+
+def test_conversion_cache_eviction(tmp_path, powershell_backend: PowerShellBackend):
+    for index in range(5):
+        (tmp_path / f"rule{index}.yml").write_text(RULE.format(f"value{index}"))
+    with ConversionCache(
+        tmp_path / "cache.db", powershell_backend, max_entries=2
+    ) as cache:
+        cache.convert([tmp_path])
+        assert (
+            cache.connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0] == 2
+        )
+
+
+CORRELATION = """
+title: Many events
+status: test
+correlation:
+    type: event_count
+    rules:
+        - test
+    group-by:
+        - field
+    timespan: 5m
+    condition:
+        gte: 10
+"""
+
+
+def test_conversion_cache_correlation_across_files(
+    tmp_path, powershell_backend: PowerShellBackend
+):
+    (tmp_path / "a.yml").write_text(CORRELATION)
+    (tmp_path / "b.yml").write_text("name: test\n" + RULE.format("value"))
+    with ConversionCache(tmp_path / "cache.db", powershell_backend) as cache:
+        queries = cache.convert([tmp_path / "a.yml", tmp_path / "b.yml"])
+        assert powershell_backend.errors == []
+        assert '$_.field -eq "value"' in queries[0]
+        assert cache.convert([tmp_path / "a.yml", tmp_path / "b.yml"]) == queries
+        # The entry of the correlation rule also depends on the rule it references
+        (tmp_path / "b.yml").write_text("name: test\n" + RULE.format("changed"))
+        assert cache.convert([tmp_path / "a.yml", tmp_path / "b.yml"])[0] == queries[
+            0
+        ].replace('"value"', '"changed"')
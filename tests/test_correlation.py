@@ -0,0 +1,85 @@
+from sigma.backends.powershell import CorrelationWindow
+from sigma.collection import SigmaCollection
+
+
+def test_correlation_window_event_count():
+    window = CorrelationWindow(60, "gte", 3)
+    events = [
+        (0, "alice", ""),
+        (10, "bob", ""),
+        (20, "alice", ""),
+        (30, "Alice", ""),  # third event of alice within 60 seconds
+        (40, "alice", ""),  # still above the threshold, not alerted again
+        (100, "alice", ""),  # the events at 0, 20 and 30 left the window
+        (110, "alice", ""),
+        (120, "alice", ""),  # crosses the threshold again
+    ]
+    assert list(window.alerts(events)) == [(30, "Alice", 3), (120, "alice", 3)]
+
+
+def test_correlation_window_value_count():
+    window = CorrelationWindow(60, "gt", 2, distinct=True)
+    events = [
+        (0, "10.0.0.1", "alice"),
+        (1, "10.0.0.1", "ALICE"),
+        (2, "10.0.0.1", "bob"),
+        (3, "10.0.0.2", "carol"),
+        (4, "10.0.0.1", "carol"),
+    ]
+    assert list(window.alerts(events)) == [(4, "10.0.0.1", 3)]
+
+
+def test_correlation_window_eviction():
+    window = CorrelationWindow(10, "gte", 100)
+    for time in range(1000):
+        window.add(time, f"key{time}")
+    assert len(window) == 11
+    assert len(window.groups) == 11
+
+
+def test_correlation_window_from_rule():
+    rules = SigmaCollection.from_yaml(
+        """
+title: Logon
+name: logon
+status: test
+logsource:
+    product: windows
+    service: security
+detection:
+    selection:
+        EventID: 4624
+    condition: selection
+---
+title: Spray
+status: test
+correlation:
+    type: value_count
+    rules: logon
+    group-by: IpAddress
+    timespan: 10m
+    condition:
+        gte: 5
+        field: TargetUserName
+---
+title: Logon twice
+status: test
+correlation:
+    type: temporal
+    rules: logon
+    timespan: 1h
+"""
+    )
+    spray = CorrelationWindow.from_correlation_rule(rules.rules[1])
+    assert (spray.timespan, spray.operator, spray.threshold, spray.distinct) == (
+        600,
+        "gte",
+        5,
+        True,
+    )
+    temporal = CorrelationWindow.from_correlation_rule(rules.rules[2])
+    assert (temporal.operator, temporal.threshold, temporal.distinct) == (
+        "gte",
+        1,
+        True,
+    )
@@ -0,0 +1,151 @@
+import pytest
+from json import dumps
+from sigma.backends.powershell import EventTable, PowerShellBackend, RuleEvaluator
+from sigma.backends.powershell.evaluation import read_events
+from sigma.collection import SigmaCollection
+from sigma.pipelines.powershell import powershell_pipeline
+
+
+@pytest.fixture
+def evaluator():
+    events = EventTable(
+        [
+            {
+                "Channel": "Security",
+                "EventID": "4625",
+                "TargetUserName": "Victor",
+                "LogonType": "2",
+            },
+            {
+                "Channel": "Security",
+                "EventID": "4625",
+                "TargetUserName": "Administrator",
+                "LogonType": "10",
+            },
+            {"Channel": "Security", "EventID": "4624", "TargetUserName": "Victor"},
+            {
+                "Channel": "Microsoft-Windows-Sysmon/Operational",
+                "EventID": "1",
+                "Image": "C:\\Windows\\System32\\cmd.exe",
+                "CommandLine": "cmd.exe /c sekurlsa::logonpasswords",
+            },
+        ]
+    )
+    backend = PowerShellBackend(
+        processing_pipeline=powershell_pipeline(), collect_errors=True
+    )
+    return RuleEvaluator(backend, events)
+
+
+def test_evaluation_match_counts(evaluator: RuleEvaluator):
+    (evaluation,) = evaluator.evaluate(
+        SigmaCollection.from_yaml(
+            """
+            title: Failed Logon
+            status: test
+            logsource:
+                product: windows
+                service: security
+            detection:
+                sel:
+                    EventID: 4625
+                filter:
+                    TargetUserName|startswith: admin
+                condition: sel and not filter
+        """
+        )
+    )
+    assert evaluation.channel == "Security"
+    assert evaluation.events == 3
+    assert evaluation.matches == 1
+    assert [
+        (predicate.predicate, predicate.matches, predicate.selectivity)
+        for predicate in evaluation.predicates
+    ] == [
+        ("$_.EventID -eq 4625", 2, 2 / 3),
+        ('$_.TargetUserName.StartsWith("admin")', 1, 1 / 3),
+    ]
+
+
+def test_evaluation_category(evaluator: RuleEvaluator):
+    (evaluation,) = evaluator.evaluate(
+        SigmaCollection.from_yaml(
+            """
+            title: Cmd
+            status: test
+            logsource:
+                product: windows
+                category: process_creation
+            detection:
+                sel:
+                    Image|endswith: '\\cmd.exe'
+                    CommandLine|re: 'SEKURLSA::\\w+'
+                condition: sel
+        """
+        )
+    )
+    assert evaluation.events == 1
+    assert evaluation.matches == 1
+
+
+def test_evaluation_keywords(evaluator: RuleEvaluator):
+    (evaluation,) = evaluator.evaluate(
+        SigmaCollection.load_ruleset(["rules/win_alert_mimikatz_keywords.yml"])
+    )
+    assert evaluation.events == 4
+    assert evaluation.matches == 1
+
+
+def test_evaluation_errors(evaluator: RuleEvaluator):
+    assert (
+        evaluator.evaluate(
+            SigmaCollection.from_yaml(
+                """
+            title: Linux
+            status: test
+            logsource:
+                product: linux
+            detection:
+                sel:
+                    field: value
+                condition: sel
+        """
+            )
+        )
+        == []
+    )
+    assert len(evaluator.errors) == 1
+
+
+def test_read_events(tmp_path):
+    (tmp_path / "events.jsonl").write_text(
+        dumps(
+            {
+                "Event": {
+                    "System": {
+                        "EventID": 4625,
+                        "Channel": "Security",
+                        "TimeCreated": {
+                            "#attributes": {"SystemTime": "2021-09-12T08:23:27Z"}
+                        },
+                    },
+                    "EventData": {"TargetUserName": "Victor", "LogonType": 2},
+                }
+            }
+        )
+        + "\n"
+    )
+    (tmp_path / "events.xml").write_text(
+        """<?xml version="1.0" encoding="utf-8"?>
+<Events><Event xmlns="http://schemas.microsoft.com/win/2004/08/events/event"><System><EventID>4625</EventID><Channel>Security</Channel><TimeCreated SystemTime="2021-09-12T08:23:27Z"/></System><EventData><Data Name="TargetUserName">Victor</Data><Data Name="LogonType">2</Data></EventData></Event></Events>"""
+    )
+    expected = {
+        "EventID": "4625",
+        "Channel": "Security",
+        "TimeCreated": "2021-09-12T08:23:27Z",
+        "TargetUserName": "Victor",
+        "LogonType": "2",
+    }
+    assert list(read_events(tmp_path / "events.jsonl")) == [expected]
+    assert list(read_events(tmp_path / "events.xml")) == [expected]
+    assert EventTable.from_paths([tmp_path]).size == 2
@@ -0,0 +1,50 @@
+from pathlib import Path
+from struct import pack
+from sigma.backends.powershell.manifest import (
+    EVTX_CHUNK_SIGNATURE,
+    EVTX_CHUNK_SIZE,
+    EVTX_FILE_SIGNATURE,
+    EVTX_HEADER_SIZE,
+    build_manifest,
+    evtx_chunks,
+    worker_loads,
+)
+
+
+def write_evtx(path: Path, chunks: int, first_record_id: int = 1):
+    content = EVTX_FILE_SIGNATURE.ljust(EVTX_HEADER_SIZE, b"\x00")
+    for chunk in range(chunks):
+        first = first_record_id + chunk * 100
+        header = EVTX_CHUNK_SIGNATURE + pack("<QQQQ", 0, 99, first, first + 99)
+        content += header.ljust(EVTX_CHUNK_SIZE, b"\x00")
+    path.write_bytes(content)
+
+
+def test_evtx_chunks(tmp_path: Path):
+    write_evtx(tmp_path / "Security.evtx", 3, 1000)
+    assert evtx_chunks(tmp_path / "Security.evtx") == [
+        (1000, 1099),
+        (1100, 1199),
+        (1200, 1299),
+    ]
+    (tmp_path / "other.evtx").write_bytes(b"not an evtx file")
+    assert evtx_chunks(tmp_path / "other.evtx") == []
+
+
+def test_build_manifest(tmp_path: Path):
+    write_evtx(tmp_path / "large.evtx", 8)
+    write_evtx(tmp_path / "small.evtx", 1)
+    tasks = build_manifest([tmp_path], workers=2, min_task_size=2 * EVTX_CHUNK_SIZE)
+    assert [
+        (task.path.name, task.first_record_id, task.last_record_id) for task in tasks
+    ] == [
+        ("large.evtx", 1, 200),
+        ("large.evtx", 201, 400),
+        ("large.evtx", 401, 600),
+        ("large.evtx", 601, 800),
+        ("small.evtx", None, None),
+    ]
+    assert worker_loads(tasks, 2) == [
+        5 * EVTX_CHUNK_SIZE + EVTX_HEADER_SIZE,
+        4 * EVTX_CHUNK_SIZE,
+    ]
@@ -0,0 +1,45 @@
+from sigma.backends.powershell import ConversionProfiler, PowerShellBackend
+from sigma.collection import SigmaCollection
+from sigma.pipelines.powershell import powershell_pipeline
+from sigma.processing.pipeline import ProcessingItem
+
+rules = SigmaCollection.from_yaml(
+    """
+title: Test
+id: 00000000-0000-0000-0000-000000000001
+status: test
+logsource:
+    product: windows
+    service: security
+detection:
+    sel:
+        EventID: 4688
+        field|contains: value
+    condition: sel
+"""
+)
+
+
+def test_profiler():
+    backend = PowerShellBackend(powershell_pipeline())
+    with ConversionProfiler(rules=5) as profiler:
+        backend.convert(rules)
+    assert profiler.items["powershell_detection_visitor"].calls == 1
+    assert profiler.items["postprocessing:EmbedQueryTransformation"].calls == 1
+    assert profiler.methods["convert_condition_field_eq_val_str"].calls == 1
+    assert profiler.methods["convert_condition"].calls >= 1
+    assert [rule_id for _, rule_id, _ in profiler.slowest_rules()] == [
+        "00000000-0000-0000-0000-000000000001"
+    ]
+    assert profiler.to_dict()["slowest_rules"][0]["title"] == "Test"
+    assert "powershell_detection_visitor" in profiler.table()
+
+
+def test_profiler_restores_methods():
+    convert_rule = PowerShellBackend.convert_rule
+    apply = ProcessingItem.apply
+    with ConversionProfiler():
+        assert PowerShellBackend.convert_rule is not convert_rule
+    assert PowerShellBackend.convert_rule is convert_rule
+    assert ProcessingItem.apply is apply
+    assert "convert_rule" not in PowerShellBackend.__dict__
@@ -0,0 +1,145 @@
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPConnection
+from json import loads
+from sigma.backends.powershell import ConversionServer, PowerShellBackend
+from sigma.backends.powershell.server import (
+    BackendPool,
+    RuleDirectoryWatcher,
+    default_backend,
+)
+from sigma.collection import SigmaCollection
+from sigma.pipelines.powershell import powershell_pipeline
+from threading import Thread
+
+RULE = """
+title: Test
+status: test
+logsource:
+    product: windows
+    service: security
+detection:
+    sel:
+        EventID: 4688
+        field: {}
+    condition: sel
+"""
+
+
+@pytest.fixture
+def server(tmp_path):
+    (tmp_path / "rule.yml").write_text(RULE.format("value"))
+    with ConversionServer(port=0, workers=2, rules=tmp_path, interval=60) as server:
+        thread = Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        yield server
+        server.shutdown()
+        thread.join()
+
+
+def request(server: ConversionServer, method: str, path: str, body: str = None):
+    connection = HTTPConnection(*server.address)
+    connection.request(method, path, body)
+    response = connection.getresponse()
+    return response.status, loads(response.read())
+
+
+def test_server_convert(server: ConversionServer):
+    assert request(server, "POST", "/convert", RULE.format("posted")) == (
+        200,
+        {
+            "queries": [
+                'Get-WinEvent -FilterHashTable @{LogName = "Security"; Id = 4688} | Read-WinEvent | Where-Object {$_.field -eq "posted"}'
+            ],
+            "errors": [],
+        },
+    )
+    assert request(server, "POST", "/convert", "title: [")[0] == 400
+    assert request(server, "POST", "/convert?output=unknown", RULE)[0] == 400
+
+
+def test_server_watch(tmp_path, server: ConversionServer):
+    assert request(server, "GET", "/rules")[1]["queries"] == [
+        'Get-WinEvent -FilterHashTable @{LogName = "Security"; Id = 4688} | Read-WinEvent | Where-Object {$_.field -eq "value"}'
+    ]
+    (tmp_path / "rule.yml").write_text(RULE.format("changed"))
+    (tmp_path / "other.yml").write_text(RULE.format("other"))
+    assert server.watcher.refresh() == [tmp_path / "other.yml", tmp_path / "rule.yml"]
+    assert server.watcher.refresh() == []
+    assert sorted(request(server, "GET", "/rules")[1]["queries"]) == [
+        'Get-WinEvent -FilterHashTable @{LogName = "Security"; Id = 4688} | Read-WinEvent | Where-Object {$_.field -eq "changed"}',
+        'Get-WinEvent -FilterHashTable @{LogName = "Security"; Id = 4688} | Read-WinEvent | Where-Object {$_.field -eq "other"}',
+    ]
+
+
+def test_server_concurrent_conversions():
+    # The backends of the pool convert requests in parallel threads, so the conversion of a rule
+    # mustn't depend on state that is shared between backends, like the items of the pipeline.
+    pool = BackendPool(8, lambda: PowerShellBackend(powershell_pipeline()))
+    rules = [RULE.format(f"value{index}") for index in range(400)]
+
+    def convert(rule: str):
+        with pool.backend() as backend:
+            return backend.convert(SigmaCollection.from_yaml(rule))
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(convert, rules))
+    assert results == [
+        [
+            f'Get-WinEvent -FilterHashTable @{{LogName = "Security"; Id = 4688}} | Read-WinEvent | Where-Object {{$_.field -eq "value{index}"}}'
+        ]
+        for index in range(400)
+    ]
+
+
+def test_server_internal_error(tmp_path):
+    # A bad option value fails the conversion with an exception that isn't a SigmaError
+    backends = list()
+
+    def factory():
+        backends.append(
+            PowerShellBackend(powershell_pipeline(), hashset_threshold="many")
+        )
+        return backends[-1]
+
+    with ConversionServer(port=0, workers=1, backend_factory=factory) as server:
+        thread = Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        for _ in range(2):
+            status, body = request(
+                server, "POST", "/convert", RULE.format("['a', 'b']")
+            )
+            assert status == 500
+            assert body["error"].startswith("ValueError: ")
+        server.shutdown()
+        thread.join()
+    # The failed backends were replaced, so the pool of one backend didn't run dry
+    assert len(backends) == 3
+
+
+def test_server_watch_correlation_across_files(tmp_path):
+    (tmp_path / "a.yml").write_text(
+        """
+title: Many events
+status: test
+correlation:
+    type: event_count
+    rules:
+        - test
+    group-by:
+        - field
+    timespan: 5m
+    condition:
+        gte: 10
+"""
+    )
+    (tmp_path / "b.yml").write_text("name: test\n" + RULE.format("value"))
+    watcher = RuleDirectoryWatcher(tmp_path, default_backend())
+    assert watcher.refresh() == [tmp_path / "a.yml", tmp_path / "b.yml"]
+    output = watcher.output()
+    assert output["errors"] == []
+    assert '$_.field -eq "value"' in output["queries"][0]
+    # A change of the referenced rule converts the correlation rule again
+    (tmp_path / "b.yml").write_text("name: test\n" + RULE.format("changed"))
+    assert watcher.refresh() == [tmp_path / "a.yml", tmp_path / "b.yml"]
+    assert '$_.field -eq "changed"' in watcher.output()["queries"][0]
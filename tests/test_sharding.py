@@ -0,0 +1,68 @@
+from json import loads
+from pathlib import Path
+from sigma.backends.powershell import PowerShellBackend
+from sigma.backends.powershell.sharding import build_shards, write_shards
+from sigma.collection import SigmaCollection
+from sigma.pipelines.powershell import powershell_pipeline
+
+
+def script_queries(rules: int, service: str, condition: str):
+    backend = PowerShellBackend(powershell_pipeline())
+    return backend, backend.convert_collection(
+        SigmaCollection.from_yaml(
+            "\n---\n".join(
+                f"""
+title: {service} {index}
+status: test
+logsource:
+    product: windows
+    service: {service}
+detection:
+    sel:
+        EventID: {index}
+        {condition}
+    condition: sel
+"""
+                for index in range(rules)
+            )
+        ),
+        "script",
+    )
+
+
+def test_build_shards_keeps_channels_together():
+    backend, security = script_queries(6, "security", "CommandLine|contains: x")
+    _, system = script_queries(6, "system", "Provider: x")
+    shards = build_shards(security + system, 2)
+    assert sorted(list(shard.channels) for shard in shards) == [
+        ["Security"],
+        ["System"],
+    ]
+    assert security[0].cost == backend.operand_costs["contains"]
+
+
+def test_build_shards_splits_heavy_channels():
+    _, sysmon = script_queries(8, "sysmon", "Image|re: '.*x'")
+    _, system = script_queries(2, "system", "Provider: x")
+    shards = build_shards(
+        sysmon + system, 3, {"Microsoft-Windows-Sysmon/Operational": 10}
+    )
+    # The Sysmon channel costs more than a third of the total and is split over all shards
+    assert all(
+        "Microsoft-Windows-Sysmon/Operational" in shard.channels for shard in shards
+    )
+    assert sum(len(shard.queries) for shard in shards) == 10
+    costs = [shard.cost for shard in shards]
+    assert max(costs) / min(costs) < 1.5
+
+
+def test_write_shards(tmp_path: Path):
+    backend, security = script_queries(2, "security", "User: x")
+    paths = write_shards(backend, build_shards(security, 2), tmp_path)
+    assert [path.name for path in paths] == ["shard-1.ps1", "shard-2.ps1"]
+    assert paths[0].read_text().startswith("# Security\n")
+    manifest = loads((tmp_path / "shard-1.json").read_text())
+    assert manifest["script"] == "shard-1.ps1"
+    assert [rule["title"] for rule in manifest["channels"][0]["rules"]] == [
+        "security 0"
+    ]
@@ -0,0 +1,169 @@
+import pytest
+import subprocess
+import sys
+from pathlib import Path
+from scripts.sigma2powershell import Sigma2PowerShell, Sigma2PowerShellStream
+
+
+@pytest.fixture
+def ruleset(tmp_path):
+    for index in range(8):
+        (tmp_path / f"rule{index}.yml").write_text(
+            f"""
+title: Test {index}
+id: 00000000-0000-0000-0000-00000000000{index}
+status: test
+logsource:
+    product: windows
+    service: {"security" if index % 2 else "system"}
+detection:
+    sel:
+        EventID: {index}
+        field{index}: value{index}
+    condition: sel
+"""
+        )
+    return str(tmp_path)
+
+
+@pytest.mark.parametrize("output", ["default", "script"])
+def test_sigma2powershell_jobs(ruleset: str, output: str):
+    assert Sigma2PowerShell(ruleset, output, True, jobs=2) == Sigma2PowerShell(
+        ruleset, output, True
+    )
+
+
+FAILED_LOGON = """
+title: Failed logon
+name: failed_logon
+status: test
+logsource:
+    product: windows
+    service: security
+detection:
+    selection:
+        EventID: {}
+    condition: selection
+"""
+
+
+@pytest.fixture
+def correlation_ruleset(ruleset: str):
+    # The correlation rule sorts before the rule it references in another file
+    (Path(ruleset) / "a_correlation.yml").write_text(
+        """
+title: Many failed logons
+status: test
+correlation:
+    type: event_count
+    rules:
+        - failed_logon
+    group-by:
+        - TargetUserName
+    timespan: 5m
+    condition:
+        gte: 10
+"""
+    )
+    (Path(ruleset) / "z_failed_logon.yml").write_text(FAILED_LOGON.format(4625))
+    return ruleset
+
+
+@pytest.mark.parametrize("output", ["default", "script"])
+def test_sigma2powershell_correlation_across_files(
+    correlation_ruleset: str, tmp_path, output: str
+):
+    expected = Sigma2PowerShell(correlation_ruleset, output, False)
+    assert "Id = 4625" in "".join(expected)
+    assert Sigma2PowerShell(correlation_ruleset, output, False, jobs=2) == expected
+    cache = str(tmp_path / "cache.db")
+    for _ in range(2):
+        assert (
+            Sigma2PowerShell(correlation_ruleset, output, False, cache=cache)
+            == expected
+        )
+    # The cached correlation rule is converted again when the rule it references changes
+    (Path(correlation_ruleset) / "z_failed_logon.yml").write_text(
+        FAILED_LOGON.format(4771)
+    )
+    converted = Sigma2PowerShell(correlation_ruleset, output, False, cache=cache)
+    assert converted == Sigma2PowerShell(correlation_ruleset, output, False)
+    assert "Id = 4625" not in "".join(converted)
+
+
+def test_sigma2powershell_snapshot(ruleset: str, tmp_path):
+    snapshot = str(tmp_path / "rules.snapshot")
+    expected = Sigma2PowerShell(ruleset, "script", True)
+    assert (
+        Sigma2PowerShell(ruleset, "script", True, write_snapshot=snapshot) == expected
+    )
+    assert Sigma2PowerShell(None, "script", True, snapshot=snapshot) == expected
+    assert Sigma2PowerShell(None, "xpath", True, snapshot=snapshot) == Sigma2PowerShell(
+        ruleset, "xpath", True
+    )
+
+
+def test_sigma2powershell_stream(ruleset: str):
+    records = list(Sigma2PowerShellStream(ruleset, "default", True))
+    assert [record["query"] for record in records] == Sigma2PowerShell(
+        ruleset, "default", True
+    )
+    assert {
+        "id": "00000000-0000-0000-0000-000000000001",
+        "title": "Test 1",
+        "logname": "Security",
+        "eventids": [1],
+        "query": 'Get-WinEvent -FilterHashTable @{LogName = "Security"; Id = 1} | Read-WinEvent | Where-Object {$_.field1 -eq "value1"}',
+        "error": None,
+    } in records
+
+
+def test_sigma2powershell_stream_error(tmp_path):
+    (tmp_path / "rule.yml").write_text(
+        """
+title: Test
+status: test
+logsource:
+    product: linux
+detection:
+    sel:
+        field: value
+    condition: sel
+"""
+    )
+    assert list(Sigma2PowerShellStream(str(tmp_path), "default", True)) == [
+        {
+            "id": None,
+            "title": "Test",
+            "logname": None,
+            "eventids": None,
+            "query": None,
+            "error": "Invalid logsource product.",
+        }
+    ]
+
+
+def test_sigma2powershell_lazy_imports():
+    # Modules of options like --jobs, --cache or --profile mustn't slow down the startup of a
+    # plain conversion.
+    modules = [
+        "concurrent.futures",
+        "multiprocessing",
+        "sqlite3",
+        "importlib.metadata",
+        "sigma.backends.powershell.cache",
+        "sigma.backends.powershell.evaluation",
+        "sigma.backends.powershell.profiling",
+        "sigma.backends.powershell.snapshot",
+    ]
+    imported = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            f"import sys, scripts.sigma2powershell; print([m for m in {modules!r} if m in sys.modules])",
+        ],
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stdout
+    assert imported.strip() == "[]"
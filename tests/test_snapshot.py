@@ -0,0 +1,118 @@
+import pytest
+from sigma.backends.powershell import PowerShellBackend, RuleSnapshot
+from sigma.collection import SigmaCollection
+from sigma.exceptions import SigmaConfigurationError
+from sigma.pipelines.powershell import powershell_pipeline
+
+RULES = """
+title: Network logon
+name: network_logon
+status: test
+level: high
+tags:
+    - attack.lateral_movement
+logsource:
+    product: windows
+    service: security
+detection:
+    selection:
+        EventID: 4624
+        LogonType: 3
+    filter:
+        IpAddress:
+            - '127.0.0.1'
+            - '::1'
+    condition: selection and not filter
+---
+title: Whoami
+name: whoami
+status: test
+logsource:
+    product: windows
+    category: process_creation
+detection:
+    selection:
+        Image|endswith: '\\\\whoami.exe'
+        CommandLine|contains|all:
+            - '/user'
+            - '/priv'
+    keywords:
+        - 'whoami'
+    condition: selection or keywords
+---
+title: Invalid log source
+status: test
+logsource:
+    product: linux
+detection:
+    selection:
+        field: value
+    condition: selection
+---
+title: Network logon followed by recon
+status: test
+correlation:
+    type: temporal
+    rules:
+        - network_logon
+        - whoami
+    aliases:
+        user:
+            network_logon: TargetUserName
+            whoami: User
+    group-by: user
+    timespan: 1h
+"""
+
+
+@pytest.fixture
+def powershell_backend():
+    return PowerShellBackend(powershell_pipeline(), collect_errors=True)
+
+
+@pytest.mark.parametrize("output_format", ["default", "xpath", "script"])
+def test_snapshot_conversion(tmp_path, powershell_backend, output_format: str):
+    expected = powershell_backend.convert(
+        SigmaCollection.from_yaml(RULES), output_format
+    )
+    expected_errors = [str(error) for _, error in powershell_backend.errors]
+
+    backend = PowerShellBackend(powershell_pipeline(), collect_errors=True)
+    RuleSnapshot.from_collection(backend, SigmaCollection.from_yaml(RULES)).save(
+        tmp_path / "rules.snapshot"
+    )
+    snapshot = RuleSnapshot.load(tmp_path / "rules.snapshot", backend)
+    # A snapshot can be converted repeatedly and into multiple output formats
+    backend.convert_snapshot(snapshot, "default")
+    backend.errors.clear()
+    assert backend.convert_snapshot(snapshot, output_format) == expected
+    assert [str(error) for _, error in backend.errors] == expected_errors
+
+
+def test_snapshot_rule(powershell_backend):
+    snapshot = RuleSnapshot.from_collection(
+        powershell_backend, SigmaCollection.from_yaml(RULES)
+    )
+    assert len(snapshot) == 3
+    assert len(snapshot.errors) == 1
+    rule = snapshot.collection().rules[1]
+    assert rule.title == "Whoami"
+    assert rule.logsource.service == "Microsoft-Windows-Sysmon/Operational"
+    assert [value.number for value in rule.eventid] == [1]
+    assert rule.detection.parsed_condition[0].condition == (
+        "_logsource_eventid and (selection or keywords)"
+    )
+
+
+def test_snapshot_pipeline_changed(tmp_path, powershell_backend):
+    RuleSnapshot.from_collection(
+        powershell_backend, SigmaCollection.from_yaml(RULES)
+    ).save(tmp_path / "rules.snapshot")
+    with pytest.raises(SigmaConfigurationError, match="another processing pipeline"):
+        RuleSnapshot.load(
+            tmp_path / "rules.snapshot",
+            PowerShellBackend(powershell_pipeline(), time_window=3600),
+        )
+    (tmp_path / "rule.yml").write_text(RULES)
+    with pytest.raises(SigmaConfigurationError, match="isn't a rule snapshot"):
+        RuleSnapshot.load(tmp_path / "rule.yml")